@@ -6,6 +6,8 @@ from collections import defaultdict  # Useful for nested dictionaries
 import matplotlib.pyplot as plt
 from mpl_toolkits.axes_grid1.inset_locator import mark_inset
 
+from lambdatune.config_selection.report_sink import read_reports
+
 # --- Configuration ---
 base_dir = "test"
 file_paths_to_process = [
@@ -42,15 +44,11 @@ for file_path in file_paths_to_process:
         )
         continue
     try:
-        with open(file_path, "r") as f:
-            content = f.read()
-            if not content:
-                continue
-            reports_data = json.loads(content)
-            if not isinstance(reports_data, list):
-                continue
-            if not reports_data:
-                continue
+        reports_data = read_reports(str(file_path), resolve_blobs=False)
+        if not isinstance(reports_data, list):
+            continue
+        if not reports_data:
+            continue
     except FileNotFoundError:
         print(f"Error: File not found: {file_path}")
         continue
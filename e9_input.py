@@ -6,6 +6,8 @@ import matplotlib.pyplot as plt
 import numpy as np
 import pprint
 
+from lambdatune.config_selection.report_sink import read_reports, reports_exist
+
 # Increase plot font sizes globally by 1.5x
 plt.rcParams.update(
     {
@@ -32,13 +34,12 @@ for benchmark in benchmarks:
         f"test/{experiment}/{system}/{benchmark}/lambdatune/reports.json",
     ]
     for fp in file_paths:
-        if os.path.exists(fp):
-            with open(fp, "r") as f:
-                reports = json.load(f)
-                for report in reports:
-                    report["file"] = fp  # Tag the source file
-                    report["benchmark"] = benchmark  # Tag the benchmark
-                data.extend(reports)
+        if reports_exist(fp):
+            reports = read_reports(fp, resolve_blobs=False)
+            for report in reports:
+                report["file"] = fp  # Tag the source file
+                report["benchmark"] = benchmark  # Tag the benchmark
+            data.extend(reports)
         else:
             print(f"Warning: File {fp} not found.")
 
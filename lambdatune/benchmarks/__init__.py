@@ -1,3 +1,4 @@
 from .job import get_job_queries
 from .tpch import get_tpch_queries
-from .tpcds import get_tpcds_queries
\ No newline at end of file
+from .tpcds import get_tpcds_queries
+from .workload_capture import Workload, capture_workload, load_workload
@@ -0,0 +1,381 @@
+import csv
+import hashlib
+import json
+import logging
+import re
+import sys
+
+from collections import OrderedDict
+
+# The columns of the Postgres csvlog format (log_destination = 'csvlog'). Postgres 13+ appends backend_type,
+# leader_pid and query_id.
+CSVLOG_COLUMNS = ["log_time", "user_name", "database_name", "process_id", "connection_from", "session_id",
+                  "session_line_num", "command_tag", "session_start_time", "virtual_transaction_id", "transaction_id",
+                  "error_severity", "sql_state_code", "message", "detail", "hint", "internal_query",
+                  "internal_query_pos", "context", "query", "query_pos", "location", "application_name",
+                  "backend_type", "leader_pid", "query_id"]
+
+# The messages of log_min_duration_statement and log_statement, e.g., "duration: 1.2 ms  statement: SELECT ..." or
+# "duration: 1.2 ms  execute <unnamed>: SELECT ..."
+LOG_STATEMENT_PATTERN = re.compile(r"^(?:duration:\s*([\d.]+)\s*ms\s+)?(?:statement|execute\s+[^:]*):\s*(.*)$",
+                                   re.DOTALL)
+LOG_PARAMETER_PATTERN = re.compile(r"\$(\d+)\s*=\s*('(?:[^']|'')*'|NULL)")
+
+# The tokens of a query, for the fingerprint: comments, string literals, quoted identifiers, numbers, parameters
+# ($1) and everything else
+FINGERPRINT_TOKEN_PATTERN = re.compile(r"""
+    (?P<comment>--[^\n]*|/\*.*?\*/)
+  | (?P<string>[EeBbXxNn]?'(?:[^']|'')*')
+  | (?P<identifier>"(?:[^"]|"")*")
+  | (?P<number>(?<![\w$])\d+(?:\.\d*)?(?:[eE][-+]?\d+)?)
+  | (?P<parameter>\$\d+|\?)
+  | (?P<space>\s+)
+  | (?P<other>.)
+""", re.VERBOSE | re.DOTALL)
+
+# Lists of placeholders, e.g., IN (?, ?, ?), which are folded into one
+PLACEHOLDER_LIST_PATTERN = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+# The statements that can be replayed without modifying the database
+READ_ONLY_STATEMENT_PATTERN = re.compile(r"^\s*(?:\(\s*)*(?:SELECT|WITH|VALUES|TABLE)\b", re.IGNORECASE)
+
+WEIGHTS = ["calls", "total_time"]
+
+
+def get_query_fingerprint(sql: str):
+    """
+    Normalizes a query: comments are removed, literals and parameters are replaced by ?, lists of placeholders are
+    folded, whitespace is collapsed and the query is lowercased (except for quoted identifiers). Queries that differ
+    only in their literals have the same fingerprint.
+    """
+    parts = list()
+
+    for match in FINGERPRINT_TOKEN_PATTERN.finditer(sql):
+        kind = match.lastgroup
+
+        if kind == "comment":
+            continue
+        elif kind in ("string", "number", "parameter"):
+            parts.append("?")
+        elif kind == "space":
+            parts.append(" ")
+        elif kind == "identifier":
+            parts.append(match.group())
+        else:
+            parts.append(match.group().lower())
+
+    fingerprint = re.sub(r"\s+", " ", "".join(parts)).strip().rstrip(";").strip()
+
+    return PLACEHOLDER_LIST_PATTERN.sub("(?)", fingerprint)
+
+
+def is_parameterized(sql: str):
+    """
+    Returns True if a query has parameters ($1), e.g., the normalized queries of pg_stat_statements, which cannot be
+    executed as they are
+    """
+    for match in FINGERPRINT_TOKEN_PATTERN.finditer(sql):
+        if match.lastgroup == "parameter" and match.group().startswith("$"):
+            return True
+
+    return False
+
+
+def bind_log_parameters(sql: str, detail: str):
+    """
+    Substitutes the parameters of a logged statement with their values, from the detail of the log entry (e.g.,
+    "parameters: $1 = '42', $2 = NULL")
+    """
+    if not detail or not detail.startswith("parameters:"):
+        return sql
+
+    values = dict((int(number), value) for number, value in LOG_PARAMETER_PATTERN.findall(detail))
+
+    return re.sub(r"\$(\d+)", lambda match: values.get(int(match.group(1)), match.group()), sql)
+
+
+class WorkloadQuery:
+    """
+    A query of a captured workload: a representative statement of a fingerprint, and its statistics
+    """
+    def __init__(self, query_id: str, sql: str, calls: float = 0, total_time: float = 0):
+        """
+        @param query_id: The id of the query
+        @param sql: The statement that is executed for the query
+        @param calls: The number of executions of the query
+        @param total_time: The total execution time of the query (ms)
+        """
+        self.query_id = query_id
+        self.sql = sql
+        self.calls = calls
+        self.total_time = total_time
+
+    def get_mean_time(self):
+        return self.total_time / self.calls if self.calls else 0
+
+    def get_weight(self, weight: str = "calls"):
+        """
+        Returns the weight of the query: its number of calls, or its total execution time
+        """
+        if weight == "calls":
+            return self.calls
+        elif weight == "total_time":
+            return self.total_time
+        else:
+            raise Exception(f"Unknown weight: {weight}. Pick one from {WEIGHTS}")
+
+
+class Workload:
+    """
+    A workload captured from the statistics (pg_stat_statements) or the logs of a server. The queries are deduplicated
+    by fingerprint (see get_query_fingerprint), with their number of calls and total execution time summed, and are
+    exposed as (query_id, sql) pairs, as the bundled benchmarks, with their weights.
+    """
+    def __init__(self, read_only: bool = True):
+        """
+        @param read_only: Only capture the statements that do not modify the database (SELECT, WITH, ...), which can
+        be replayed while tuning
+        """
+        self.read_only = read_only
+        self.queries = OrderedDict()
+        self.skipped = 0
+
+    def add(self, sql: str, calls: float = 1, total_time: float = None):
+        """
+        Adds the executions of a statement to the workload
+        @param sql: The statement
+        @param calls: The number of executions
+        @param total_time: The total execution time of the executions (ms), if known
+        @return: The query of the statement, or None if the statement was skipped
+        """
+        if not sql or not sql.strip() or (self.read_only and not READ_ONLY_STATEMENT_PATTERN.match(sql)):
+            self.skipped += 1
+            return None
+
+        fingerprint = get_query_fingerprint(sql)
+        query = self.queries.get(fingerprint)
+
+        if query is None:
+            query_id = "q" + hashlib.sha1(fingerprint.encode("utf-8")).hexdigest()[:12]
+            query = self.queries[fingerprint] = WorkloadQuery(query_id, sql.strip())
+        elif is_parameterized(query.sql) and not is_parameterized(sql):
+            # An executable statement replaces a normalized one
+            query.sql = sql.strip()
+
+        query.calls += calls
+        query.total_time += total_time or 0
+
+        return query
+
+    def replace_statement(self, sql: str):
+        """
+        Replaces the normalized (parameterized) statement of a query of the workload with an executable statement of
+        the same fingerprint. Statements of queries that are not in the workload are ignored.
+        @return: The query of the statement, or None if the workload has no query with its fingerprint
+        """
+        if not sql or not sql.strip():
+            return None
+
+        query = self.queries.get(get_query_fingerprint(sql))
+
+        if query is not None and is_parameterized(query.sql) and not is_parameterized(sql):
+            query.sql = sql.strip()
+
+        return query
+
+    def get_queries(self, weight: str = "calls"):
+        """
+        Returns the (query_id, sql) pairs of the workload, from the heaviest to the lightest query. Queries that are
+        still parameterized (e.g., from pg_stat_statements, without a logged statement) are left out.
+        """
+        return [(query.query_id, query.sql) for query in self.get_workload_queries(weight)]
+
+    def get_weights(self, weight: str = "calls"):
+        """
+        Returns the weight of every query (query_id -> weight), e.g., the frequencies of compute_optimal_order
+        """
+        return dict((query.query_id, query.get_weight(weight)) for query in self.get_workload_queries(weight))
+
+    def get_workload_queries(self, weight: str = "calls"):
+        """
+        Returns the executable queries, sorted by decreasing weight
+        """
+        queries = list()
+
+        for query in self.queries.values():
+            if is_parameterized(query.sql):
+                logging.warning(f"Skipping parameterized query {query.query_id}: {query.sql[:80]}")
+                continue
+
+            queries.append(query)
+
+        return sorted(queries, key=lambda query: (-query.get_weight(weight), query.query_id))
+
+    def sample(self, max_queries: int = None, coverage: float = None, weight: str = "calls"):
+        """
+        Returns a representative subset of the workload: the heaviest queries, up to max_queries queries, or until
+        they cover a fraction (coverage) of the total weight of the workload
+        @param max_queries: The maximum number of queries
+        @param coverage: The fraction (0-1] of the total weight covered by the sample
+        @param weight: The weight of the queries (calls or total_time)
+        @return: The sample, as a new workload
+        """
+        queries = self.get_workload_queries(weight)
+        total_weight = sum(query.get_weight(weight) for query in queries)
+
+        sample = Workload(read_only=self.read_only)
+        covered = 0
+
+        for query in queries:
+            if max_queries is not None and len(sample.queries) >= max_queries:
+                break
+
+            if coverage is not None and total_weight > 0 and covered >= coverage * total_weight:
+                break
+
+            sample.queries[get_query_fingerprint(query.sql)] = query
+            covered += query.get_weight(weight)
+
+        logging.info(f"Sampled {len(sample.queries)} of {len(queries)} queries "
+                     f"({covered / total_weight * 100 if total_weight else 100:.1f}% of the {weight})")
+
+        return sample
+
+    def save(self, path: str):
+        """
+        Saves the workload as a JSON file, to be replayed (see load_workload)
+        """
+        queries = [dict(query_id=query.query_id, sql=query.sql, calls=query.calls, total_time=query.total_time)
+                   for query in self.queries.values()]
+
+        with open(path, "w+") as f:
+            json.dump(queries, f, indent=2)
+
+    def __len__(self):
+        return len(self.queries)
+
+
+def load_workload(path: str):
+    """
+    Loads a workload saved with Workload.save
+    """
+    workload = Workload(read_only=False)
+
+    with open(path) as f:
+        for entry in json.load(f):
+            query = workload.add(entry["sql"], calls=entry.get("calls", 1), total_time=entry.get("total_time"))
+            query.query_id = entry.get("query_id", query.query_id)
+
+    return workload
+
+
+def capture_pg_stat_statements(driver, min_calls: int = 1, read_only: bool = True):
+    """
+    Captures the workload of a Postgres server from pg_stat_statements (the extension must be installed in the
+    database of the driver). The statistics of the normalized queries are kept, but their statements are
+    parameterized: combine them with a log (see add_postgres_csv_log, without statistics) to get executable
+    statements.
+    """
+    cursor = driver.get_cursor()
+
+    try:
+        cursor.execute("SELECT query, calls, total_exec_time FROM pg_stat_statements "
+                       "WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database()) AND calls >= %s",
+                       (min_calls,))
+    except Exception:
+        # Postgres < 13
+        cursor.execute("SELECT query, calls, total_time FROM pg_stat_statements "
+                       "WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database()) AND calls >= %s",
+                       (min_calls,))
+
+    workload = Workload(read_only=read_only)
+
+    for sql, calls, total_time in cursor.fetchall():
+        workload.add(sql, calls=calls, total_time=total_time)
+
+    return workload
+
+
+def add_pg_stat_statements_csv(workload: Workload, path: str, min_calls: int = 1):
+    """
+    Adds a pg_stat_statements snapshot exported as CSV with a header, e.g., with
+    \\copy (SELECT * FROM pg_stat_statements) TO 'snapshot.csv' CSV HEADER
+    """
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            calls = float(row.get("calls") or 0)
+
+            if calls < min_calls:
+                continue
+
+            total_time = row.get("total_exec_time") or row.get("total_time")
+            workload.add(row["query"], calls=calls, total_time=float(total_time) if total_time else None)
+
+    return workload
+
+
+def add_postgres_csv_log(workload: Workload, path: str, database: str = None, statistics: bool = True):
+    """
+    Adds the statements of a Postgres csvlog file, logged with log_min_duration_statement (with their durations) or
+    log_statement (without durations). The parameters of extended-protocol statements are bound from the details of
+    the log entries.
+    @param database: Only add the statements of this database
+    @param statistics: Count the executions of the statements. Without statistics, the log only provides executable
+    statements for the queries already in the workload, e.g., of a pg_stat_statements snapshot, whose executions are
+    already counted: the other statements of the log are ignored.
+    """
+    csv.field_size_limit(sys.maxsize)
+
+    with open(path, newline="") as f:
+        for row in csv.reader(f):
+            entry = dict(zip(CSVLOG_COLUMNS, row))
+
+            if entry.get("error_severity") != "LOG" or (database and entry.get("database_name") != database):
+                continue
+
+            match = LOG_STATEMENT_PATTERN.match(entry.get("message", ""))
+
+            if not match:
+                continue
+
+            duration, sql = match.groups()
+            sql = bind_log_parameters(sql, entry.get("detail"))
+
+            if statistics:
+                workload.add(sql, calls=1, total_time=float(duration) if duration else None)
+            else:
+                workload.replace_statement(sql)
+
+    return workload
+
+
+WORKLOAD_SOURCES = ["pg_stat_statements", "csvlog", "file"]
+
+
+def capture_workload(source: str, driver=None, path: str = None, log_path: str = None, database: str = None):
+    """
+    Captures a workload
+    @param source: pg_stat_statements (a CSV snapshot, or the view of the driver's database if there is no path),
+    csvlog (a Postgres csvlog file) or file (a workload saved with Workload.save)
+    @param path: The file of the workload
+    @param log_path: A csvlog file with the executable statements of the pg_stat_statements queries
+    @param database: Only capture the statements of this database (csvlog)
+    """
+    if source == "pg_stat_statements":
+        if path:
+            workload = add_pg_stat_statements_csv(Workload(), path)
+        else:
+            workload = capture_pg_stat_statements(driver)
+
+        if log_path:
+            add_postgres_csv_log(workload, log_path, database=database, statistics=False)
+    elif source == "csvlog":
+        workload = add_postgres_csv_log(Workload(), path, database=database)
+    elif source == "file":
+        workload = load_workload(path)
+    else:
+        raise Exception(f"Unknown workload source: {source}. Pick one from {WORKLOAD_SOURCES}")
+
+    logging.info(f"Captured {len(workload)} queries from {source} ({workload.skipped} statements skipped)")
+
+    return workload
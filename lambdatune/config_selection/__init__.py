@@ -1,4 +1,4 @@
 from .configuration import Configuration
-from .query_cluster import QueryCluster, generate_query_clusters
+from .query_cluster import QueryCluster, QueryClusterer, generate_query_clusters
 from .query_to_index import queries_to_index
 from .index import Index
\ No newline at end of file
@@ -7,12 +7,17 @@ import logging
 
 from collections import defaultdict
 
-from lambdatune.drivers import PostgresDriver, MySQLDriver
+from lambdatune.drivers import PostgresDriver, MySQLDriver, DuckDBDriver
 from lambdatune.config_selection import Configuration, queries_to_index
-from lambdatune.config_selection import generate_query_clusters
-from lambdatune.config_selection.query_to_index import QueryToIndex
+from lambdatune.config_selection import QueryClusterer
+from lambdatune.config_selection.report_sink import ReportSink, read_reports, get_reports_dir
+from lambdatune.config_selection.query_to_index import QueryToIndex, QueryColumnMap
 from lambdatune.config_selection.query_cluster import QueryCluster
-from lambdatune.config_selection.query_order_dp import compute_optimal_order
+from lambdatune.config_selection.query_order_dp import compute_optimal_order, compute_min_churn_order
+from lambdatune.config_selection.index import Index
+from lambdatune.config_selection.index_builder import IndexBuilder
+from lambdatune.config_selection.index_state import IndexStateManager, get_configuration_index_keys
+from lambdatune.config_selection.execution_bound import ExecutionTimeBound
 
 from lambdatune.llm_response import LLMResponse
 
@@ -24,11 +29,29 @@ class ConfigurationSelector:
     def __init__(self, driver: PostgresDriver, queries: list[str], configs: list[str], reset_command: str, adaptive_timeout: bool,
                  enable_query_scheduler: bool, create_all_indexes_first: bool, create_indexes: bool, drop_indexes: bool,
                  initial_time_out_seconds: int, timeout_interval: int, max_rounds: int,
-                 benchmark_name: str, system: str,continue_loop:bool,exploit_index:bool,order_query:bool, output_dir: str = None,costs:dict=None):
+                 benchmark_name: str, system: str,continue_loop:bool,exploit_index:bool,order_query:bool, output_dir: str = None,costs:dict=None,
+                 incremental_indexes: bool = False, background_index_builds: bool = False,
+                 max_concurrent_index_builds: int = None, max_query_clusters: int = 13,
+                 clustering_algorithm: str = "kmeans", query_watchdog: bool = False, query_weights: dict = None,
+                 index_build_memory_budget_kb: int = None):
         """
         @param driver: The database driver used to execute the queries
         @param configs: The configurations to be tested
         @param reset_command: The command used to reset the configuration
+        @param incremental_indexes: Keep the indexes shared by consecutive configurations instead of dropping all
+        the indexes before every configuration
+        @param background_index_builds: Build the indexes of the upcoming queries on separate connections, while the
+        queries that do not depend on them run
+        @param max_concurrent_index_builds: Upper bound on the number of concurrent background index builds
+        @param index_build_memory_budget_kb: Upper bound on the total maintenance_work_mem of the concurrent
+        background index builds
+        @param max_query_clusters: The maximum number of query clusters ordered by the query scheduler
+        @param clustering_algorithm: The algorithm that clusters the queries (kmeans, jaccard or minhash)
+        @param query_watchdog: Enforce the time budget of a configuration with a watchdog that cancels the running
+        query on the server, instead of setting a statement timeout before every query
+        @param query_weights: The weight of every query (query id -> weight, 1 if missing), e.g., the frequencies of a
+        captured workload. A configuration is scored by the weighted total execution time of the queries, and the
+        weights are normalized to a mean of 1, so that the timeouts stay in seconds of an unweighted run.
         """
         logging.info("Initializing Configuration Selector with the following parameters")
         logging.info(f"Reset Command: {reset_command}")
@@ -42,6 +65,12 @@ class ConfigurationSelector:
         logging.info(f"Max Rounds: {max_rounds}")
         logging.info(f"Benchmark Name: {benchmark_name}")
         logging.info(f"System: {system}")
+        logging.info(f"Incremental Indexes: {incremental_indexes}")
+        logging.info(f"Background Index Builds: {background_index_builds}")
+        logging.info(f"Index Build Memory Budget (KB): {index_build_memory_budget_kb}")
+        logging.info(f"Max Query Clusters: {max_query_clusters}")
+        logging.info(f"Clustering Algorithm: {clustering_algorithm}")
+        logging.info(f"Query Watchdog: {query_watchdog}")
 
         if enable_query_scheduler and create_all_indexes_first:
             raise Exception("enable_query_scheduler and create_all_indexes_first "
@@ -62,12 +91,24 @@ class ConfigurationSelector:
         self.adaptive_timeout = adaptive_timeout
         self.create_all_indexes_first = create_all_indexes_first
         self.drop_indexes = drop_indexes
+        self.incremental_indexes = incremental_indexes
+        self.background_index_builds = background_index_builds
+        self.max_concurrent_index_builds = max_concurrent_index_builds
+        self.index_build_memory_budget_kb = index_build_memory_budget_kb
+        self.max_query_clusters = max_query_clusters
+        self.query_clusterer = QueryClusterer(max_clusters=max_query_clusters, algorithm=clustering_algorithm)
+        self.query_watchdog = query_watchdog
+        self.query_weights = self.normalize_query_weights(query_weights)
+        self.index_states = dict()
         self.create_indexes = create_indexes
         self.initial_time_out_seconds = initial_time_out_seconds
         self.max_rounds = max_rounds
         self.timeout_interval = timeout_interval
         self.results_dir = output_dir
         self.table_cardinalities = self.driver.get_table_cardinalities()
+
+        # Parsed once, used to map the indexes of every configuration to the queries
+        self.query_column_map = QueryColumnMap(self.queries.items(), schema=self.driver.get_db_schema())
         # --- Proposed methodology ---
         self.continue_loop=continue_loop
         self.exploit_index=exploit_index
@@ -75,7 +116,7 @@ class ConfigurationSelector:
         if costs:
             self.costs=costs
         else:
-            self.costs=defaultdict(lambda:float('inf'),{x:self.get_total_cost(x) for x in self.queries})
+            self.costs=defaultdict(lambda:float('inf'),self.get_total_costs())
         # --- Proposed methodology ---
 #         with open('e3_continue_loop.txt','a')as f:
 #             f.write(f'''{system} {benchmark_name}
@@ -83,25 +124,132 @@ class ConfigurationSelector:
 
         logging.info(f"Results dir: {self.results_dir}")
 
-    def reset_configuration(self, drop_indexes: bool, restart_system: bool = True):
+    def reset_configuration(self, drop_indexes: bool, restart_system: bool = True, driver=None):
         logging.info("Resetting configuration")
 
+        if driver is None:
+            driver = self.driver
+
         if drop_indexes:
             config_reset_time_start = time.time()
-            self.driver.drop_all_non_pk_indexes()
+            driver.drop_all_non_pk_indexes()
+
+            if id(driver) in self.index_states:
+                self.index_states[id(driver)].load()
             config_reset_time = time.time() - config_reset_time_start
 #             with open('e2_index_time.txt','a')as f:             
 #                 f.write(f'''drop index: {config_reset_time}
 # ''') 
 
         # Reset the system configuration
-        self.driver.reset_configuration(restart_system=restart_system)
+        driver.reset_configuration(restart_system=restart_system)
+
+    def get_index_state(self, driver) -> IndexStateManager:
+        """
+        Returns the index state manager of a driver
+        """
+        if id(driver) not in self.index_states:
+            self.index_states[id(driver)] = IndexStateManager(driver)
+
+        return self.index_states[id(driver)]
+
+    def create_index(self, driver, index: Index, index_builder: IndexBuilder = None):
+        """
+        Creates an index. With incremental_indexes, an index that is already present on the same (table, column)
+        is reused instead. If the index is being built in the background, it waits for the build to finish, and
+        builds it again on the driver's connection if the background build failed.
+        """
+        built = index_builder.wait(index) if index_builder else None
+
+        if built:
+            if self.incremental_indexes:
+                self.get_index_state(driver).mark_created(index)
+
+            return
+
+        if built is False:
+            logging.warning(f"Background build of index {index} failed. Building it on the driver's connection.")
+
+        if self.incremental_indexes:
+            self.get_index_state(driver).ensure(index)
+        else:
+            driver.get_cursor().execute(index.get_create_index_statement())
+            driver.invalidate_state_fingerprint()
+
+    def order_configs_by_index_churn(self, configs: list):
+        """
+        Orders the configurations so that the total cost of the indexes created between consecutive configurations
+        is minimized. The cost of an index is the cardinality of its table.
+        """
+        config_indexes = dict()
+        index_costs = dict()
+
+        for config_name, config in configs:
+            config_indexes[config_name] = frozenset(get_configuration_index_keys(config))
+
+            for key in config_indexes[config_name]:
+                index_costs[key] = self.table_cardinalities.get(key[0], 1)
+
+        initial_indexes = frozenset(self.get_index_state(self.driver).present.keys())
+
+        cost, order = compute_min_churn_order([c[0] for c in configs], config_indexes, index_costs,
+                                              initial_indexes=initial_indexes)
+
+        logging.info(f"Configuration order with minimum index churn (cost: {cost}): {order}")
+
+        configs_map = dict(configs)
+
+        return [(config_name, configs_map[config_name]) for config_name in order]
 
     def get_query_index_dependencies(self, index_configs):
-        query_to_index = queries_to_index(self.queries.items(), index_configs)
+        query_to_index = queries_to_index(self.queries.items(), index_configs, column_map=self.query_column_map)
 
         return query_to_index
 
+    def normalize_query_weights(self, query_weights: dict):
+        """
+        Scales the weights of the queries to a mean of 1. Returns None without weights (or if all the weights are 0).
+        """
+        if not query_weights:
+            return None
+
+        weights = dict((query, float(query_weights.get(query, 1))) for query in self.queries)
+        total_weight = sum(weights.values())
+
+        if total_weight <= 0:
+            logging.warning("All the query weights are 0. Ignoring the weights.")
+            return None
+
+        scale = len(weights) / total_weight
+
+        return dict((query, weight * scale) for query, weight in weights.items())
+
+    def get_weight(self, query):
+        """
+        Returns the (normalized) weight of a query
+        """
+        if not self.query_weights:
+            return 1
+
+        return self.query_weights.get(query, 1)
+
+    def get_query_weight(self, queries):
+        """
+        Returns the total weight of queries
+        """
+        return sum(self.get_weight(query) for query in queries)
+
+    @staticmethod
+    def get_query_timeout(remaining_time: float, weight: float):
+        """
+        Returns the time a query can run before the weighted execution time of the configuration exceeds the
+        remaining time. Queries without weight do not count, and get the remaining time.
+        """
+        if weight <= 0:
+            return remaining_time
+
+        return remaining_time / weight
+
     def sort_query_clusters(self, clusters):
         """
         Sorts the query clusters based on the cost of creating the indexes in that cluster, using dynamic programming.
@@ -122,14 +270,15 @@ class ConfigurationSelector:
                     index_costs[index] = self.table_cardinalities[index.get_table_name()]
 
             cluster_indexes[cluster.get_cluster_id()] = index_set
-            frequencies[cluster.get_cluster_id()] = len(cluster.get_queries())
+            frequencies[cluster.get_cluster_id()] = self.get_query_weight(cluster.get_queries())
 
         if len(clusters) > 1:
             clusters_tmp = list()
             clusters_map = dict([(cluster.get_cluster_id(), cluster) for cluster in clusters])
 
+            # Without query weights, the clusters are weighted equally, as before
             ordered_clusters = compute_optimal_order(cluster_indexes.keys(), cluster_indexes, index_costs,
-                                                     frequency=None)
+                                                     frequency=frequencies if self.query_weights else None)
 
             for cluster in ordered_clusters[1]:
                 clusters_tmp.append(clusters_map[cluster])
@@ -141,32 +290,371 @@ class ConfigurationSelector:
     # --- Proposed methodology START ---
     def get_total_cost(self,query):
         plan = self.driver.explain(self.queries[query], False, explain_json=True)['plan']
+        return ConfigurationSelector.get_plan_cost(plan)
+
+    def get_total_costs(self):
+        """
+        Returns the estimated cost of every query. The queries are explained in one batch (see explain_many).
+        """
+        query_ids = list(self.queries.keys())
+        outs = self.driver.explain_many([self.queries[query] for query in query_ids], explain_json=True)
+
+        return {query: ConfigurationSelector.get_plan_cost(out['plan']) for query, out in zip(query_ids, outs)}
+
+    @staticmethod
+    def get_plan_cost(plan):
         if isinstance(plan, dict):  
             return plan['Plan']['Total Cost']
-        elif isinstance(plan, list):  
-            return float('inf')
+        elif isinstance(plan, list):
+            # The JSON plans of DuckDB are lists of operators
+            return DuckDBDriver.get_plan_cost(plan)
         # Optional: handle unexpected types if needed.
         return float('inf')
     # --- Proposed methodology END ---
 
-    def select_configuration(self):
-        rounds_ran = 0
-        current_timeout = self.initial_time_out_seconds
+    def evaluate_configuration(self, driver, config_id: str, config: Configuration, current_timeout: float,
+                               worker_id: int = None):
+        """
+        Evaluates a single configuration for one round: resets the system, applies the configuration, creates the
+        indexes required by the queries and runs the queries that have not been completed yet.
+        @param driver: The database driver used to evaluate the configuration
+        @param config_id: The configuration id
+        @param config: The configuration
+        @param current_timeout: The timeout of the current round
+        @param worker_id: The id of the worker evaluating the configuration, if any
+        @return: A tuple (completed, report)
+        """
+        config_start = time.time()
+
+        # Indexes created in this configuration
+        indexes_created = set()
+
+        completed: bool = True
+        round_query_execution_time: float = 0.0
+        round_completed_query_execution_time: float = 0.0
+        round_completed_queries: int = 0
+        round_index_creation_time: float = 0.0
+
+        completed_queries = self.completed_queries
+        total_completed_query_execution_time_per_config = self.total_completed_query_execution_time_per_config
+        indexes_created_per_config = self.indexes_created_per_config
+
+        # Path to store the results of this configuration
+        config_path = f"{self.results_dir}/{config_id}"
+
+        if not os.path.exists(config_path):
+            os.makedirs(config_path, exist_ok=True)
+
+        # Reset Config
+        config_reset_time_start = time.time()
+        self.reset_configuration(restart_system=False, drop_indexes=self.drop_indexes and not self.incremental_indexes,
+                                 driver=driver)
+
+        # Only drop the indexes the next configuration does not use
+        if self.drop_indexes and self.incremental_indexes:
+            self.get_index_state(driver).retain(get_configuration_index_keys(config))
+
+        config_reset_time = time.time() - config_reset_time_start
+        logging.debug(f"Resetting config took: {config_reset_time}")
+
+        indexes: QueryToIndex = self.get_query_index_dependencies(config.get_index_commands())
+
+        # Set the system configuration
+        reconfiguration_start = time.time()
+        driver.set_configuration(config.get_configs(), restart=True, reset=True)
+        reconfiguration_time = time.time() - reconfiguration_start
+
+        queries_left = [query_id for query_id in self.queries if query_id not in completed_queries[config_id]]
+
+        logging.info(f"Trying config: {config_id}")
+        remaining_time = current_timeout
+
+        queries_to_execute = queries_left
+        round_clustering_time = 0.0
+
+        if self.enable_query_scheduler:
+            queries_to_execute = list()
+            clusters: list[QueryCluster]
+            clusters, round_clustering_time = self.query_clusterer.get_clusters(queries_left, indexes)
+            clusters = self.sort_query_clusters(clusters)
+
+            for cluster in clusters:
+                # --- Proposed methodology START ---
+                if self.order_query:
+                    queries_to_execute.extend(sorted(cluster.get_queries(), key=lambda x:self.costs[x]))
+                else:
+                    queries_to_execute.extend(cluster.get_queries())
+                # --- Proposed methodology END ---
+                logging.debug(f"Cluster: {cluster.get_cluster_id()}, #Indexes: {[str(index) for index in cluster.get_indexes()]}, "
+                              f"Queries: {cluster.get_queries()}")
+
+        # Builds the indexes in the background, in the order the queries need them
+        index_builder = None
+
+        if self.background_index_builds and self.create_indexes and not self.create_all_indexes_first:
+            index_builder = IndexBuilder(driver, max_concurrent_builds=self.max_concurrent_index_builds,
+                                         memory_budget_kb=self.index_build_memory_budget_kb)
+
+            for query_id in queries_to_execute:
+                for index in indexes.get_query_indexes(query_id):
+                    if not (self.incremental_indexes and self.get_index_state(driver).is_present(index)):
+                        index_builder.submit(index)
+
+        # Creates all the indexes included in the configuration before query execution
+        if self.create_indexes and self.create_all_indexes_first:
+            for query in queries_to_execute:
+                query_indexes = indexes.get_query_indexes(query)
+                for index in query_indexes:
+                    if index not in indexes_created:
+                        try:
+                            logging.info(f"Creating index: {index}")
+                            index_creation_time_start = time.time()
+                            self.create_index(driver, index)
+                            round_index_creation_time += time.time() - index_creation_time_start
+#                             with open('e2_index_time.txt','a')as f:             
+#                                 f.write(f'''create index: {round_index_creation_time}
+# ''') 
+                            indexes_created_per_config[config_id].add(index)
+                            indexes_created.add(index)
+                        except Exception as e:
+                            logging.warning(f"Error creating index: {index}")
+                            logging.warning(f"Error message: {e}")
+
+        # The execution times below are weighted by the query weights (see get_weight), so that configurations are
+        # scored by the weighted total execution time of the workload.
+        # If there is at least one completed configuration, then best_execution_time should be < float('inf')
+        # In such a case, we set the current timeout as the best execution time we have seen so far, minus
+        # the time spent on query execution in that configuration.
+        best_execution_time = self.best_execution_time.get()
+        completed_query_execution_time_start = total_completed_query_execution_time_per_config[config_id]
+
+        if best_execution_time < float('inf'):
+            current_timeout = best_execution_time - completed_query_execution_time_start
+            remaining_time = current_timeout
+            logging.info(f"Found best execution time. Setting timeout to {best_execution_time} - "
+                         f"{completed_query_execution_time_start} = {current_timeout}")
+
+        driver_config: dict = driver.get_current_global_config();
+
+        round_completed_query_times = dict()
+        round_query_timeouts = list()
+        round_query_errors = dict()
+
+        # --- Proposed methodology START ---
+        i=0
+        while i<len(queries_to_execute):
+            query_id=queries_to_execute[i]
+            i+=1
+        # --- Proposed methodology END ---
+        # for query_id in queries_to_execute:
+            query_str = self.queries[query_id]
+            query_weight = self.get_weight(query_id)
+
+            if query_id in completed_queries[config_id]:
+                continue
+            query_indexes = indexes.get_query_indexes(query_id)
+
+            # The bound can only improve while this configuration runs if other workers evaluate configurations
+            # at the same time. In that case, tighten the remaining time accordingly.
+            if self.best_execution_time.get() < best_execution_time:
+                best_execution_time = self.best_execution_time.get()
+                remaining_time = min(remaining_time, best_execution_time - completed_query_execution_time_start
+                                     - round_query_execution_time)
+
+            # --- Proposed methodology ---
+            if self.exploit_index and remaining_time <= 0 and (query_indexes.isdisjoint(indexes_created)or best_execution_time < float('inf')):
+                completed = False
+                break
+            # --- Proposed methodology ---
+
+            logging.info(f"Running query: {query_id} with timeout: {remaining_time}")
+
+            # Creates only the indexes associated with the current query
+            if self.create_indexes and not self.create_all_indexes_first:
+                logging.info(f"Created Indexes: {indexes_created}")
+                logging.info(f"Query Indexes: {len(query_indexes)}")
+
+                for index in query_indexes:
+                    if index not in indexes_created:
+                        logging.info(f"Creating index: {index}")
+                        index_creation_time_start = time.time()
+
+                        try:
+                            self.create_index(driver, index, index_builder)
+                        except Exception as e:
+                            logging.error(e)
+
+                        round_index_creation_time += time.time() - index_creation_time_start
+#                         with open('e2_index_time.txt','a')as f:             
+#                             f.write(f'''create index: {round_index_creation_time}
+# ''') 
+                        indexes_created_per_config[config_id].add(index)
+                        indexes_created.add(index)
+
+                        # --- Proposed methodology START ---
+                        if self.exploit_index:
+                            queries_to_execute.insert(i, [x[0] for x in indexes.query_to_index.items() if index in x[1]])
+                            queries_to_execute = [item for sublist in queries_to_execute for item in (sublist if isinstance(sublist, list) else [sublist])]
+                            queries_to_execute = list(dict.fromkeys(queries_to_execute))
+                        # --- Proposed methodology END ---
+                    else:
+                        pass
+
+            if worker_id is not None:
+                self.worker_progress[worker_id] = (completed_query_execution_time_start + round_query_execution_time,
+                                                   time.time(), query_weight)
+
+            # --- Proposed methodology ---
+            query_timeout = remaining_time if not self.exploit_index or best_execution_time<float('inf') else float('inf')
+            # --- Proposed methodology ---
+            query_timeout = ConfigurationSelector.get_query_timeout(query_timeout, query_weight)
+
+            query_exec_start = time.time()
+
+            if self.query_watchdog:
+                # The watchdog cancels the query once the budget of the configuration is exhausted
+                r = driver.explain(query_str,
+                                   execute=True,
+                                   deadline=query_exec_start + query_timeout,
+                                   results_path=f"{config_path}/{query_id}.json")
+            else:
+                r = driver.explain(query_str,
+                                   execute=True,
+                                   timeout=query_timeout*1000,
+                                   results_path=f"{config_path}/{query_id}.json")
+            query_exec_time = time.time() - query_exec_start
+            weighted_query_exec_time = query_exec_time * query_weight
+            round_query_execution_time += weighted_query_exec_time
+
+            # Remaining time for the rest of the queries
+            remaining_time -= weighted_query_exec_time
+
+            if r["execTime"] == "TIMEOUT":
+                round_query_timeouts.append(query_id)
+            elif r["execTime"] == "ERROR":
+                logging.warning(f"Query {query_id} failed: {r.get('error')}")
+                round_query_errors[query_id] = r.get("error")
+
+            # The query was cut off because a configuration evaluated by another worker completed faster
+            if r["execTime"] == "TIMEOUT" and self.best_execution_time.get() < best_execution_time:
+                completed = False
+                break
+
+            # --- Proposed methodology ---
+            if not self.exploit_index and(remaining_time <= 0 or r["execTime"] in ("TIMEOUT", "ERROR")):
+                completed = False
+                break
+            # --- Proposed methodology ---
+
+            round_completed_query_times[query_id] = query_exec_time
+            completed_queries[config_id].append(query_id)
+            round_completed_query_execution_time += weighted_query_exec_time
+            total_completed_query_execution_time_per_config[config_id] += weighted_query_exec_time
+            round_completed_queries += 1
+
+        self.total_query_execution_time_per_config[config_id] += round_query_execution_time
+
+        # Stops the builds of indexes no query waited for
+        round_index_build_time = 0.0
+
+        if index_builder:
+            index_builder.shutdown()
+            round_index_build_time = index_builder.get_total_build_time()
+
+            if self.incremental_indexes:
+                for index in index_builder.get_built_indexes():
+                    self.get_index_state(driver).mark_created(index)
 
+        if worker_id is not None:
+            self.worker_progress.pop(worker_id, None)
+
+        if not completed:
+            logging.info("Config exceeded timeout")
+        else:
+            self.best_execution_time.offer(self.total_query_execution_time_per_config[config_id])
+
+            logging.info(f"Config {config_id} succeeded!")
+            logging.debug(f"Created Indexes: {len(indexes_created)}, "
+                          f"Total Indexes: {len(config.get_indexes())}")
+
+        report = {
+            "config_id": config_id,
+            "total_query_execution_time": self.total_query_execution_time_per_config[config_id],
+            "total_completed_query_execution_time": total_completed_query_execution_time_per_config[config_id],
+            "best_execution_time": self.best_execution_time.get(),
+            "duration_seconds": time.time() - self.start_time,
+            "start_time": config_start,
+            "report_ts": time.time(),
+            "round_num_indexes_created": len(indexes_created),
+            "round_index_creation_time": round_index_creation_time,
+            "round_index_build_time": round_index_build_time,
+            "round_clustering_time": round_clustering_time,
+            "round_query_execution_time": round_query_execution_time,
+            "round_completed_queries": round_completed_queries,
+            "round_config_reset_time": config_reset_time,
+            "round_reconfiguration_time": reconfiguration_time,
+            "round_reconfiguration": getattr(driver, "last_reconfiguration", None),
+            "queries_completed_total": len(completed_queries[config_id]),
+            "num_indexes_created_total": len(indexes_created_per_config[config_id]),
+            "num_indexes_total": len(config.get_indexes()),
+            "completed": completed,
+            "timeout": current_timeout,
+            "alpha": self.timeout_interval,
+            "driver_config": driver_config,
+            "lambda_tune_config": list(config.get_configs()),
+            "created_indexes": driver.get_all_indexes(),
+            "round_completed_query_times": round_completed_query_times,
+            "round_query_timeouts": round_query_timeouts,
+            "round_query_errors": round_query_errors,
+            "weighted": self.query_weights is not None,
+            "index_state_metrics": self.get_index_state(driver).get_metrics() if self.incremental_indexes else None,
+            "connection_metrics": driver.get_connection_metrics() if hasattr(driver, "get_connection_metrics") else None,
+            "plan_cache_metrics": driver.get_plan_cache_metrics() if hasattr(driver, "get_plan_cache_metrics") else None,
+            "clustering_metrics": self.query_clusterer.get_metrics(),
+        }
+
+        if worker_id is not None:
+            report["worker_id"] = worker_id
+
+        return completed, report
+
+    def write_report(self, report: dict):
+        """
+        Appends a report to the reports of the results directory (see ReportSink)
+        """
+        self.report_sink.write(report)
+
+        logging.info(json.dumps(report, indent=2))
+
+    def init_selection_state(self):
+        """
+        Initializes the state that is kept across the rounds of the configuration selection
+        """
         # Completed queries per config
-        completed_queries = defaultdict(list)
+        self.completed_queries = defaultdict(list)
 
         # Execution time per config
-        total_query_execution_time_per_config = defaultdict(float)
+        self.total_query_execution_time_per_config = defaultdict(float)
 
         # Completed query execution time per config
-        total_completed_query_execution_time_per_config = defaultdict(float)
+        self.total_completed_query_execution_time_per_config = defaultdict(float)
 
         # Best Execution Time Seen
-        best_execution_time = float("inf")
+        self.best_execution_time = ExecutionTimeBound()
 
         # Indexes created per config
-        indexes_created_per_config = defaultdict(set)
+        self.indexes_created_per_config = defaultdict(set)
+
+        # Query execution time spent by the configuration each worker is running, and when its current query started
+        self.worker_progress = dict()
+
+        self.report_sink = ReportSink(self.results_dir or ".")
+
+        self.start_time = time.time()
+
+    def select_configuration(self):
+        rounds_ran = 0
+        current_timeout = self.initial_time_out_seconds
 
         completed_configs = []
 
@@ -179,7 +667,12 @@ class ConfigurationSelector:
         if len(configs) == 0:
             raise Exception("No configurations were found.")
 
-        start: float = time.time()
+        if self.incremental_indexes:
+            configs = self.order_configs_by_index_churn(configs)
+
+        self.init_selection_state()
+        completed_queries = self.completed_queries
+        round_completed_queries = 0
 
         while rounds_ran < self.max_rounds:
             round_results: set = {}
@@ -188,183 +681,17 @@ class ConfigurationSelector:
             while j <(len(configs)):
                 current_configuration=configs[j]
                 j+=1
-                config_start = time.time()
-
-                # Indexes created in this configuration
-                indexes_created = set()
 
-                completed: bool = True
-                round_query_execution_time: float = 0.0
-                round_completed_query_execution_time: float = 0.0
-                round_completed_queries: int = 0
-                round_index_creation_time: float = 0.0
                 config_id: str = current_configuration[0].split(".json")[0]
                 config: Configuration = current_configuration[1]
 
-                # Path to store the results of this configuration
-                config_path = f"{self.results_dir}/{config_id}"
-
-                if not os.path.exists(config_path):
-                    os.makedirs(config_path, exist_ok=True)
-
-                # Reset Config
-                config_reset_time_start = time.time()
-                self.reset_configuration(restart_system=False, drop_indexes=self.drop_indexes)
-                config_reset_time = time.time() - config_reset_time_start
-                logging.debug(f"Resetting config took: {config_reset_time}")
+                completed, report = self.evaluate_configuration(self.driver, config_id, config, current_timeout)
+                current_timeout = report["timeout"]
+                round_completed_queries = report["round_completed_queries"]
+                round_index_creation_time = report["round_index_creation_time"]
 
-                indexes: QueryToIndex = self.get_query_index_dependencies(config.get_index_commands())
-
-                # Set the system configuration
-                reconfiguration_start = time.time()
-                self.driver.set_configuration(config.get_configs(), restart=True, reset=True)
-                reconfiguration_time = time.time() - reconfiguration_start
-
-                queries_left = [query_id for query_id in self.queries if query_id not in completed_queries[config_id]]
-
-                logging.info(f"Trying config: {config_id}")
-                remaining_time = current_timeout
-
-                queries_to_execute = queries_left
-
-                if self.enable_query_scheduler:
-                    queries_to_execute = list()
-                    clusters: list[QueryCluster] = generate_query_clusters(queries_left, indexes)
-                    clusters = self.sort_query_clusters(clusters)
-
-                    for cluster in clusters:
-                        # --- Proposed methodology START ---
-                        if self.order_query:
-                            queries_to_execute.extend(sorted(cluster.get_queries(), key=lambda x:self.costs[x]))
-                        else:
-                            queries_to_execute.extend(cluster.get_queries())
-                        # --- Proposed methodology END ---
-                        logging.debug(f"Cluster: {cluster.get_cluster_id()}, #Indexes: {[str(index) for index in cluster.get_indexes()]}, "
-                                      f"Queries: {cluster.get_queries()}")
-
-                # Creates all the indexes included in the configuration before query execution
-                if self.create_indexes and self.create_all_indexes_first:
-                    for query in queries_to_execute:
-                        query_indexes = indexes.get_query_indexes(query)
-                        for index in query_indexes:
-                            if index not in indexes_created:
-                                try:
-                                    logging.info(f"Creating index: {index}")
-                                    index_creation_time_start = time.time()
-                                    self.driver.cursor.execute(index.get_create_index_statement())
-                                    round_index_creation_time += time.time() - index_creation_time_start
-#                                     with open('e2_index_time.txt','a')as f:             
-#                                         f.write(f'''create index: {round_index_creation_time}
-# ''') 
-                                    indexes_created_per_config[config_id].add(index)
-                                    indexes_created.add(index)
-                                except Exception as e:
-                                    logging.warning(f"Error creating index: {index}")
-                                    logging.warning(f"Error message: {e}")
-
-                # If there is at least one completed configuration, then best_execution_time should be < float('inf')
-                # In such a case, we set the current timeout as the best execution time we have seen so far, minus
-                # the time spent on query execution in that configuration.
-                if best_execution_time < float('inf'):
-                    current_timeout = best_execution_time - total_completed_query_execution_time_per_config[config_id]
-                    remaining_time = current_timeout
-                    logging.info(f"Found best execution time. Setting timeout to {best_execution_time} - "
-                                 f"{total_completed_query_execution_time_per_config[config_id]} = {current_timeout}")
-
-                driver_config: dict = self.driver.get_current_global_config();
-
-                round_completed_query_times = dict()
-
-                # --- Proposed methodology START ---
-                i=0
-                while i<len(queries_to_execute):
-                    query_id=queries_to_execute[i]
-                    i+=1
-                # --- Proposed methodology END ---
-                # for query_id in queries_to_execute:
-                    query_str = self.queries[query_id]
-
-                    if query_id in completed_queries[config_id]:
-                        continue
-                    query_indexes = indexes.get_query_indexes(query_id)
-                    
-                    # --- Proposed methodology ---
-                    if self.exploit_index and remaining_time <= 0 and (query_indexes.isdisjoint(indexes_created)or best_execution_time < float('inf')):
-                        completed = False
-                        break
-                    # --- Proposed methodology ---
-
-                    logging.info(f"Running query: {query_id} with timeout: {remaining_time}")
-
-                    # Creates only the indexes associated with the current query
-                    if self.create_indexes and not self.create_all_indexes_first:
-                        logging.info(f"Created Indexes: {indexes_created}")
-                        logging.info(f"Query Indexes: {len(query_indexes)}")
-
-                        for index in query_indexes:
-                            if index not in indexes_created:
-                                logging.info(f"Creating index: {index}")
-                                index_creation_time_start = time.time()
-
-                                try:
-                                    self.driver.get_cursor().execute(index.get_create_index_statement())
-                                except Exception as e:
-                                    logging.error(e)
-
-                                round_index_creation_time += time.time() - index_creation_time_start
-#                                 with open('e2_index_time.txt','a')as f:             
-#                                     f.write(f'''create index: {round_index_creation_time}
-# ''') 
-                                indexes_created_per_config[config_id].add(index)
-                                indexes_created.add(index)
-
-                                # --- Proposed methodology START ---
-                                if self.exploit_index:
-                                    queries_to_execute.insert(i, [x[0] for x in indexes.query_to_index.items() if index in x[1]])
-                                    queries_to_execute = [item for sublist in queries_to_execute for item in (sublist if isinstance(sublist, list) else [sublist])]
-                                    queries_to_execute = list(dict.fromkeys(queries_to_execute))
-                                # --- Proposed methodology END ---
-                            else:
-                                pass
-
-                    query_exec_start = time.time()
-                    r = self.driver.explain(query_str,
-                                            execute=True,
-                                            # --- Proposed methodology ---
-                                            timeout=(remaining_time if not self.exploit_index or best_execution_time<float('inf') else float('inf'))*1000,
-                                            # --- Proposed methodology ---
-                                            results_path=f"{config_path}/{query_id}.json")
-                    query_exec_time = time.time() - query_exec_start
-                    round_query_execution_time += query_exec_time
-
-                    # Remaining time for the rest of the queries
-                    remaining_time -= query_exec_time
-
-                    # --- Proposed methodology ---
-                    if not self.exploit_index and(remaining_time <= 0 or r["execTime"] == "TIMEOUT"):
-                        completed = False
-                        break
-                    # --- Proposed methodology ---
-
-                    round_completed_query_times[query_id] = query_exec_time
-                    completed_queries[config_id].append(query_id)
-                    round_completed_query_execution_time += query_exec_time
-                    total_completed_query_execution_time_per_config[config_id] += query_exec_time
-                    round_completed_queries += 1
-
-                total_query_execution_time_per_config[config_id] += round_query_execution_time
-
-                if not completed:
-                    logging.info("Config exceeded timeout")
-                else:
-                    if total_query_execution_time_per_config[config_id] < best_execution_time:
-                        best_execution_time = total_query_execution_time_per_config[config_id]
-
-                    logging.info(f"Config {config_id} succeeded!")
-                    logging.debug(f"Created Indexes: {len(indexes_created)}, "
-                                  f"Total Indexes: {len(config.get_indexes())}")
-
-                    completed_configs.append([config_id, total_query_execution_time_per_config[config_id]])
+                if completed:
+                    completed_configs.append([config_id, self.total_query_execution_time_per_config[config_id]])
                     # --- Proposed methodology START ---
                     j=len(completed_configs)
                     configs = sorted(configs, key=lambda x: -len(completed_queries[x[0].split(".json")[0]]))
@@ -375,57 +702,17 @@ class ConfigurationSelector:
                         logging.info(f"{cfg_idx}: {throughput}")
                     # --- Proposed methodology END ---
 
-                report = {
-                    "config_id": config_id,
-                    "total_query_execution_time": total_query_execution_time_per_config[config_id],
-                    "total_completed_query_execution_time": total_completed_query_execution_time_per_config[config_id],
-                    "best_execution_time": best_execution_time,
-                    "duration_seconds": time.time() - start,
-                    "start_time": config_start,
-                    "report_ts": time.time(),
-                    "round_num_indexes_created": len(indexes_created),
-                    "round_index_creation_time": round_index_creation_time,
-                    "round_query_execution_time": round_query_execution_time,
-                    "round_completed_queries": round_completed_queries,
-                    "round_config_reset_time": config_reset_time,
-                    "round_reconfiguration_time": reconfiguration_time,
-                    "queries_completed_total": len(completed_queries[config_id]),
-                    "num_indexes_created_total": len(indexes_created_per_config[config_id]),
-                    "num_indexes_total": len(config.get_indexes()),
-                    "completed": completed,
-                    "timeout": current_timeout,
-                    "alpha": self.timeout_interval,
-                    "driver_config": driver_config,
-                    "lambda_tune_config": list(config.get_configs()),
-                    "created_indexes": self.driver.get_all_indexes(),
-                    "round_completed_query_times": round_completed_query_times,
-                }
-
                 round_results[config_id] = report
 
-                reports_output = f"{self.results_dir}/reports.json"
-
-                if os.path.exists(reports_output):
-                    with open(reports_output, "r") as f:
-                        reports = json.load(f)
-                else:
-                    reports = []
-
-                reports.append(report)
-
-                with open(reports_output, "w") as f:
-                    f.write(json.dumps(reports, indent=2))
-                    f.flush()
-
-                logging.info(json.dumps(report, indent=2))
+                self.write_report(report)
 
                 if self.adaptive_timeout:
                     if current_timeout < round_index_creation_time:
                         current_timeout = round_index_creation_time
 
                 # Always keep the best execution time as the current timeout
-                if best_execution_time < float('inf'):
-                    current_timeout = best_execution_time
+                if self.best_execution_time.is_set():
+                    current_timeout = self.best_execution_time.get()
 
             # --- Proposed methodology ---
             configs = sorted(configs, key=lambda x: -len(completed_queries[x[0].split(".json")[0]]))
@@ -448,15 +735,21 @@ class ConfigurationSelector:
 # {pprint.pformat(completed_configs)}
 # ''') 
             
+        self.report_sink.close()
         self.reset_configuration(restart_system=True, drop_indexes=self.drop_indexes)
 
         # self.evaluate(reports_output)
 
     def evaluate(self, reports_output):
+        """
+        Re-runs the queries with every completed configuration. The evaluated reports are appended to the reports of the
+        "evaluation" directory next to the reports, so that the reports of the selection are kept as they are.
+        @param reports_output: The reports directory, or the path of its reports.json
+        """
         logging.info("Evaluating Completed Configurations")
 
-        with open(reports_output, "r") as f:
-            reports = json.load(f)
+        reports = read_reports(reports_output)
+        evaluation_sink = ReportSink(os.path.join(get_reports_dir(reports_output), "evaluation"))
 
         for report in reports:
             if not report["completed"]:
@@ -514,10 +807,9 @@ class ConfigurationSelector:
             if self.create_indexes:
                 report["created_indexes"] = list(indexes)
 
-            with open(reports_output, "w") as f:
-                f.write(json.dumps(reports, indent=2))
-                f.flush()
+            evaluation_sink.write(report)
 
+        evaluation_sink.close()
         self.reset_configuration(restart_system=True, drop_indexes=self.drop_indexes)
 
         try:
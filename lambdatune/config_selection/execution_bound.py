@@ -0,0 +1,58 @@
+import threading
+
+
+class ExecutionTimeBound:
+    """
+    The best (lowest) total execution time seen so far across all the configurations. Configurations that exceed
+    this bound can be cut off, since they cannot win anymore. The bound is thread-safe, so that it can be shared
+    by multiple workers that evaluate configurations at the same time.
+    """
+    def __init__(self):
+        self.__value = float("inf")
+        self.__lock = threading.Lock()
+        self.__listeners = list()
+
+    def get(self):
+        """
+        Returns the current bound
+        """
+        return self.__value
+
+    def is_set(self):
+        """
+        Returns true if at least one configuration has completed
+        """
+        return self.__value < float("inf")
+
+    def offer(self, execution_time: float):
+        """
+        Offers a new total execution time. The bound is updated only if the new time is lower.
+        @param execution_time: The total execution time of a completed configuration
+        @return: True if the bound was improved
+        """
+        with self.__lock:
+            if execution_time >= self.__value:
+                return False
+
+            self.__value = execution_time
+            listeners = list(self.__listeners)
+
+        for listener in listeners:
+            listener(execution_time)
+
+        return True
+
+    def add_listener(self, listener):
+        """
+        Registers a callback that is called with the new value every time the bound improves
+        """
+        with self.__lock:
+            self.__listeners.append(listener)
+
+    def remove_listener(self, listener):
+        """
+        Unregisters a callback registered with add_listener
+        """
+        with self.__lock:
+            if listener in self.__listeners:
+                self.__listeners.remove(listener)
@@ -0,0 +1,141 @@
+import logging
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from lambdatune.config_selection.index import Index
+
+
+class IndexBuilder:
+    """
+    Builds indexes in the background, on connections separate from the one that runs the workload. Queries that do
+    not depend on a pending index can run meanwhile; a query that does waits only for its own indexes.
+    """
+    def __init__(self, driver, max_concurrent_builds: int = None, memory_budget_kb: int = None):
+        """
+        @param driver: The Postgres driver. Builds use connections from its connection pool.
+        @param max_concurrent_builds: Upper bound on the number of indexes built at the same time
+        @param memory_budget_kb: Upper bound on the total maintenance_work_mem of the concurrent builds
+        """
+        self.driver = driver
+        self.futures = dict()
+        self.running = dict()
+        self.build_times = dict()
+        self.lock = threading.Lock()
+        self.cancelled = False
+
+        self.concurrency = self.get_concurrency(max_concurrent_builds, memory_budget_kb)
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="index-builder")
+
+        logging.info(f"Building indexes in the background with {self.concurrency} concurrent builds")
+
+    def get_concurrency(self, max_concurrent_builds: int = None, memory_budget_kb: int = None):
+        """
+        Derives the number of concurrent builds from the server settings. Every build may use
+        max_parallel_maintenance_workers parallel workers, which come out of max_worker_processes, and
+        maintenance_work_mem of memory.
+        """
+        cursor = self.driver.get_cursor()
+        cursor.execute("SELECT name, setting FROM pg_settings WHERE name = ANY(%s)",
+                       (["max_worker_processes", "max_parallel_maintenance_workers", "maintenance_work_mem"],))
+        settings = dict([(d[0], int(d[1])) for d in cursor.fetchall()])
+
+        max_worker_processes = settings.get("max_worker_processes", 8)
+        parallel_workers = settings.get("max_parallel_maintenance_workers", 2)
+        maintenance_work_mem = settings.get("maintenance_work_mem", 65536)
+
+        concurrency = max(1, max_worker_processes // (1 + parallel_workers))
+
+        if memory_budget_kb:
+            concurrency = min(concurrency, max(1, memory_budget_kb // maintenance_work_mem))
+
+        if max_concurrent_builds:
+            concurrency = min(concurrency, max_concurrent_builds)
+
+        return concurrency
+
+    def submit(self, index: Index):
+        """
+        Schedules the build of an index. Builds run in the order they are submitted.
+        """
+        if index in self.futures:
+            return
+
+        self.futures[index] = self.executor.submit(self.build, index)
+
+    def build(self, index: Index):
+        if self.cancelled:
+            return False
+
+        with self.driver.connection() as conn:
+            with self.lock:
+                self.running[index] = conn
+
+            start = time.time()
+
+            try:
+                logging.info(f"Creating index: {index}")
+                cursor = conn.cursor()
+                cursor.execute(index.get_create_index_statement())
+                cursor.close()
+
+                # The plans of the driver's session may use the new index
+                self.driver.invalidate_state_fingerprint()
+
+                return True
+            except Exception as e:
+                logging.error(f"Error creating index {index}: {e}")
+
+                return False
+            finally:
+                with self.lock:
+                    self.running.pop(index, None)
+                    self.build_times[index] = time.time() - start
+
+    def is_pending(self, index: Index):
+        return index in self.futures and not self.futures[index].done()
+
+    def wait(self, index: Index):
+        """
+        Blocks until the index is built
+        @return: True if the index was built successfully, None if it was never submitted
+        """
+        if index not in self.futures:
+            return None
+
+        return self.futures[index].result()
+
+    def get_built_indexes(self):
+        """
+        Returns the indexes whose build completed successfully
+        """
+        return [index for index, future in self.futures.items()
+                if future.done() and not future.cancelled() and future.result()]
+
+    def get_total_build_time(self):
+        """
+        Returns the sum of the build times of all the indexes, including the time spent off the critical path
+        """
+        with self.lock:
+            return sum(self.build_times.values())
+
+    def shutdown(self):
+        """
+        Cancels the pending builds, interrupts the running ones and waits for the workers to finish
+        """
+        self.cancelled = True
+
+        for future in self.futures.values():
+            future.cancel()
+
+        with self.lock:
+            running = list(self.running.values())
+
+        for conn in running:
+            try:
+                conn.cancel()
+            except Exception as e:
+                logging.warning(f"Failed to cancel index build: {e}")
+
+        self.executor.shutdown(wait=True)
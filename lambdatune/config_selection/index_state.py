@@ -0,0 +1,131 @@
+import logging
+import re
+
+from lambdatune.config_selection.index import Index
+
+
+INDEX_DEFINITION_PATTERN = re.compile(r"\sON\s+(?:ONLY\s+)?(?:\w+\.)?(\w+)(?:\s+USING\s+\w+)?\s*\((.+)\)", re.IGNORECASE)
+
+
+def get_index_key(table_name: str, column_name: str):
+    """
+    Returns the key of an index. Indexes are identified by the (table, column) they are built on rather than by their
+    name, since the names of the LLM indexes are made unique per configuration.
+    """
+    return table_name.strip().lower(), column_name.strip().lower()
+
+
+def get_configuration_index_keys(configuration):
+    """
+    Returns the index keys of a Configuration. The keys of Configuration.get_indexes() have the form "table(column)".
+    """
+    keys = set()
+
+    for index_id in configuration.get_indexes():
+        if "(" not in index_id:
+            continue
+
+        table_name = index_id.split("(")[0]
+        column_name = index_id.split("(")[1].split(")")[0]
+        keys.add(get_index_key(table_name, column_name))
+
+    return keys
+
+
+class IndexStateManager:
+    """
+    Keeps track of the (non primary key) indexes that are physically present in the database, so that moving from one
+    configuration to the next only drops and creates the indexes that differ.
+    """
+    def __init__(self, driver):
+        """
+        @param driver: The Postgres driver of the database
+        """
+        self.driver = driver
+
+        # (table, column) -> index name
+        self.present = dict()
+
+        self.metrics = {
+            "created": 0,
+            "reused": 0,
+            "dropped": 0,
+        }
+
+        self.load()
+
+    def load(self):
+        """
+        Loads the indexes that are present in the database
+        """
+        non_pk_indexes = set(self.driver.get_all_indexes())
+
+        cursor = self.driver.get_cursor()
+        cursor.execute("SELECT indexname, indexdef FROM pg_indexes WHERE tablename NOT LIKE 'pg%'")
+
+        self.present = dict()
+
+        for index_name, index_definition in cursor.fetchall():
+            if index_name not in non_pk_indexes:
+                continue
+
+            match = INDEX_DEFINITION_PATTERN.search(index_definition)
+
+            if not match:
+                logging.warning(f"Could not parse the definition of index {index_name}: {index_definition}")
+                continue
+
+            self.present[get_index_key(match.group(1), match.group(2))] = index_name
+
+    def is_present(self, index: Index):
+        return get_index_key(index.get_table_name(), index.get_column_name()) in self.present
+
+    def ensure(self, index: Index):
+        """
+        Creates the index, unless an index on the same (table, column) is already present
+        @return: True if the index was created
+        """
+        key = get_index_key(index.get_table_name(), index.get_column_name())
+
+        if key in self.present:
+            logging.info(f"Reusing index {self.present[key]} for {index}")
+            self.metrics["reused"] += 1
+            return False
+
+        self.driver.get_cursor().execute(index.get_create_index_statement())
+        self.driver.invalidate_state_fingerprint()
+        self.present[key] = index.get_index_name()
+        self.metrics["created"] += 1
+
+        return True
+
+    def mark_created(self, index: Index):
+        """
+        Records an index that was created outside the manager (e.g., by the IndexBuilder)
+        """
+        key = get_index_key(index.get_table_name(), index.get_column_name())
+
+        if key not in self.present:
+            self.present[key] = index.get_index_name()
+            self.metrics["created"] += 1
+
+    def retain(self, keys: set):
+        """
+        Drops every present index that is not in the given set of keys
+        """
+        for key in list(self.present.keys()):
+            if key in keys:
+                continue
+
+            index_name = self.present.pop(key)
+            logging.info(f"Dropping index: {index_name}")
+
+            try:
+                self.driver.get_cursor().execute(f"DROP INDEX {index_name}")
+                self.driver.invalidate_state_fingerprint()
+                self.metrics["dropped"] += 1
+            except Exception as e:
+                logging.error(e)
+
+    def get_metrics(self):
+        return dict(self.metrics)
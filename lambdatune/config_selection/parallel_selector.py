@@ -0,0 +1,154 @@
+import logging
+import os
+import queue
+import threading
+import time
+
+from lambdatune.config_selection.configuration import Configuration
+from lambdatune.config_selection.configuration_selector import ConfigurationSelector
+
+
+class ParallelConfigurationSelector(ConfigurationSelector):
+    """
+    Evaluates the candidate configurations at the same time on a pool of database instances (e.g., the clones of a
+    PostgresInstancePool). Each worker owns one instance and pulls configurations from a shared queue. The best
+    execution time is shared across the workers, so that a worker stops a configuration as soon as it can no longer
+    beat a configuration that completed on another worker.
+    """
+    def __init__(self, drivers: list, **kwargs):
+        """
+        @param drivers: One driver per database instance. The first one is used for the workload metadata.
+        @param kwargs: The ConfigurationSelector parameters
+        """
+        if not drivers:
+            raise Exception("ParallelConfigurationSelector requires at least one driver.")
+
+        super().__init__(driver=drivers[0], **kwargs)
+
+        self.drivers = drivers
+        self.lock = threading.Lock()
+        self.current_timeout = self.initial_time_out_seconds
+        self.completed_configs = list()
+
+        logging.info(f"Parallel configuration selection with {len(drivers)} workers")
+
+    def cut_off_slow_workers(self, best_execution_time: float):
+        """
+        Called when a configuration completes with a new best execution time. Cancels the running query of every
+        worker whose configuration has already spent more than that. With the query watchdog, the deadline of the
+        running query of the other workers is moved to the new bound. The time of the running query is weighted by
+        the weight of the query.
+        """
+        now = time.time()
+
+        for worker_id, progress in list(self.worker_progress.items()):
+            spent, query_start, query_weight = progress
+            weighted_spent = spent + (now - query_start) * query_weight
+
+            if weighted_spent >= best_execution_time:
+                logging.info(f"Cutting off worker {worker_id}: {weighted_spent} >= {best_execution_time}")
+                self.drivers[worker_id].cancel()
+            elif self.query_watchdog and query_weight > 0:
+                self.drivers[worker_id].get_watchdog().tighten(
+                    query_start + self.get_query_timeout(best_execution_time - spent, query_weight))
+
+    def run_worker(self, worker_id: int, config_queue: queue.Queue):
+        """
+        Evaluates configurations from the queue on the worker's instance until the queue is empty
+        """
+        driver = self.drivers[worker_id]
+
+        while True:
+            try:
+                config_id, config = config_queue.get_nowait()
+            except queue.Empty:
+                return
+
+            with self.lock:
+                current_timeout = self.current_timeout
+
+            logging.info(f"Worker {worker_id} evaluates config: {config_id}")
+
+            try:
+                completed, report = self.evaluate_configuration(driver, config_id, config, current_timeout,
+                                                                worker_id=worker_id)
+            except Exception as e:
+                logging.error(f"Worker {worker_id} failed to evaluate config {config_id}: {e}")
+                continue
+
+            with self.lock:
+                if completed:
+                    self.completed_configs.append([config_id, self.total_query_execution_time_per_config[config_id]])
+
+                self.write_report(report)
+
+                if self.adaptive_timeout:
+                    if self.current_timeout < report["round_index_creation_time"]:
+                        self.current_timeout = report["round_index_creation_time"]
+
+                # Always keep the best execution time as the current timeout
+                if self.best_execution_time.is_set():
+                    self.current_timeout = self.best_execution_time.get()
+
+    def select_configuration(self):
+        rounds_ran = 0
+
+        if self.results_dir:
+            os.makedirs(self.results_dir, exist_ok=True)
+
+        configs = list(self.configs.items())
+        configs = sorted(configs, key=lambda x: x[0])
+
+        if len(configs) == 0:
+            raise Exception("No configurations were found.")
+
+        # The workers take the configurations from the queue in this order, so the consecutive configurations of a
+        # worker mostly follow it
+        if self.incremental_indexes:
+            configs = self.order_configs_by_index_churn(configs)
+
+        self.init_selection_state()
+        self.best_execution_time.add_listener(self.cut_off_slow_workers)
+
+        try:
+            self.current_timeout = self.initial_time_out_seconds
+            self.completed_configs = list()
+
+            while rounds_ran < self.max_rounds:
+                config_queue = queue.Queue()
+
+                for current_configuration in configs:
+                    config_id: str = current_configuration[0].split(".json")[0]
+                    config: Configuration = current_configuration[1]
+                    config_queue.put((config_id, config))
+
+                workers = [threading.Thread(target=self.run_worker, args=(worker_id, config_queue))
+                           for worker_id in range(0, len(self.drivers))]
+
+                for worker in workers:
+                    worker.start()
+
+                for worker in workers:
+                    worker.join()
+
+                # Configurations with more completed queries go first in the next round
+                configs = sorted(configs, key=lambda x: -len(self.completed_queries[x[0].split(".json")[0]]))
+
+                if self.completed_configs:
+                    break
+
+                with self.lock:
+                    self.current_timeout *= self.timeout_interval
+
+                rounds_ran += 1
+        finally:
+            # The workers are done: later improvements of the bound must not cancel queries on the drivers
+            self.best_execution_time.remove_listener(self.cut_off_slow_workers)
+
+        completed_configs = sorted(self.completed_configs, key=lambda x: x[1])
+        logging.info(f"Completed configs: {completed_configs}")
+
+        self.report_sink.close()
+
+        for driver in self.drivers:
+            self.reset_configuration(restart_system=True, drop_indexes=self.drop_indexes, driver=driver)
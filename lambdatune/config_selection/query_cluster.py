@@ -1,6 +1,14 @@
+import time
 import logging
+import threading
+
+import numpy as np
 
 from collections import defaultdict
+from scipy.cluster.hierarchy import fcluster, linkage
+from scipy.sparse import csr_matrix
+from scipy.spatial.distance import squareform
+from sklearn.cluster import KMeans
 
 from lambdatune.config_selection.query_to_index import QueryToIndex
 
@@ -50,28 +58,120 @@ def create_index_dict(index_dependencies: QueryToIndex):
     return index_dict
 
 
-def create_query_vectors(queries, index_dependencies: QueryToIndex):
+def create_incidence_matrix(queries, index_dependencies: QueryToIndex):
     """
-    Creates the query vectors
+    Creates the sparse query x index incidence matrix, i.e. matrix[i, j] = 1 if the i-th query uses the j-th index
     """
-    # Create index dictionary
     index_dict = create_index_dict(index_dependencies)
 
-    # Create query vector
-    query_vectors = list()
-    for query in queries:
-        vector = [0] * len(index_dict)
+    rows = list()
+    cols = list()
+
+    for i, query in enumerate(queries):
         for index in index_dependencies.get_query_indexes(query):
-            vector[index_dict[index]] = 1
-        query_vectors.append(vector)
+            rows.append(i)
+            cols.append(index_dict[index])
+
+    data = np.ones(len(rows), dtype=np.float64)
+
+    return csr_matrix((data, (rows, cols)), shape=(len(queries), len(index_dict)))
+
+
+def create_query_vectors(queries, index_dependencies: QueryToIndex):
+    """
+    Creates the query vectors
+    """
+    return create_incidence_matrix(queries, index_dependencies).toarray().astype(int).tolist()
+
+
+def kmeans_labels(matrix: csr_matrix, max_clusters: int):
+    """
+    Clusters the rows of the incidence matrix using K-means
+    """
+    # K-means on sparse input follows a different code path, so the (small) matrix is densified to keep the clusters
+    # of the dense implementation
+    return KMeans(n_clusters=max_clusters, random_state=0).fit(matrix.toarray()).labels_
+
+
+def jaccard_labels(matrix: csr_matrix, max_clusters: int):
+    """
+    Clusters the rows of the incidence matrix using average-linkage agglomerative clustering on their Jaccard
+    distances. Queries with the same index set have distance 0, so they always end up in the same cluster.
+    """
+    if matrix.shape[0] < 2:
+        return np.zeros(matrix.shape[0], dtype=int)
+
+    intersections = (matrix @ matrix.T).toarray()
+    sizes = np.asarray(matrix.sum(axis=1)).ravel()
+    unions = sizes[:, None] + sizes[None, :] - intersections
+
+    # Two queries without indexes are identical
+    similarities = np.divide(intersections, unions, out=np.ones_like(intersections), where=unions > 0)
+    distances = np.clip(1 - similarities, 0, 1)
+    np.fill_diagonal(distances, 0)
+
+    linkage_matrix = linkage(squareform(distances, checks=False), method="average")
+
+    return fcluster(linkage_matrix, t=max_clusters, criterion="maxclust") - 1
+
+
+def minhash_labels(matrix: csr_matrix, max_clusters: int, num_hashes: int = 16, seed: int = 0):
+    """
+    Buckets the rows of the incidence matrix by their MinHash signatures. While there are more than max_clusters
+    buckets, the smallest bucket is merged into the bucket with the most similar signature.
+    """
+    num_queries, num_indexes = matrix.shape
+    rng = np.random.default_rng(seed)
+
+    # Every hash function is a random permutation of the index ids. Queries without indexes get the signature
+    # [num_indexes, ...]
+    signatures = np.full((num_queries, num_hashes), num_indexes, dtype=np.int64)
+    non_empty = np.diff(matrix.indptr) > 0
+
+    for h in range(num_hashes):
+        permutation = rng.permutation(num_indexes)
+        values = permutation[matrix.indices]
+        signatures[non_empty, h] = np.minimum.reduceat(values, matrix.indptr[:-1][non_empty])
+
+    bucket_signatures, labels = np.unique(signatures, axis=0, return_inverse=True)
+    labels = labels.ravel()
 
-    return query_vectors
+    # The fraction of equal signature components estimates the Jaccard similarity of the buckets
+    similarities = (bucket_signatures[:, None, :] == bucket_signatures[None, :, :]).mean(axis=2)
+    np.fill_diagonal(similarities, -1)
 
+    sizes = np.bincount(labels).astype(np.float64)
+    active = np.ones(len(sizes), dtype=bool)
 
-def generate_query_clusters(queries, index_dependencies: QueryToIndex, max_clusters: int=13):
+    while active.sum() > max_clusters:
+        smallest = np.flatnonzero(active)[np.argmin(sizes[active])]
+        candidates = np.where(active, similarities[smallest], -np.inf)
+        candidates[smallest] = -np.inf
+        target = np.argmax(candidates)
+
+        labels[labels == smallest] = target
+        sizes[target] += sizes[smallest]
+        active[smallest] = False
+
+    # Renumber the remaining buckets to 0..k-1
+    return np.unique(labels, return_inverse=True)[1].ravel()
+
+
+CLUSTERING_ALGORITHMS = {
+    "kmeans": kmeans_labels,
+    "jaccard": jaccard_labels,
+    "minhash": minhash_labels,
+}
+
+
+def generate_query_clusters(queries, index_dependencies: QueryToIndex, max_clusters: int=13,
+                            algorithm: str="kmeans"):
     """
     Generates the query clusters from the queries and the index dependencies
     """
+    if algorithm not in CLUSTERING_ALGORITHMS:
+        raise Exception(f"Unknown clustering algorithm: {algorithm}")
+
     query_groups = defaultdict(list)
 
     # First group the queries by the set of indexes they use
@@ -86,42 +186,97 @@ def generate_query_clusters(queries, index_dependencies: QueryToIndex, max_clust
         query_clusters.append(QueryCluster(cluster_id=cluster_id, queries=query_groups[group], indexes=group))
         cluster_id += 1
 
-    # Reduce the number of clusters if necessary using K-means clustering
+    # Reduce the number of clusters if necessary
     if len(query_clusters) > max_clusters:
         new_query_clusters = list()
 
-        # Create query vectors according to the index dependencies
-        query_vectors = create_query_vectors(queries, index_dependencies)
-
-        # K-means clustering
-        from sklearn.cluster import KMeans
-        import numpy as np
-        kmeans = KMeans(n_clusters=max_clusters, random_state=0).fit(np.array(query_vectors))
+        # Create the query x index incidence matrix according to the index dependencies
+        matrix = create_incidence_matrix(queries, index_dependencies)
+        labels = CLUSTERING_ALGORITHMS[algorithm](matrix, max_clusters)
 
         # Print clusters
         logging.debug("Clusters:")
-        num_queries = 0
         for cluster_id in range(0, max_clusters):
-            cluster_vectors = list()
+            members = np.flatnonzero(labels == cluster_id)
+
+            if algorithm != "kmeans" and len(members) == 0:
+                continue
+
             cluster_queries = list()
             cluster_indexes = set()
 
-            for j in range(0, len(kmeans.labels_)):
-                if kmeans.labels_[j] == cluster_id:
-                    cluster_vectors.append(query_vectors[j])
-                    cluster_queries.append(queries[j])
-                    cluster_indexes = cluster_indexes.union(index_dependencies.get_query_indexes(queries[j]))
-                    num_queries += 1
+            for j in members:
+                cluster_queries.append(queries[j])
+                cluster_indexes = cluster_indexes.union(index_dependencies.get_query_indexes(queries[j]))
 
             new_query_clusters.append(QueryCluster(
                 cluster_id=cluster_id,
                 queries=cluster_queries,
                 indexes=cluster_indexes))
 
-            logging.debug(f"Cluster {cluster_id} (size: {len(cluster_vectors)}):")
-            for vector in cluster_vectors:
-                logging.debug(vector)
+            logging.debug(f"Cluster {cluster_id} (size: {len(members)}): {cluster_queries}")
 
         query_clusters = new_query_clusters
 
     return query_clusters
+
+
+class QueryClusterer:
+    """
+    Memoizes the query clusters by the remaining queries and their index sets, so that the clusters are only
+    computed again when the queries left or the query->index map change.
+    """
+    def __init__(self, max_clusters: int=13, algorithm: str="kmeans"):
+        """
+        @param max_clusters: The maximum number of clusters
+        @param algorithm: The clustering algorithm (kmeans, jaccard or minhash)
+        """
+        if algorithm not in CLUSTERING_ALGORITHMS:
+            raise Exception(f"Unknown clustering algorithm: {algorithm}")
+
+        self.max_clusters = max_clusters
+        self.algorithm = algorithm
+        self.clusters = dict()
+        self.lock = threading.Lock()
+
+        self.metrics = {
+            "clustering_time": 0.0,
+            "cache_hits": 0,
+            "cache_misses": 0,
+        }
+
+    def get_clusters(self, queries, index_dependencies: QueryToIndex):
+        """
+        Returns the query clusters of the queries
+        """
+        start = time.time()
+        key = tuple((query, frozenset(index_dependencies.get_query_indexes(query))) for query in queries)
+
+        with self.lock:
+            clusters = self.clusters.get(key)
+
+        cache_hit = clusters is not None
+
+        if not cache_hit:
+            clusters = generate_query_clusters(list(queries), index_dependencies, max_clusters=self.max_clusters,
+                                               algorithm=self.algorithm)
+
+            with self.lock:
+                self.clusters[key] = clusters
+
+        elapsed = time.time() - start
+
+        with self.lock:
+            self.metrics["clustering_time"] += elapsed
+            self.metrics["cache_hits" if cache_hit else "cache_misses"] += 1
+
+        logging.debug(f"Clustering {len(key)} queries took {elapsed}s (cache hit: {cache_hit})")
+
+        return clusters, elapsed
+
+    def get_metrics(self):
+        """
+        Returns the total clustering time and the number of cache hits/misses
+        """
+        with self.lock:
+            return dict(self.metrics)
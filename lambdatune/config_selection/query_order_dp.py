@@ -1,7 +1,6 @@
 import sys
 import logging
 
-from itertools import combinations
 from collections import defaultdict
 
 
@@ -118,80 +117,294 @@ class QuerySetMeta:
         return c
 
 
-def compute_optimal_order(queries, index_dependencies, cost_map, frequency: dict=None):
-    meta = QuerySetMeta(queries, index_dependencies, cost_map)
+class OrderingProblem:
+    """
+    Integer (bitmask) representation of a query ordering problem. Queries and indexes are assigned bit positions, so
+    the index set of a query set is an integer and its creation cost is computed with lookup tables, without any
+    Python sets in the inner loops.
+    """
+    CHUNK_BITS = 8
 
-    if frequency:
-        n = sum(frequency.values())
-    else:
-        n = len(queries)
+    def __init__(self, queries, index_dependencies, cost_map, frequency: dict = None):
+        """
+        :param queries: The list of input queries
+        :param index_dependencies: The map with the query->index-set dependencies
+        :param cost_map: The cost map, i.e. cost of creating the index cost_map[index]
+        :param frequency: The frequency of every query (1 if missing)
+        """
+        self.queries = list(queries)
 
-    dp_cost = defaultdict(int)
-    dp_order = defaultdict(list)
-    dp_cost_numerator = defaultdict(int)
+        if frequency:
+            self.n = sum(frequency.values())
+        else:
+            self.n = len(self.queries)
 
-    subset_mask = None
+        index_ids = dict()
 
-    # Initialize with individual queries (sets of cardinality = 1)
-    for query in queries:
-        query_mask = meta.get_query_set_mask([query])
-        meta.add_query_set([query])
+        for query in self.queries:
+            for index in index_dependencies[query]:
+                if index not in cost_map:
+                    raise Exception(f"Index {index} did not found in the cost map")
 
-        dp_cost[query_mask] = (meta.get_query_cost(0, query) / n)
+                if index not in index_ids:
+                    index_ids[index] = len(index_ids)
 
-        if frequency and query in frequency:
-            dp_cost[query_mask] = dp_cost[query_mask] * (frequency[query])
+        # The index bitmask and the weight of every query
+        self.query_masks = list()
+        self.weights = list()
 
-        dp_cost_numerator[query_mask] = meta.get_query_cost(0, query)
-        dp_order[query_mask] = [query]
+        for query in self.queries:
+            mask = 0
+            for index in index_dependencies[query]:
+                mask |= 1 << index_ids[index]
 
-    # Enumerate all subsets of cardinality i
-    for i in range(2, n + 1):
-        subsets = list(combinations(queries, i))
+            self.query_masks.append(mask)
+            self.weights.append(frequency[query] if frequency and query in frequency else 1)
 
-        logging.debug(f"#Subsets: {len(subsets)}")
+        # cost_tables[i][chunk] is the total cost of the indexes set in the i-th CHUNK_BITS-wide chunk of a mask
+        index_costs = [0] * len(index_ids)
+        for index, index_id in index_ids.items():
+            index_costs[index_id] = cost_map[index]
 
-        for subset in subsets:
-            subset_mask = meta.get_query_set_mask(subset)
-            subset_mask_readable = "{:08b}".format(subset_mask)
+        chunk_size = 1 << self.CHUNK_BITS
+        self.cost_tables = list()
 
-            meta.add_query_set(subset)
+        for offset in range(0, len(index_costs), self.CHUNK_BITS):
+            chunk_costs = index_costs[offset:offset + self.CHUNK_BITS]
+            table = [0] * chunk_size
 
-            ans = sys.maxsize
-            best_order = None
+            for chunk in range(1, chunk_size):
+                low_bit = (chunk & -chunk).bit_length() - 1
+                table[chunk] = table[chunk & (chunk - 1)] + (chunk_costs[low_bit] if low_bit < len(chunk_costs) else 0)
 
-            for query in subset:
-                # For each query in the subset, try removing a query q
-                # Try out subtracting every query from the subset, and adding it again using the optimal cost
-                # of the previously computed {subset} - {query}.
-                subset_without_query = subset_mask & ~(1 << meta.get_query_id(query))
+            self.cost_tables.append(table)
 
-                query_cost = meta.get_query_cost(subset_without_query, query)
+    def get_mask_cost(self, index_mask: int):
+        """
+        Returns the total creation cost of the indexes in index_mask
+        """
+        cost = 0
+        chunk_mask = (1 << self.CHUNK_BITS) - 1
+
+        for table in self.cost_tables:
+            if not index_mask:
+                break
+
+            cost += table[index_mask & chunk_mask]
+            index_mask >>= self.CHUNK_BITS
+
+        return cost
+
+    def get_order_cost(self, order: list[int]):
+        """
+        Returns the cost of an order of query positions
+        """
+        cost = 0
+        index_mask = 0
+
+        for q in order:
+            index_mask |= self.query_masks[q]
+            cost += self.weights[q] * self.get_mask_cost(index_mask) / self.n
+
+        return cost
+
+    def get_lower_bound(self, index_mask: int, remaining_weight: int):
+        """
+        Lower bound of the cost of the remaining queries, given the indexes created so far: every remaining query
+        waits at least for the indexes created so far.
+        """
+        return remaining_weight * self.get_mask_cost(index_mask) / self.n
+
+    def get_tight_lower_bound(self, index_mask: int, remaining: list[int]):
+        """
+        Tighter (and more expensive) lower bound of the cost of the remaining queries: every remaining query waits
+        at least for the indexes created so far and its own indexes.
+        """
+        return sum(self.weights[q] * self.get_mask_cost(index_mask | self.query_masks[q]) for q in remaining) / self.n
+
+
+def compute_exact_order(problem: OrderingProblem):
+    """
+    Bitmask dynamic programming over all query subsets: dp[S] = min_q(dp[S - {q}] + w_q * cost(indexes(S)) / n).
+    Every subset S - {q} is smaller than S, so the subsets can be visited in increasing order of their mask.
+    :param problem: The ordering problem
+    :return: The cost and the order (query positions)
+    """
+    num_queries = len(problem.queries)
+    full_mask = (1 << num_queries) - 1
+
+    index_masks = [0] * (full_mask + 1)
+    dp_cost = [0] * (full_mask + 1)
+    dp_last = [0] * (full_mask + 1)
+
+    query_masks = problem.query_masks
+    weights = problem.weights
+    n = problem.n
+
+    for subset_mask in range(1, full_mask + 1):
+        low_bit = subset_mask & -subset_mask
+        index_masks[subset_mask] = index_masks[subset_mask ^ low_bit] | query_masks[low_bit.bit_length() - 1]
+
+        subset_cost = problem.get_mask_cost(index_masks[subset_mask]) / n
+
+        best_cost = sys.maxsize
+        best_last = 0
+        bits = subset_mask
+
+        while bits:
+            bit = bits & -bits
+            bits ^= bit
+            q = bit.bit_length() - 1
+
+            cost = dp_cost[subset_mask ^ bit] + weights[q] * subset_cost
+
+            if cost < best_cost:
+                best_cost = cost
+                best_last = q
+
+        dp_cost[subset_mask] = best_cost
+        dp_last[subset_mask] = best_last
+
+    order = list()
+    subset_mask = full_mask
+
+    while subset_mask:
+        q = dp_last[subset_mask]
+        order.append(q)
+        subset_mask ^= 1 << q
+
+    order.reverse()
+
+    return dp_cost[full_mask], order
+
+
+def compute_beam_order(problem: OrderingProblem, beam_width: int):
+    """
+    Beam search: extends the beam_width best partial orders by one query at a time, ranking the partial orders by
+    their cost plus the lower bound of the remaining queries. With beam_width=1 this is a greedy order.
+    :param problem: The ordering problem
+    :param beam_width: The number of partial orders kept at every step
+    :return: The cost and the order (query positions)
+    """
+    num_queries = len(problem.queries)
 
-                new_total_cost = (dp_cost_numerator[subset_without_query] + query_cost) / n
+    # (cost, query subset mask, index mask, order, remaining weight)
+    beam = [(0, 0, 0, [], sum(problem.weights))]
 
-                if frequency and query in frequency:
-                    new_total_cost += ((dp_cost_numerator[subset_without_query] + query_cost) / n) * (frequency[query] - 1)
+    for _ in range(num_queries):
+        candidates = dict()
 
-                # Compute the cost as the sum of the optimal cost of the queries {subset} - {query}
-                cost = dp_cost[subset_without_query] + new_total_cost
+        for cost, subset_mask, index_mask, order, remaining_weight in beam:
+            for q in range(num_queries):
+                if subset_mask & (1 << q):
+                    continue
 
-                # Keep the best cost
-                if cost < ans:
-                    ans = cost
-                    # Keep the associated sub-order
-                    order = list(dp_order[subset_without_query])
-                    order.append(query)
-                    best_order = order
-                    cost_numerator = dp_cost_numerator[subset_without_query] + query_cost
+                new_subset_mask = subset_mask | (1 << q)
+                new_index_mask = index_mask | problem.query_masks[q]
+                new_cost = cost + problem.weights[q] * problem.get_mask_cost(new_index_mask) / problem.n
 
-            dp_cost[subset_mask] = ans
-            dp_order[subset_mask] = best_order
-            dp_cost_numerator[subset_mask] = cost_numerator
+                # Keep only the cheapest partial order per query subset
+                if new_subset_mask not in candidates or new_cost < candidates[new_subset_mask][0]:
+                    candidates[new_subset_mask] = (new_cost, new_subset_mask, new_index_mask, order + [q],
+                                                   remaining_weight - problem.weights[q])
 
-        logging.debug(f"Finished with subset of size: {i}")
+        beam = sorted(candidates.values(),
+                      key=lambda candidate: candidate[0] + problem.get_lower_bound(candidate[2], candidate[4]))
+        beam = beam[:beam_width]
 
-    return dp_cost[subset_mask], dp_order[subset_mask]
+    return beam[0][0], beam[0][3]
+
+
+def compute_branch_and_bound_order(problem: OrderingProblem, best_cost: float, best_order: list[int],
+                                   max_nodes: int):
+    """
+    Depth-first branch-and-bound, starting from a known solution. Partial orders are pruned when their cost plus the
+    lower bound of the remaining queries cannot improve the best solution, or when a cheaper partial order of the
+    same query subset has been seen. Stops after max_nodes expanded nodes.
+    :param problem: The ordering problem
+    :param best_cost: The cost of the known solution
+    :param best_order: The known solution
+    :param max_nodes: The maximum number of nodes to expand
+    :return: The cost and the order (query positions)
+    """
+    num_queries = len(problem.queries)
+    best_order = list(best_order)
+    seen = dict()
+    nodes = 0
+
+    # (cost, query subset mask, index mask, order)
+    stack = [(0, 0, 0, [])]
+
+    while stack and nodes < max_nodes:
+        cost, subset_mask, index_mask, order = stack.pop()
+        nodes += 1
+
+        if len(order) == num_queries:
+            if cost < best_cost:
+                best_cost = cost
+                best_order = order
+            continue
+
+        remaining = [q for q in range(num_queries) if not subset_mask & (1 << q)]
+        children = list()
+
+        for q in remaining:
+            new_subset_mask = subset_mask | (1 << q)
+            new_index_mask = index_mask | problem.query_masks[q]
+            new_cost = cost + problem.weights[q] * problem.get_mask_cost(new_index_mask) / problem.n
+
+            if seen.get(new_subset_mask, sys.maxsize) <= new_cost:
+                continue
+
+            bound = new_cost + problem.get_tight_lower_bound(new_index_mask, [r for r in remaining if r != q])
+
+            if bound >= best_cost:
+                continue
+
+            seen[new_subset_mask] = new_cost
+            children.append((bound, new_cost, new_subset_mask, new_index_mask, order + [q]))
+
+        # Explore the most promising child first
+        children.sort(key=lambda child: child[0], reverse=True)
+        stack.extend(child[1:] for child in children)
+
+    logging.debug(f"Branch-and-bound expanded {nodes} nodes")
+
+    return best_cost, best_order
+
+
+def compute_optimal_order(queries, index_dependencies, cost_map, frequency: dict=None, max_exact_size: int=16,
+                          beam_width: int=8, max_bnb_size: int=32, max_bnb_nodes: int=5000):
+    """
+    Computes the order of the queries that minimizes the (frequency-weighted) cost of the indexes each query waits
+    for. Up to max_exact_size queries, the order is computed exactly with a bitmask DP. Above that, a beam search
+    computes the order, which is then improved with a bounded branch-and-bound for up to max_bnb_size queries.
+    :param queries: The queries
+    :param index_dependencies: The map with the query->index-set dependencies
+    :param cost_map: The cost map, i.e. cost of creating the index cost_map[index]
+    :param frequency: The frequency of every query
+    :param max_exact_size: The maximum number of queries that are ordered exactly
+    :param beam_width: The beam width of the heuristic search
+    :param max_bnb_size: The maximum number of queries for which the branch-and-bound runs
+    :param max_bnb_nodes: The maximum number of nodes the branch-and-bound expands
+    :return: The cost and the order
+    """
+    problem = OrderingProblem(queries, index_dependencies, cost_map, frequency)
+
+    if not problem.queries:
+        return 0, []
+
+    if len(problem.queries) <= max_exact_size:
+        cost, order = compute_exact_order(problem)
+    else:
+        cost, order = compute_beam_order(problem, beam_width)
+        logging.debug(f"Beam search order cost: {cost}")
+
+        if len(problem.queries) <= max_bnb_size:
+            cost, order = compute_branch_and_bound_order(problem, cost, order, max_bnb_nodes)
+            logging.debug(f"Branch-and-bound order cost: {cost}")
+
+    return cost, [problem.queries[q] for q in order]
 
 
 def compute_order_cost(order, index_dependencies, cost_map, frequency: dict):
@@ -222,4 +435,90 @@ def compute_order_cost(order, index_dependencies, cost_map, frequency: dict):
         if frequency and query in frequency:
             cost += (frequency[query] - 1) * (numerator / n)
 
-    return cost
\ No newline at end of file
+    return cost
+
+def compute_min_churn_order(configs, config_indexes, cost_map, initial_indexes: set = frozenset(),
+                            max_exact_size: int = 12):
+    """
+    Computes the order of the configurations that minimizes the total cost of the indexes that have to be created
+    when moving from one configuration to the next (i.e., the indexes of the next configuration that are not present
+    already). Uses dynamic programming over (subset, last configuration) for up to max_exact_size configurations,
+    and a greedy nearest-neighbor order above that.
+    :param configs: The configuration ids
+    :param config_indexes: The map with the config->index-set dependencies
+    :param cost_map: The cost of creating an index, cost_map[index]. Missing indexes cost 1.
+    :param initial_indexes: The indexes that are present before the first configuration
+    :return: The cost and the order
+    """
+    configs = list(configs)
+    n = len(configs)
+
+    def transition_cost(present, config):
+        return sum(cost_map.get(index, 1) for index in config_indexes[config] if index not in present)
+
+    if n == 0:
+        return 0, []
+
+    if n > max_exact_size:
+        order = list()
+        cost = 0
+        present = initial_indexes
+        remaining = list(configs)
+
+        while remaining:
+            config = min(remaining, key=lambda c: transition_cost(present, c))
+            cost += transition_cost(present, config)
+            present = config_indexes[config]
+            order.append(config)
+            remaining.remove(config)
+
+        return cost, order
+
+    # Pairwise transition costs
+    first_cost = [transition_cost(initial_indexes, config) for config in configs]
+    pair_cost = [[transition_cost(config_indexes[configs[i]], configs[j]) for j in range(n)] for i in range(n)]
+
+    full_mask = (1 << n) - 1
+    dp_cost = defaultdict(lambda: sys.maxsize)
+    dp_parent = dict()
+
+    for i in range(n):
+        dp_cost[(1 << i, i)] = first_cost[i]
+
+    for mask in range(1, full_mask + 1):
+        for last in range(n):
+            if not mask & (1 << last) or (mask, last) not in dp_cost:
+                continue
+
+            cost = dp_cost[(mask, last)]
+
+            for nxt in range(n):
+                if mask & (1 << nxt):
+                    continue
+
+                new_mask = mask | (1 << nxt)
+                new_cost = cost + pair_cost[last][nxt]
+
+                if new_cost < dp_cost[(new_mask, nxt)]:
+                    dp_cost[(new_mask, nxt)] = new_cost
+                    dp_parent[(new_mask, nxt)] = last
+
+    last = min(range(n), key=lambda i: dp_cost[(full_mask, i)])
+    best_cost = dp_cost[(full_mask, last)]
+
+    order = list()
+    mask = full_mask
+
+    while True:
+        order.append(configs[last])
+
+        if (mask, last) not in dp_parent:
+            break
+
+        parent = dp_parent[(mask, last)]
+        mask = mask & ~(1 << last)
+        last = parent
+
+    order.reverse()
+
+    return best_cost, order
@@ -1,7 +1,12 @@
+import logging
 from collections import defaultdict
 
 import re
 
+import sqlglot
+
+from sqlglot import exp
+
 from lambdatune.config_selection.index import Index
 
 
@@ -16,16 +21,95 @@ class QueryToIndex:
         return self.query_to_index[query]
 
 
-def queries_to_index(queries: list[str], create_index_commands: list[str]):
+class QueryColumnMap:
+    """
+    An inverted index from the table.column references of a workload to the queries that contain them. Every query
+    is parsed once, so the map can be built once per workload and reused across configurations and rounds.
+    """
+    def __init__(self, queries, schema: dict = None):
+        """
+        @param queries: The (query_id, query_str) pairs of the workload
+        @param schema: The database schema (table -> columns), used to resolve unqualified columns
+        """
+        self.schema = dict((table.lower(), set(col.lower() for col in cols)) for table, cols in (schema or {}).items())
+
+        # table.column -> query ids
+        self.column_to_queries = defaultdict(set)
+
+        # Queries that could not be parsed fall back to matching table and column names in the query text
+        self.unparsed_queries = dict()
+        self.patterns = dict()
+
+        for query_id, query_str in queries:
+            self.add_query(query_id, query_str)
+
+    def add_query(self, query_id, query_str: str):
+        try:
+            expression = sqlglot.parse_one(query_str, read="postgres")
+        except Exception as e:
+            logging.warning(f"Could not parse query {query_id}, falling back to text matching: {e}")
+            self.unparsed_queries[query_id] = query_str
+            return
+
+        alias_to_table = dict()
+
+        for table in expression.find_all(exp.Table):
+            alias_to_table[table.alias_or_name.lower()] = table.name.lower()
+
+        tables = set(alias_to_table.values())
+
+        for column in expression.find_all(exp.Column):
+            column_name = column.name.lower()
+
+            if column.table:
+                table = alias_to_table.get(column.table.lower())
+
+                if table:
+                    self.column_to_queries[f"{table}.{column_name}"].add(query_id)
+
+                continue
+
+            # Unqualified column: it belongs to the query's tables that have such a column, or, without a schema,
+            # to any of them
+            for table in tables:
+                if not self.schema or column_name in self.schema.get(table, ()):
+                    self.column_to_queries[f"{table}.{column_name}"].add(query_id)
+
+    def get_pattern(self, name: str):
+        if name not in self.patterns:
+            self.patterns[name] = re.compile(rf'\b{re.escape(name)}\b')
+
+        return self.patterns[name]
+
+    def get_queries(self, table_name: str, column_name: str):
+        """
+        Returns the ids of the queries that reference table_name.column_name
+        """
+        queries = set(self.column_to_queries.get(f"{table_name}.{column_name}".lower(), ()))
+
+        for query_id, query_str in self.unparsed_queries.items():
+            if self.get_pattern(column_name).search(query_str) and self.get_pattern(table_name).search(query_str):
+                queries.add(query_id)
+
+        return queries
+
+
+def queries_to_index(queries: list[str], create_index_commands: list[str], column_map: QueryColumnMap = None):
     """
     Returns a map from query to the indexes that can be used for that query.
     @param queries: The queries to be executed
     @param create_index_commands: The create index commands
+    @param column_map: The column map of the queries. It is built from the queries if not given.
     @return:
     """
     index_map = defaultdict(set)
     query_to_index = QueryToIndex()
 
+    if column_map is None:
+        column_map = QueryColumnMap(queries)
+
+    query_ids = set(p[0] for p in queries)
+
     for index in create_index_commands:
         index_name = index.split(" ")[2].strip()
         table_column = index.split(" ON ")[1].strip()
@@ -35,11 +119,8 @@ def queries_to_index(queries: list[str], create_index_commands: list[str]):
         index_obj = Index(index_name, table_name, column_name)
         index_map[f"{table_name}.{column_name}"] = index_obj
 
-        for p in list(queries):
-            query_id = p[0]
-            query_str = p[1]
-
-            if re.search(rf'\b{column_name}\b', query_str) and re.search(rf'\b{table_name}\b', query_str):
+        for query_id in column_map.get_queries(table_name, column_name):
+            if query_id in query_ids:
                 query_to_index.add_index_to_query(query_id, index_obj)
 
     return query_to_index
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+REPORTS_FILE = "reports.jsonl"
+BLOBS_FILE = "report_blobs.jsonl"
+LEGACY_REPORTS_FILE = "reports.json"
+
+# Report fields that are large and rarely change between reports. They are stored once, by content hash.
+BLOB_FIELDS = ("driver_config", "created_indexes")
+
+BLOB_REF_KEY = "$blob"
+
+
+def get_content_hash(value):
+    """
+    Returns the hash of a JSON-serializable value
+    """
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode()).hexdigest()
+
+
+class ReportSink:
+    """
+    Appends the reports of the configuration selection to a JSON Lines file (one report per line), instead of
+    re-reading and re-writing a JSON array after every configuration. The large fields of a report (BLOB_FIELDS) are
+    replaced by a reference to their content hash, and every distinct value is written once to a separate blob file.
+    The files are flushed after every report, and fsync'ed every fsync_every reports or fsync_interval seconds.
+    """
+    def __init__(self, results_dir: str, fsync_every: int = 10, fsync_interval: float = 5.0,
+                 blob_fields: tuple = BLOB_FIELDS):
+        """
+        @param results_dir: The directory of the reports
+        @param fsync_every: The number of reports after which the files are fsync'ed
+        @param fsync_interval: The number of seconds after which the files are fsync'ed
+        @param blob_fields: The report fields that are stored by content hash
+        """
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.blob_fields = blob_fields
+        self.lock = threading.Lock()
+
+        os.makedirs(results_dir, exist_ok=True)
+
+        blobs_path = os.path.join(results_dir, BLOBS_FILE)
+
+        # The blobs written by a previous run into the same directory
+        self.blob_hashes = set(read_blobs(blobs_path).keys())
+
+        self.reports_file = open(os.path.join(results_dir, REPORTS_FILE), "a")
+        self.blobs_file = open(blobs_path, "a")
+
+        self.unsynced_reports = 0
+        self.last_sync = time.time()
+
+    def write(self, report: dict):
+        """
+        Appends a report
+        """
+        report = dict(report)
+
+        with self.lock:
+            for field in self.blob_fields:
+                if field not in report or report[field] is None:
+                    continue
+
+                blob_hash = get_content_hash(report[field])
+
+                if blob_hash not in self.blob_hashes:
+                    self.blobs_file.write(json.dumps({"hash": blob_hash, "value": report[field]}) + "\n")
+                    self.blobs_file.flush()
+                    self.blob_hashes.add(blob_hash)
+
+                report[field] = {BLOB_REF_KEY: blob_hash}
+
+            self.reports_file.write(json.dumps(report) + "\n")
+            self.reports_file.flush()
+
+            self.unsynced_reports += 1
+
+            if self.unsynced_reports >= self.fsync_every or time.time() - self.last_sync >= self.fsync_interval:
+                self.sync()
+
+    def sync(self):
+        """
+        Forces the written reports to disk
+        """
+        os.fsync(self.blobs_file.fileno())
+        os.fsync(self.reports_file.fileno())
+
+        self.unsynced_reports = 0
+        self.last_sync = time.time()
+
+    def close(self):
+        with self.lock:
+            if self.reports_file.closed:
+                return
+
+            self.sync()
+            self.reports_file.close()
+            self.blobs_file.close()
+
+
+def read_blobs(blobs_path: str):
+    """
+    Returns the blobs (hash -> value) of a blob file
+    """
+    blobs = dict()
+
+    if not os.path.exists(blobs_path):
+        return blobs
+
+    with open(blobs_path, "r") as f:
+        for line in f:
+            line = line.strip()
+
+            # A line can be incomplete if the process was killed while writing it
+            try:
+                blob = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+            blobs[blob["hash"]] = blob["value"]
+
+    return blobs
+
+
+def get_reports_dir(path: str):
+    """
+    Returns the reports directory of a path, which is either the directory or a reports file in it
+    """
+    if os.path.isdir(path):
+        return path
+
+    return os.path.dirname(path) or "."
+
+
+def reports_exist(path: str):
+    """
+    Returns true if there are reports (in either format) at the given reports directory or reports.json path
+    """
+    reports_dir = get_reports_dir(path)
+
+    return os.path.exists(os.path.join(reports_dir, REPORTS_FILE)) or \
+        os.path.exists(os.path.join(reports_dir, LEGACY_REPORTS_FILE))
+
+
+def read_reports(path: str, resolve_blobs: bool = True):
+    """
+    Reads the reports of a configuration selection run as a list of dicts, as they used to be stored in reports.json.
+    Works for both the JSON Lines reports and the legacy reports.json files.
+    @param path: The reports directory, or the path of its reports.json
+    @param resolve_blobs: Replace the blob references with their values
+    @return: The list of reports
+    """
+    reports_dir = get_reports_dir(path)
+    reports_path = os.path.join(reports_dir, REPORTS_FILE)
+
+    if not os.path.exists(reports_path):
+        with open(os.path.join(reports_dir, LEGACY_REPORTS_FILE), "r") as f:
+            return json.load(f)
+
+    blobs = read_blobs(os.path.join(reports_dir, BLOBS_FILE)) if resolve_blobs else dict()
+    reports = list()
+
+    with open(reports_path, "r") as f:
+        for line in f:
+            line = line.strip()
+
+            if not line:
+                continue
+
+            try:
+                report = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+            if resolve_blobs:
+                for field, value in report.items():
+                    if isinstance(value, dict) and BLOB_REF_KEY in value:
+                        report[field] = blobs.get(value[BLOB_REF_KEY])
+
+            reports.append(report)
+
+    return reports
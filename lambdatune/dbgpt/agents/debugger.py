@@ -1,10 +1,40 @@
+import json
+import re
+
 from typing import Optional, Any
 
 from langchain_core.callbacks import CallbackManagerForToolRun, AsyncCallbackManagerForToolRun
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
 from langchain_core.tools import BaseTool
-from langchain_openai import ChatOpenAI
 
-from langgraph.prebuilt import create_react_agent
+from lambdatune.llm.providers import LLMProvider, get_message_content
+
+SETTING_PATTERN = re.compile(r"^\s*(?:ALTER\s+SYSTEM\s+)?SET\s+(\w+)\s*(?:=|TO)\s*(.+?);?\s*$", re.IGNORECASE)
+EXECUTION_TIME_PATTERN = re.compile(r"Execution Time:\s*([\d.]+)\s*ms")
+
+# The contexts (pg_settings.context) of the parameters that can be changed in a session
+SESSION_CONTEXTS = ("user", "superuser")
+
+
+def get_session_settings(response: str):
+    """
+    Extracts the settings of an LLM response (either {"commands": [...]} or plain text) as session-level SET
+    statements, one per line. Other commands (e.g., CREATE INDEX) are ignored.
+    """
+    try:
+        lines = json.loads(response)["commands"]
+    except (json.JSONDecodeError, KeyError, TypeError):
+        lines = response.splitlines()
+
+    settings = list()
+
+    for line in lines:
+        match = SETTING_PATTERN.match(str(line))
+
+        if match:
+            settings.append(f"SET {match.group(1)} = {match.group(2)};")
+
+    return "\n".join(settings)
 
 class PostgresDBExplorer(BaseTool):
     """Tool that allows you to execute queries against a Postgres database."""
@@ -36,16 +66,65 @@ class PostgresDBExplorer(BaseTool):
             settings (str): The settings to apply to the query execution. Should be provided as a string
              with \n linebreaks and a semicolon at the end of each setting.
         """
+        result = ""
+
+        # The settings of the previous calls are undone, so that every plan is measured with its own settings only
+        self._cursor.execute("RESET ALL;")
+
         for setting in settings.splitlines():
-            if setting.strip():
-                self._cursor.execute(setting.strip())
+            setting = setting.strip()
+
+            if setting:
+                error = self.apply_setting(setting)
+
+                if error:
+                    result += error + "\n"
 
         self._cursor.execute("EXPLAIN ANALYZE " + self._query)
-        result = ""
         for row in self._cursor.fetchall():
             result += str(row[0]) + "\n"
         return result
 
+    def get_setting_context(self, name: str):
+        """
+        Returns the context of a parameter (pg_settings.context), or None if the parameter is unknown
+        """
+        self._cursor.execute("SELECT context FROM pg_settings WHERE name = %s", (name.lower(),))
+        row = self._cursor.fetchone()
+
+        return row[0] if row else None
+
+    def apply_setting(self, setting: str):
+        """
+        Applies a setting to the session. Parameters that cannot be changed in a session (e.g., shared_buffers) are
+        skipped.
+        @return: None if the setting was applied, or the reason why it was not, which is reported back to the LLM
+        """
+        match = SETTING_PATTERN.match(setting)
+
+        try:
+            if match:
+                context = self.get_setting_context(match.group(1))
+
+                if context is None:
+                    return f"Skipped \"{setting}\": unknown parameter {match.group(1)}"
+
+                if context not in SESSION_CONTEXTS:
+                    return f"Skipped \"{setting}\": {match.group(1)} cannot be changed in a session " \
+                           f"(context: {context})"
+
+            self._cursor.execute(setting)
+        except Exception as e:
+            # A failed statement aborts the transaction of a connection without autocommit
+            connection = getattr(self._cursor, "connection", None)
+
+            if connection is not None and not getattr(connection, "autocommit", True):
+                connection.rollback()
+
+            return f"Failed \"{setting}\": {str(e).strip()}"
+
+        return None
+
     async def _arun(
         self,
         run_manager: Optional[AsyncCallbackManagerForToolRun] = None,
@@ -55,14 +134,27 @@ class PostgresDBExplorer(BaseTool):
         return None
 
 class DebuggingAgent:
-    def __init__ (self, query, cursor, fast_plan, slow_plan):
-        tools = [PostgresDBExplorer(query=query, cursor=cursor)]
+    def __init__ (self, query, cursor, fast_plan, slow_plan, provider: LLMProvider = None, max_steps: int = 5):
+        """
+        @param provider: The LLM provider (see lambdatune.llm.providers). If None, the agent is driven by ChatOpenAI.
+        @param max_steps: The maximum number of settings the provider is asked for
+        """
+        self.explorer = PostgresDBExplorer(query=query, cursor=cursor)
+        self.provider = provider
+        self.max_steps = max_steps
 
-        # Choose the LLM that will drive the agent
-        llm = ChatOpenAI(model="gpt-4-turbo-preview")
         prompt = "You are a Database Administrator and a helpful assistant. You can execute queries against a Postgres database and search the web for information."
 
-        self.agent_executor = create_react_agent(llm, tools, prompt=prompt)
+        if provider is None:
+            from langchain_openai import ChatOpenAI
+            from langgraph.prebuilt import create_react_agent
+
+            # Choose the LLM that will drive the agent
+            llm = ChatOpenAI(model="gpt-4-turbo-preview")
+
+            self.agent_executor = create_react_agent(llm, [self.explorer], prompt=prompt)
+
+        self.system_instruction = prompt
 
         self.prompt =  f"""
         My query suddenly started running very slow. Here is the fastest plan we've seen for that query:
@@ -85,5 +177,52 @@ class DebuggingAgent:
         """
 
     def debug(self):
-        r = self.agent_executor.invoke({"messages": [("user", self.prompt)]})
-        return r["messages"]
\ No newline at end of file
+        if self.provider is None:
+            r = self.agent_executor.invoke({"messages": [("user", self.prompt)]})
+            return r["messages"]
+
+        return self.debug_with_provider()
+
+    def debug_with_provider(self):
+        """
+        Drives the explorer tool with the LLM provider: asks for settings, runs the query with them, and sends the
+        resulting plan back, until the provider repeats itself or max_steps is reached. Returns the messages in the
+        same shape as the react agent (AIMessage with tool_calls, followed by the ToolMessage of every call).
+        """
+        messages = [HumanMessage(content=self.prompt)]
+        prompt = self.prompt
+        tried_settings = list()
+        best = None
+
+        for step in range(0, self.max_steps):
+            response = self.provider.complete(prompt, temperature=0.2, sample_index=step,
+                                              system_instruction=self.system_instruction)
+            settings = get_session_settings(get_message_content(response))
+
+            if not settings or settings in tried_settings:
+                break
+
+            tried_settings.append(settings)
+            call_id = f"call_{step}"
+
+            messages.append(AIMessage(content="", tool_calls=[{"name": self.explorer.name,
+                                                               "args": {"settings": settings},
+                                                               "id": call_id}]))
+
+            plan = self.explorer._run(settings)
+            messages.append(ToolMessage(content=plan, tool_call_id=call_id))
+
+            match = EXECUTION_TIME_PATTERN.search(plan)
+
+            if match and (best is None or float(match.group(1)) < best[0]):
+                best = (float(match.group(1)), settings)
+
+            prompt = f"{self.prompt}\n\nWith the settings:\n{settings}\n\nthe plan is:\n{plan}\n" \
+                     f"Suggest different settings."
+
+        if best:
+            messages.append(AIMessage(content=f"The best settings found ({best[0]} ms):\n{best[1]}"))
+        else:
+            messages.append(AIMessage(content="No better settings were found."))
+
+        return messages
\ No newline at end of file
@@ -3,6 +3,7 @@ import streamlit as st
 from langchain_core.messages import ToolMessage, AIMessage
 
 from lambdatune.dbgpt.agents.debugger import DebuggingAgent
+from lambdatune.llm.providers import PROVIDERS, create_provider
 from lambdatune.utils import get_dbms_driver
 from lambdatune.dbgpt.ui.common import QueryMetadataHandler
 
@@ -19,6 +20,11 @@ with st.sidebar:
     st.subheader('Database Systems')
     selected_dbms = st.sidebar.selectbox('Choose a Database System', ['Postgres'], key='selected_dbms')
 
+    # openai drives the agent with ChatOpenAI, the other providers with the provider loop of the agent
+    st.subheader('LLM Provider')
+    selected_provider = st.sidebar.selectbox('Choose an LLM Provider', ['openai'] + sorted(PROVIDERS.keys()),
+                                             key='selected_provider')
+
     # Executed queries
     st.markdown("### Executed Queries")
     executed_queries = handler.get_all_executed_queries()
@@ -69,6 +75,7 @@ if selected_query:
             cursor=cursor,
             fast_plan=fastest.plan,
             slow_plan=last_plan.plan,
+            provider=None if selected_provider == 'openai' else create_provider(selected_provider),
         )
 
         with st.status("Sending plans to the LLM"):
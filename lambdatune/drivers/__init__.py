@@ -1,3 +1,6 @@
 from .postgres import PostgresDriver
 from .mysqldriver import MySQLDriver
-from .driver import Driver
\ No newline at end of file
+from .driver import Driver
+from .postgres_instances import PostgresInstancePool
+from .duckdb_driver import DuckDBDriver
+from .duckdb_instances import DuckDBInstancePool
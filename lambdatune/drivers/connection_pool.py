@@ -0,0 +1,151 @@
+import logging
+import threading
+import time
+
+
+class ConnectionPool:
+    """
+    A pool of persistent database connections. Connections are health-checked before they are handed out, and the
+    pool keeps metrics on the connect/reconnect latency.
+    """
+    def __init__(self, connect, size: int = 1, health_check_query: str = "SELECT 1"):
+        """
+        @param connect: A function that opens a new connection
+        @param size: The number of warm connections kept in the pool
+        @param health_check_query: The query used to check that a connection is still usable
+        """
+        self.__connect = connect
+        self.__size = size
+        self.__health_check_query = health_check_query
+        self.__idle = list()
+        self.__lock = threading.Lock()
+
+        self.metrics = {
+            "connects": 0,
+            "connect_time": 0.0,
+            "reconnects": 0,
+            "reconnect_time": 0.0,
+            "health_check_failures": 0,
+        }
+
+    def connect(self):
+        """
+        Opens a new connection and records its latency
+        """
+        start = time.time()
+        conn = self.__connect()
+        conn.autocommit = True
+
+        with self.__lock:
+            self.metrics["connects"] += 1
+            self.metrics["connect_time"] += time.time() - start
+
+        return conn
+
+    def is_healthy(self, conn):
+        """
+        Returns true if the connection is open and can execute queries
+        """
+        try:
+            if conn.closed:
+                return False
+
+            cursor = conn.cursor()
+            cursor.execute(self.__health_check_query)
+            cursor.fetchall()
+            cursor.close()
+
+            return True
+        except Exception as e:
+            logging.debug(f"Health check failed: {e}")
+
+            with self.__lock:
+                self.metrics["health_check_failures"] += 1
+
+            return False
+
+    def warm_up(self):
+        """
+        Opens connections until the pool holds its configured number of idle connections
+        """
+        while len(self.__idle) < self.__size:
+            conn = self.connect()
+
+            with self.__lock:
+                self.__idle.append(conn)
+
+    def get_connection(self):
+        """
+        Hands out a warm, healthy connection, or opens a new one if there is none available
+        """
+        while True:
+            with self.__lock:
+                conn = self.__idle.pop() if self.__idle else None
+
+            if conn is None:
+                return self.connect()
+
+            if self.is_healthy(conn):
+                return conn
+
+            self.close_connection(conn)
+
+    def release(self, conn):
+        """
+        Returns a connection to the pool
+        """
+        with self.__lock:
+            if len(self.__idle) < self.__size and not conn.closed:
+                self.__idle.append(conn)
+                return
+
+        self.close_connection(conn)
+
+    def reconnect(self, timeout: float = 60, interval: float = 0.1):
+        """
+        Drops all the idle connections (e.g., after a restart of the server) and waits until the server accepts
+        connections again. Instead of sleeping for a fixed amount of time, it polls the server every interval
+        seconds.
+        @return: A new connection
+        """
+        start = time.time()
+        self.close()
+
+        while True:
+            try:
+                conn = self.connect()
+                break
+            except Exception as e:
+                if time.time() - start > timeout:
+                    raise e
+
+                time.sleep(interval)
+
+        with self.__lock:
+            self.metrics["reconnects"] += 1
+            self.metrics["reconnect_time"] += time.time() - start
+
+        self.warm_up()
+
+        return conn
+
+    def close_connection(self, conn):
+        try:
+            conn.close()
+        except Exception as e:
+            logging.debug(f"Failed to close connection: {e}")
+
+    def close(self):
+        """
+        Closes all the idle connections
+        """
+        with self.__lock:
+            idle = self.__idle
+            self.__idle = list()
+
+        for conn in idle:
+            self.close_connection(conn)
+
+    def get_metrics(self):
+        with self.__lock:
+            return dict(self.metrics)
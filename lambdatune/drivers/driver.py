@@ -3,4 +3,16 @@ class Driver:
         pass
 
     def set_configuration(self, config_commands, restart):
-        pass
\ No newline at end of file
+        pass
+
+    def invalidate_state_fingerprint(self):
+        """
+        Discards the cached fingerprint of the server state (if the driver keeps one), after a change of the indexes
+        """
+        pass
+
+    def explain_many(self, queries: list, explain_json=False):
+        """
+        Returns the plans of several queries (see explain), with one round-trip per query by default
+        """
+        return [self.explain(query, execute=False, explain_json=explain_json) for query in queries]
\ No newline at end of file
@@ -1,34 +1,309 @@
-import time
-
 import json
+import logging
+import re
+import time
 
 import duckdb
 
+from collections import defaultdict
+from contextlib import contextmanager
 
-class DuckDBDriver():
-    def __init__(self, db_file, config=None):
-        self.conn = duckdb.connect(db_file)
+from .driver import Driver
+from .query_watchdog import QueryWatchdog
 
-        if config:
-            for c in config.items():
-                if not c[1]:
-                    self.conn.execute(f"PRAGMA {c[0]}")
-                else:
-                    self.conn.execute(f"PRAGMA {c[0]}={c[1]}")
 
-    def explain(self, query, analyze=False, config=None, dump_path=None):
+CONFIG_COMMAND_PATTERN = re.compile(r"^\s*(?:ALTER\s+SYSTEM\s+)?(?:SET|PRAGMA)\s+(?:GLOBAL\s+|SESSION\s+)?([\w.]+)"
+                                    r"\s*(?:=|\s+TO\s+)\s*(.+?)\s*;?\s*$", re.IGNORECASE)
+
+NUMERIC_VALUE_PATTERN = re.compile(r"^-?\d+(\.\d+)?$")
+
+
+class DuckDBDriver(Driver):
+    """
+    A driver of a DuckDB database file. The driver runs its own in-process database instance, which attaches the
+    database file, so that every driver has its own settings (e.g., threads, memory_limit): several drivers can
+    attach the same file read-only and evaluate different configurations at the same time (see
+    DuckDBInstancePool). Settings are applied with SET GLOBAL and never require a restart.
+    """
+    def __init__(self, conf):
+        """
+        @param conf: db (the path of the database file), read_only (attach the file read-only; indexes cannot be
+        created), settings (optional initial settings, name -> value)
+        """
+        self.config = conf
+        self.read_only = conf.get("read_only", False)
+        self.database_name = "lambdatune_db"
+
+        self.conn = duckdb.connect(":memory:")
+
+        mode = " (READ_ONLY)" if self.read_only else ""
+        self.conn.execute(f"ATTACH '{escape_string(conf['db'])}' AS {self.database_name}{mode}")
+        self.conn.execute(f"USE {self.database_name}")
+
+        self.initial_settings = {name.lower(): str(value) for name, value in (conf.get("settings") or dict()).items()}
+
+        for name, value in self.initial_settings.items():
+            self.conn.execute(f"SET GLOBAL {name} = {format_value(value)}")
+
+        # The settings applied by set_configuration, and how the last configuration was applied
+        self.applied_config = dict()
+        self.last_reconfiguration = None
+
+        # Interrupts the driver's running query at a deadline (see explain). Started on first use.
+        self.watchdog = None
+
+    def close(self):
+        if self.watchdog:
+            self.watchdog.shutdown()
+            self.watchdog = None
+
+        self.conn.close()
+
+    def get_cursor(self):
+        return self.conn
+
+    @contextmanager
+    def connection(self):
+        """
+        Hands out a new connection to the driver's database instance (e.g., for index builds next to the driver's
+        own queries), and closes it when done
+        """
+        conn = self.conn.cursor()
+
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def cancel(self):
+        """
+        Interrupts the query that is currently running on this driver. It is safe to call this method from another
+        thread.
+        """
+        try:
+            self.conn.interrupt()
+        except Exception as e:
+            logging.warning(f"Failed to interrupt the running query: {e}")
+
+    def get_watchdog(self):
+        """
+        Returns the watchdog that interrupts the driver's running query at a deadline
+        """
+        if self.watchdog is None:
+            self.watchdog = QueryWatchdog(self.cancel, name="duckdb-query-watchdog")
+
+        return self.watchdog
+
+    def explain(self, query, execute=True, analyze=False, explain_json=False, config=None, results_path=None,
+                timeout: int=None, deadline: float=None):
+        """
+        Returns the plan of a query, and optionally executes it. The execution time is "TIMEOUT" if the query was
+        interrupted, and "ERROR" if it failed for any other reason.
+        @param timeout: The timeout of the query (ms)
+        @param deadline: The absolute time (time.time()) at which the query is interrupted. Used instead of the
+        timeout.
+        """
         if config:
             for conf in config:
                 print(f"Setting config: {conf}")
                 self.conn.execute(conf)
 
-        explain_cmd = "EXPLAIN ANALYZE"
-        start = time.time_ns()
-        self.conn.execute("{} {}".format(explain_cmd, query))
-        plan = '\n'.join(self.conn.fetchall()[0])
+        explain_cmd = "EXPLAIN (FORMAT JSON)" if explain_json else "EXPLAIN"
+        plan = self.get_plan_output(self.conn.execute(f"{explain_cmd} {query}").fetchall(), explain_json)
+
+        duration = None
+        error = None
+
+        if execute:
+            start = time.time()
+
+            if deadline is None and timeout:
+                deadline = start + timeout / 1000
+
+            # DuckDB has no statement timeout: the watchdog interrupts the query instead
+            if deadline is not None and deadline < float("inf"):
+                self.get_watchdog().arm(deadline)
+
+            try:
+                if analyze:
+                    plan = self.get_plan_output(self.conn.execute(f"EXPLAIN ANALYZE {query}").fetchall(), False)
+                else:
+                    self.conn.execute(query)
+
+                duration = (time.time() - start) * 1_000
+            except duckdb.InterruptException:
+                duration = "TIMEOUT"
+            except Exception as e:
+                logging.warning(f"Query failed: {e}")
+                duration = "ERROR"
+                error = str(e)
+            finally:
+                if self.watchdog:
+                    self.watchdog.disarm()
+
+        out = {
+            "execTime": duration,
+            "config": config,
+            "plan": plan
+        }
+
+        if error:
+            out["error"] = error
+
+        if results_path:
+            json.dump(out, open(results_path, "w+"), indent=2)
+
+        return out
+
+    @staticmethod
+    def get_plan_output(rows, explain_json):
+        """
+        Returns the plan of the output of an EXPLAIN: (type, plan) rows
+        """
+        plan = "\n".join(row[1] for row in rows)
+
+        if explain_json:
+            try:
+                return json.loads(plan)
+            except Exception as e:
+                logging.warning(f"Failed to parse plan with error: {e}")
+
+        return plan
+
+    @staticmethod
+    def get_plan_cost(plan):
+        """
+        Returns the estimated cost of a JSON plan: DuckDB plans have no cost, so the cost is the sum of the estimated
+        cardinalities of the operators (the C_out cost model). Operators without an estimate count as 0.
+        """
+        cost = 0.0
+        nodes = list(plan) if isinstance(plan, list) else [plan]
+
+        while nodes:
+            node = nodes.pop()
+
+            try:
+                cost += float(node.get("extra_info", dict()).get("Estimated Cardinality", 0))
+            except (TypeError, ValueError, AttributeError):
+                pass
+
+            nodes.extend(node.get("children", list()) if isinstance(node, dict) else list())
+
+        return cost
+
+    def get_all_indexes(self):
+        self.conn.execute("SELECT index_name FROM duckdb_indexes() WHERE database_name = ? ORDER BY index_name",
+                          [self.database_name])
+
+        return [d[0] for d in self.conn.fetchall()]
+
+    def drop_all_non_pk_indexes(self):
+        # Primary keys and unique constraints are not listed by duckdb_indexes()
+        for index in self.get_all_indexes():
+            logging.info(f"Dropping index: {index}")
+            self.conn.execute(f"DROP INDEX {index}")
+
+    def get_db_schema(self) -> dict:
+        self.conn.execute("""
+            SELECT table_name, column_name
+            FROM duckdb_columns()
+            WHERE database_name = ? AND NOT internal
+            ORDER BY schema_name, table_name, column_index
+        """, [self.database_name])
+
+        schema = defaultdict(list)
+
+        for table, col in self.conn.fetchall():
+            schema[table].append(col)
+
+        return schema
+
+    def get_table_cardinalities(self) -> dict:
+        self.conn.execute("SELECT table_name, estimated_size FROM duckdb_tables() WHERE database_name = ?",
+                          [self.database_name])
+
+        return dict(self.conn.fetchall())
+
+    def get_current_global_config(self):
+        """
+        Retrieves the current settings
+        """
+        self.conn.execute("SELECT name, value FROM duckdb_settings()")
+
+        return dict(self.conn.fetchall())
+
+    @staticmethod
+    def parse_config_command(command: str):
+        """
+        Parses a SET/PRAGMA (or ALTER SYSTEM SET) command into a (name, value) pair, or None
+        """
+        match = CONFIG_COMMAND_PATTERN.match(command)
+
+        if not match:
+            return None
+
+        value = match.group(2).strip()
+
+        if len(value) >= 2 and value[0] == value[-1] and value[0] in ("'", '"'):
+            value = value[1:-1]
+
+        return match.group(1).lower(), value
+
+    def set_configuration(self, config, restart=True, reset=False):
+        """
+        Applies the settings of a configuration with SET GLOBAL: DuckDB settings take effect immediately, so the
+        restart flag is ignored. Commands that are not settings (e.g., PRAGMA enable_profiling) are executed as they
+        are. Unknown settings and invalid values are skipped.
+        """
+        if reset:
+            self.reset_configuration()
+
+        changed = list()
+
+        for command in config:
+            parsed = DuckDBDriver.parse_config_command(command)
+
+            try:
+                if parsed is None:
+                    self.conn.execute(command)
+                    continue
+
+                name, value = parsed
+                self.conn.execute(f"SET GLOBAL {name} = {format_value(value)}")
+                self.applied_config[name] = value
+                changed.append(name)
+            except duckdb.Error as e:
+                logging.warning(f"Skipping config command {command}: {e}")
+
+        self.last_reconfiguration = {"action": "set" if changed else "none", "changed_parameters": sorted(changed)}
+
+        return self.last_reconfiguration
+
+    def reset_configuration(self, restart_system=True):
+        """
+        Resets the settings applied by set_configuration to their defaults (or to the initial settings of the driver)
+        """
+        for name in self.applied_config:
+            try:
+                if name in self.initial_settings:
+                    self.conn.execute(f"SET GLOBAL {name} = {format_value(self.initial_settings[name])}")
+                else:
+                    self.conn.execute(f"RESET GLOBAL {name}")
+            except duckdb.Error as e:
+                logging.warning(f"Failed to reset {name}: {e}")
+
+        self.applied_config = dict()
+
+
+def escape_string(value: str):
+    return value.replace("'", "''")
+
 
-        duration = int((time.time_ns() - start) / 1_000)
+def format_value(value: str):
+    """
+    Formats the value of a setting as a SQL literal
+    """
+    if NUMERIC_VALUE_PATTERN.match(value) or value.lower() in ("true", "false"):
+        return value
 
-        return {
-            "execTime": duration
-        }
\ No newline at end of file
+    return f"'{escape_string(value)}'"
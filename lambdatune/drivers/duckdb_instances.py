@@ -0,0 +1,76 @@
+import logging
+import os
+import shutil
+
+from .duckdb_driver import DuckDBDriver
+
+
+class DuckDBInstancePool:
+    """
+    A pool of in-process DuckDB instances on one database file, so that different configurations can be evaluated
+    at the same time. By default, every instance attaches the database file read-only (indexes cannot be created).
+    With a base directory, every instance gets its own copy of the database file instead, on which indexes can be
+    created and dropped.
+    """
+    def __init__(self, conf: dict, num_instances: int, base_dir: str = None):
+        """
+        @param conf: The configuration of the template driver (see DuckDBDriver)
+        @param num_instances: The number of instances
+        @param base_dir: The directory of the copies of the database file, or None to share the file read-only
+        """
+        self.conf = conf
+        self.num_instances = num_instances
+        self.base_dir = base_dir
+        self.instances = list()
+
+    def get_instance_conf(self, instance_id: int):
+        """
+        Returns the driver configuration of an instance
+        """
+        conf = dict(self.conf)
+
+        if self.base_dir:
+            conf["db"] = os.path.join(self.base_dir, f"instance_{instance_id}.duckdb")
+            conf["read_only"] = False
+        else:
+            conf["read_only"] = True
+
+        return conf
+
+    def start(self):
+        """
+        Copies the database file for every instance, if needed. The database file must not be attached read-write
+        by another driver of this process while the pool is in use.
+        @return: The instance configurations
+        """
+        if self.base_dir:
+            os.makedirs(self.base_dir, exist_ok=True)
+
+        for instance_id in range(0, self.num_instances):
+            conf = self.get_instance_conf(instance_id)
+
+            if self.base_dir:
+                logging.info(f"Copying {self.conf['db']} into {conf['db']}")
+                shutil.copy(self.conf["db"], conf["db"])
+
+            self.instances.append(conf)
+
+        return self.instances
+
+    def get_drivers(self):
+        """
+        Returns a driver for every instance of the pool
+        """
+        return [DuckDBDriver(conf) for conf in self.instances]
+
+    def stop(self):
+        """
+        Removes the copies of the database file
+        """
+        if self.base_dir:
+            for conf in self.instances:
+                for path in [conf["db"], conf["db"] + ".wal"]:
+                    if os.path.exists(path):
+                        os.remove(path)
+
+        self.instances = list()
@@ -1,31 +1,89 @@
 from collections import defaultdict
 import logging
+import math
 
 import platform
 import os
 
+import re
 import subprocess
 import time
 import json
 
 import mysql.connector
 
+from .driver import Driver
+from .query_watchdog import QueryWatchdog
 
-class MySQLDriver:
+
+# The scope is either a keyword (SET PERSIST name = value) or a prefix of the variable (SET @@persist.name = value)
+CONFIG_COMMAND_PATTERN = re.compile(r"^\s*SET\s+(?:(GLOBAL|PERSIST_ONLY|PERSIST|SESSION)\s+)?(?:@@(?:(\w+)\.)?)?(\w+)"
+                                    r"\s*(?::?=|\s+TO\s+)\s*(.+?)\s*;?\s*$", re.IGNORECASE)
+
+PERSIST_SCOPES = ("PERSIST", "PERSIST_ONLY")
+
+# Sizes with a unit suffix (e.g., 4G), which are accepted in option files but not by SET
+SIZE_VALUE_PATTERN = re.compile(r"^(\d+(?:\.\d+)?)\s*([KMGT])I?B?$", re.IGNORECASE)
+SIZE_UNITS = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+
+# ER_INCORRECT_GLOBAL_LOCAL_VAR: the variable is read-only (static), i.e., it can only be changed with a restart
+READ_ONLY_VARIABLE_ERROR = 1238
+
+# ER_QUERY_TIMEOUT (max_execution_time exceeded) and ER_QUERY_INTERRUPTED (KILL QUERY)
+TIMEOUT_ERRORS = {3024, 1317}
+
+
+class MySQLDriver(Driver):
     def __init__(self, conf):
-        for i in range(0, 20):
+        self.conf = conf
+
+        # The variables set by set_configuration (name -> value), and the ones that can only be changed with a
+        # restart (learned from the server, see apply_variable)
+        self.applied_config = dict()
+        self.static_variables = set()
+        # The static variables persisted by the driver, and the ones in effect since the last restart
+        self.persisted_static = dict()
+        self.effective_static = dict()
+        self.last_reconfiguration = None
+
+        # Kills the driver's running statement at a deadline (see explain), on a second connection. Started on first
+        # use.
+        self.watchdog = None
+        self.kill_conn = None
+
+        self.connect()
+
+    def connect(self, timeout: float = 60, interval: float = 0.1):
+        """
+        Opens the driver's session. Polls the server until it accepts connections (e.g., after a restart).
+        """
+        start = time.time()
+
+        while True:
             try:
-                self.conf = conf
-                self.conn = mysql.connector.connect(user=conf['user'],
-                                                    password=conf['password'],
-                                                    database=conf['db'])
+                self.conn = mysql.connector.connect(user=self.conf['user'],
+                                                    password=self.conf['password'],
+                                                    database=self.conf['db'])
                 self.cursor = self.conn.cursor()
                 return
             except Exception as e:
-                logging.error(e)
-                time.sleep(2)
+                if time.time() - start > timeout:
+                    logging.error(e)
+                    self.cursor = None
+                    return
+
+                time.sleep(interval)
 
-        self.cursor = None
+    def reconnect(self):
+        """
+        Re-opens the driver's session, e.g., for the session variables to pick up new global values
+        """
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+
+        self.connect()
 
     @staticmethod
     def restart_system():
@@ -40,35 +98,254 @@ class MySQLDriver:
         logging.info("Done!")
 
     def reset_configuration(self, configs=None, restart_system=False):
-        if configs:
-            config_str = ""
-            for config in configs:
-                config_str += f"SET GLOBAL {config} = DEFAULT\n"
+        """
+        Resets the variables set by set_configuration (and the given ones) to their defaults. Dynamic variables are
+        reset with SET GLOBAL, without a restart. The persisted static variables are removed, and take effect with
+        the next restart: immediately if restart_system is set, otherwise with the next configuration that needs one.
+        """
+        self.conn.autocommit = True
 
-            self.cursor.execute(config_str)
+        names = list(self.applied_config.keys()) + [name.lower() for name in configs or list()]
+        self.reset_configuration_variables(list(dict.fromkeys(names)))
 
-        MySQLDriver.restart_system()
-        self.__init__(self.conf)
+        if restart_system and self.get_pending_static_variables():
+            self.restart()
+        else:
+            # The session variables are initialized from the global ones
+            self.reconnect()
 
     def set_configuration(self, config_commands, reset=True, restart=False):
-        if reset:
-            MySQLDriver.restart_system()
-            self.__init__(self.conf)
-
+        """
+        Applies SET commands. Dynamic variables are set with SET GLOBAL (SET PERSIST if the command says so), and take
+        effect without a restart. Static (read-only) variables are persisted with SET PERSIST_ONLY, and all of them
+        take effect with one restart, if restart is set. The applied values are verified against the server. How the
+        configuration was applied is kept in last_reconfiguration.
+        @param reset: Reset the variables of the previous configuration first
+        @param restart: Restart the server if a static variable changed
+        """
         self.conn.autocommit = True
 
+        target = dict()
+
         for cmd in config_commands:
+            parsed = MySQLDriver.parse_config_command(cmd)
+
+            if parsed is None:
+                try:
+                    logging.info(f"Setting config: {cmd}")
+                    self.get_cursor().execute(cmd)
+                except Exception as e:
+                    logging.warning(f"Config command failed: {cmd}: {e}")
+                continue
+
+            target[parsed[0]] = (parsed[1], parsed[2] in PERSIST_SCOPES)
+
+        if reset:
+            # Only the variables the new configuration does not set again are reset
+            self.reset_configuration_variables([name for name in self.applied_config if name not in target])
+
+        dynamic = list()
+
+        for name, (value, persist) in target.items():
+            if name in self.static_variables or not self.apply_variable(name, value, persist):
+                self.persist_static_variable(name, value)
+            else:
+                dynamic.append(name)
+
+            self.applied_config[name] = value
+
+        # The static variables whose persisted values are not in effect yet (set, or reset by the previous
+        # configuration) take effect with a single restart
+        static = self.get_pending_static_variables()
+        action = "dynamic" if dynamic else "none"
+
+        if restart and static:
+            self.restart()
+
+            # The restart resets the dynamic variables that were set with SET GLOBAL
+            for name in dynamic:
+                self.apply_variable(name, target[name][0], target[name][1])
+
+            action = "restart"
+
+        if action != "restart":
+            # The session variables are initialized from the global ones
+            self.reconnect()
+
+        # The static variables are only in effect after a restart
+        verified = dynamic + [name for name in static if name in target] if action == "restart" else dynamic
+        mismatched = self.verify_configuration({name: target[name][0] for name in verified})
+
+        self.last_reconfiguration = {"action": action,
+                                     "changed_parameters": sorted(dynamic + static),
+                                     "static_parameters": sorted(static),
+                                     "mismatched_parameters": mismatched}
+
+        logging.info(f"Reconfiguration: {self.last_reconfiguration}")
+
+        return self.last_reconfiguration
+
+    def reset_configuration_variables(self, names: list):
+        """
+        Resets variables to their defaults (see reset_configuration), without reconnecting
+        """
+        for name in names:
             try:
-                print(cmd)
-                self.get_cursor().execute(cmd)
+                if name in self.static_variables:
+                    self.get_cursor().execute(f"RESET PERSIST IF EXISTS {name}")
+                    self.persisted_static.pop(name, None)
+                else:
+                    self.get_cursor().execute(f"SET GLOBAL {name} = DEFAULT")
             except Exception as e:
-                print(e)
+                logging.warning(f"Failed to reset {name}: {e}")
 
-        # Reset connection for the configs to take effect
-        self.cursor.close()
-        self.conn.close()
-        self.__init__(self.conf)
+            self.applied_config.pop(name, None)
+
+    def apply_variable(self, name: str, value: str, persist: bool = False):
+        """
+        Sets a variable with SET GLOBAL (or SET PERSIST)
+        @return: False if the variable is static (read-only), in which case it is remembered as such
+        """
+        scope = "PERSIST" if persist else "GLOBAL"
+
+        try:
+            self.execute_set(scope, name, value)
+            return True
+        except mysql.connector.Error as e:
+            if e.errno == READ_ONLY_VARIABLE_ERROR:
+                self.static_variables.add(name)
+                return False
+
+            logging.warning(f"Failed to set {name} = {value}: {e}")
+            return True
+
+    def persist_static_variable(self, name: str, value: str):
+        """
+        Persists a static variable with SET PERSIST_ONLY, to take effect with the next restart
+        @return: True if the variable was persisted
+        """
+        try:
+            self.execute_set("PERSIST_ONLY", name, value)
+            self.persisted_static[name] = value
+            return True
+        except mysql.connector.Error as e:
+            logging.warning(f"Failed to persist {name} = {value}: {e}")
+            return False
+
+    def get_pending_static_variables(self):
+        """
+        Returns the static variables whose persisted values differ from the ones in effect
+        """
+        names = set(self.persisted_static.keys()).union(self.effective_static.keys())
+
+        return sorted(name for name in names
+                      if MySQLDriver.normalize_value(self.persisted_static.get(name), compare=True) !=
+                      MySQLDriver.normalize_value(self.effective_static.get(name), compare=True))
+
+    def execute_set(self, scope: str, name: str, value: str):
+        value = MySQLDriver.normalize_value(value)
+
+        if value.upper() in ("DEFAULT", "ON", "OFF"):
+            self.get_cursor().execute(f"SET {scope} {name} = {value.upper()}")
+            return
+
+        # Numeric variables do not accept string values
+        for number_type in (int, float):
+            try:
+                value = number_type(value)
+                break
+            except ValueError:
+                pass
 
+        self.get_cursor().execute(f"SET {scope} {name} = %s", (value,))
+
+    def verify_configuration(self, target: dict):
+        """
+        Compares the target values of variables with the ones in effect (SHOW VARIABLES)
+        @return: The variables whose values differ (e.g., rounded or capped by the server): name -> (target, actual)
+        """
+        if not target:
+            return dict()
+
+        cursor = self.get_cursor()
+        placeholders = ", ".join(["%s"] * len(target))
+        cursor.execute(f"SELECT LOWER(VARIABLE_NAME), VARIABLE_VALUE FROM performance_schema.global_variables "
+                       f"WHERE LOWER(VARIABLE_NAME) IN ({placeholders})", tuple(target.keys()))
+        actual = dict(cursor.fetchall())
+
+        mismatched = dict()
+
+        for name, value in target.items():
+            if MySQLDriver.normalize_value(value, compare=True) != \
+                    MySQLDriver.normalize_value(actual.get(name), compare=True):
+                mismatched[name] = (value, actual.get(name))
+
+        if mismatched:
+            logging.warning(f"Variables not applied as requested: {mismatched}")
+
+        return mismatched
+
+    @staticmethod
+    def parse_config_command(command: str):
+        """
+        Parses a SET command (SET [GLOBAL|PERSIST|PERSIST_ONLY] name = value, SET @@global.name = value)
+        @return: A (variable, value, scope) tuple or None if the command is not a SET command. The scope is upper case,
+        or None if the command does not set one.
+        """
+        match = CONFIG_COMMAND_PATTERN.match(command)
+
+        if not match:
+            return None
+
+        scope = match.group(1) or match.group(2)
+
+        return match.group(3).lower(), match.group(4).strip().strip("'\""), scope.upper() if scope else None
+
+    @staticmethod
+    def normalize_value(value, compare: bool = False):
+        """
+        Converts sizes with a unit suffix (e.g., 4G) to bytes. For comparisons, also normalizes booleans and numbers.
+        """
+        if value is None:
+            return None
+
+        value = str(value).strip().strip("'\"")
+        match = SIZE_VALUE_PATTERN.match(value)
+
+        if match:
+            value = str(int(float(match.group(1)) * SIZE_UNITS[match.group(2).upper()]))
+
+        if not compare:
+            return value
+
+        if value.upper() in ("ON", "TRUE"):
+            return "1.0"
+
+        if value.upper() in ("OFF", "FALSE"):
+            return "0.0"
+
+        try:
+            return str(float(value))
+        except ValueError:
+            return value.lower()
+
+    def restart(self):
+        """
+        Restarts the server, making the persisted static variables effective, and re-opens the driver's session
+        """
+        MySQLDriver.restart_system()
+        self.connect()
+        self.effective_static = dict(self.persisted_static)
+
+
+    def get_current_global_config(self):
+        """
+        Retrieves the global variables
+        """
+        cursor = self.get_cursor()
+        cursor.execute("SHOW GLOBAL VARIABLES")
+
+        return dict(cursor.fetchall())
 
     def get_configuration(self, configuration_name):
         self.cursor.execute(f"SHOW VARIABLES LIKE '{configuration_name}'")
@@ -83,13 +360,58 @@ class MySQLDriver:
 
         return self.cursor
 
-    def explain(self, query, execute=True, explain_json=False, timeout=None, results_path=None):
-        # Optionally modify the query to force a timeout (using a MAX_EXECUTION_TIME hint).
-        if timeout:
-            # This example shows how you might apply MySQL's MAX_EXECUTION_TIME hint.
-            # Adjust the replacement if your query structure is different.
-            query = query.replace("select", "select\n\t/*+ MAX_EXECUTION_TIME({}) */".format(int(timeout)), 1)
-            
+    def cancel(self):
+        """
+        Kills the statement that is currently running on this driver's session, with KILL QUERY on a second
+        connection. It is safe to call this method from another thread.
+        """
+        connection_id = self.conn.connection_id
+
+        for attempt in range(0, 2):
+            try:
+                if self.kill_conn is None or not self.kill_conn.is_connected():
+                    self.kill_conn = mysql.connector.connect(user=self.conf['user'],
+                                                             password=self.conf['password'],
+                                                             database=self.conf['db'])
+
+                kill_cursor = self.kill_conn.cursor()
+                kill_cursor.execute(f"KILL QUERY {int(connection_id)}")
+                kill_cursor.close()
+                return
+            except Exception as e:
+                logging.warning(f"Failed to kill the running statement: {e}")
+                self.kill_conn = None
+
+    @staticmethod
+    def classify_error(error: Exception):
+        """
+        Returns "TIMEOUT" if a statement failed because it ran out of time (max_execution_time) or was killed (KILL
+        QUERY), and "ERROR" otherwise
+        """
+        if isinstance(error, mysql.connector.Error) and error.errno in TIMEOUT_ERRORS:
+            return "TIMEOUT"
+
+        return "ERROR"
+
+    def get_watchdog(self):
+        """
+        Returns the watchdog that kills the driver's running statement at a deadline
+        """
+        if self.watchdog is None:
+            self.watchdog = QueryWatchdog(self.cancel, name="mysql-query-watchdog")
+
+        return self.watchdog
+
+    def explain(self, query, execute=True, explain_json=False, timeout=None, results_path=None,
+                deadline: float=None):
+        """
+        Returns the plan of a query, and optionally executes it. The execution time is "TIMEOUT" if the query ran
+        out of time, and "ERROR" if it failed for any other reason.
+        @param timeout: The timeout of the query (ms). The server enforces it for SELECT statements (session
+        max_execution_time), and the watchdog kills any other statement that exceeds it.
+        @param deadline: The absolute time (time.time()) at which the watchdog kills the query. Used instead of the
+        timeout.
+        """
         cursor = self.get_cursor()
         # Build the EXPLAIN command depending on whether JSON format is requested.
         explain_cmd = "EXPLAIN"
@@ -118,15 +440,39 @@ class MySQLDriver:
 
         # Optionally execute the query (and time its execution) if execute is True.
         duration = None
+        error = None
         if execute:
             logging.info("Executing query...")
             start = time.time()
+            max_execution_time = None
+
+            # The selector passes an infinite timeout when the queries must not be cut off
+            if deadline is None and timeout and math.isfinite(timeout):
+                max_execution_time = max(1, min(4294967295, int(timeout)))
+                cursor.execute(f"SET SESSION max_execution_time = {max_execution_time}")
+                deadline = start + timeout / 1000
+
+            if deadline is not None and deadline < float("inf"):
+                self.get_watchdog().arm(deadline)
+
             try:
                 cursor.execute(query)
                 duration = time.time() - start
             except Exception as e:
-                logging.warning(f"Execution error: {e}")
-                duration = "TIMEOUT"
+                duration = MySQLDriver.classify_error(e)
+
+                if duration == "ERROR":
+                    logging.warning(f"Execution error: {e}")
+                    error = str(e)
+            finally:
+                if self.watchdog:
+                    self.watchdog.disarm()
+
+            if max_execution_time is not None:
+                try:
+                    cursor.execute("SET SESSION max_execution_time = DEFAULT")
+                except Exception as e:
+                    logging.warning(f"Failed to reset max_execution_time: {e}")
 
             logging.info(f"Query execution took: {duration}")
 
@@ -135,6 +481,9 @@ class MySQLDriver:
             "execTime": duration
         }
 
+        if error:
+            out["error"] = error
+
         # Optionally write the output to a file.
         if results_path:
             with open(results_path, "w+") as f:
@@ -144,6 +493,12 @@ class MySQLDriver:
         return out
 
 
+    def explain_many(self, queries: list, explain_json=False):
+        """
+        Returns the plans of several queries (see explain), without executing them
+        """
+        return [self.explain(query, execute=False, explain_json=explain_json) for query in queries]
+
     def explain_json(self, query, analyze=False, verbose=False, config=None, dump_path=None):
         if config:
             for conf in config:
@@ -192,6 +547,9 @@ class MySQLDriver:
 
         return [index for index in indexes]
 
+    def get_all_indexes(self) -> list:
+        return sorted(set(index[0] for index in self.get_all_non_pk_indexes_full()))
+
     def get_all_non_pk_indexes_full(self) -> list:
         indexes = self.get_all_indexes_full()
         indexes = [index for index in indexes if "PRIMARY" not in str(index)]
@@ -221,7 +579,7 @@ class MySQLDriver:
 
     def reset_session(self):
         self.cursor.close()
-        self.__init__(self.conf)
+        self.reconnect()
 
     def get_db_schema(self) -> dict:
         cursor = self.get_cursor()
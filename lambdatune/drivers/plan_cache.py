@@ -0,0 +1,115 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def normalize_query(query: str):
+    """
+    Normalizes the text of a query for the plan cache: collapses whitespace and drops the trailing semicolon.
+    The case is kept, since it matters for string literals.
+    """
+    return WHITESPACE_PATTERN.sub(" ", query).strip().rstrip(";").strip()
+
+
+class PlanCache:
+    """
+    A persistent (SQLite) cache of EXPLAIN outputs. A plan is keyed by the normalized query text, the explain format,
+    and a fingerprint of the server state the plan depends on (effective planner settings, visible indexes, table
+    statistics), so that the plans of a configuration are reused across rounds and runs. The least recently used
+    plans are evicted above max_entries.
+    """
+    def __init__(self, path: str, max_entries: int = 100000):
+        """
+        @param path: The path of the SQLite database
+        @param max_entries: The maximum number of cached plans
+        """
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self.path = path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS plans (key TEXT PRIMARY KEY, plan TEXT, last_used REAL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS plans_last_used ON plans (last_used)")
+        self.conn.commit()
+
+        self.metrics = {
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+        }
+
+    @staticmethod
+    def get_key(query: str, explain_format: str, state_fingerprint: str):
+        """
+        Returns the cache key of a query plan
+        """
+        key = "\n".join([state_fingerprint, explain_format, normalize_query(query)])
+
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def get(self, key: str):
+        """
+        Returns the cached plan, or None
+        """
+        with self.lock:
+            row = self.conn.execute("SELECT plan FROM plans WHERE key = ?", (key,)).fetchone()
+
+            if row is None:
+                self.metrics["misses"] += 1
+                return None
+
+            self.metrics["hits"] += 1
+            self.conn.execute("UPDATE plans SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+
+        return json.loads(row[0])
+
+    def put(self, key: str, plan):
+        """
+        Caches a plan, and evicts the least recently used plans if the cache is full
+        """
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO plans (key, plan, last_used) VALUES (?, ?, ?)",
+                              (key, json.dumps(plan), time.time()))
+
+            num_entries = self.conn.execute("SELECT COUNT(*) FROM plans").fetchone()[0]
+
+            if num_entries > self.max_entries:
+                evicted = num_entries - self.max_entries
+                self.conn.execute("DELETE FROM plans WHERE key IN "
+                                  "(SELECT key FROM plans ORDER BY last_used LIMIT ?)", (evicted,))
+                self.metrics["evictions"] += evicted
+
+            self.conn.commit()
+
+    def clear(self):
+        """
+        Removes all the cached plans
+        """
+        with self.lock:
+            self.conn.execute("DELETE FROM plans")
+            self.conn.commit()
+
+    def get_metrics(self):
+        """
+        Returns the hit/miss/eviction counters
+        """
+        with self.lock:
+            return dict(self.metrics)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+        logging.info(f"Plan cache {self.path}: {self.metrics}")
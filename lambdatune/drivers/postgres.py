@@ -2,6 +2,7 @@ import json
 import logging
 import os.path
 import pprint
+import re
 
 import psycopg2
 import time
@@ -9,9 +10,60 @@ import time
 import platform
 
 from collections import defaultdict
+from contextlib import contextmanager
 
 from lambdatune import plan_utils
 from .driver import Driver
+from .connection_pool import ConnectionPool
+from .query_watchdog import QueryWatchdog
+from .plan_cache import PlanCache
+
+
+# Parameter contexts (pg_settings.context) and what it takes for a change to become effective
+RESTART_CONTEXTS = {"postmaster"}
+BACKEND_CONTEXTS = {"backend", "superuser-backend"}
+SESSION_CONTEXTS = {"user", "superuser"}
+
+CONFIG_COMMAND_PATTERN = re.compile(r"^\s*(?:ALTER\s+SYSTEM\s+)?SET\s+([\w.]+)\s*(?:=|\s+TO\s+)\s*(.+?)\s*;?\s*$",
+                                    re.IGNORECASE)
+
+
+# A session-local (pg_temp) function that EXPLAINs an array of queries and returns one row per query, so that the
+# plans of a workload are produced in a single round-trip. A failed EXPLAIN returns its error instead of aborting
+# the batch.
+EXPLAIN_MANY_FUNCTION = """
+CREATE OR REPLACE FUNCTION pg_temp.lambdatune_explain_many(queries text[], as_json boolean)
+RETURNS TABLE (query_idx int, query_plan json, explain_error text) AS $$
+DECLARE
+    line text;
+    lines text[];
+BEGIN
+    FOR i IN 1 .. coalesce(array_length(queries, 1), 0) LOOP
+        query_idx := i;
+        query_plan := NULL;
+        explain_error := NULL;
+
+        BEGIN
+            IF as_json THEN
+                EXECUTE 'EXPLAIN (FORMAT JSON) ' || queries[i] INTO query_plan;
+            ELSE
+                lines := ARRAY[]::text[];
+
+                FOR line IN EXECUTE 'EXPLAIN ' || queries[i] LOOP
+                    lines := lines || line;
+                END LOOP;
+
+                query_plan := to_json(array_to_string(lines, E'\\n'));
+            END IF;
+        EXCEPTION WHEN OTHERS THEN
+            explain_error := SQLERRM;
+        END;
+
+        RETURN NEXT;
+    END LOOP;
+END
+$$ LANGUAGE plpgsql;
+"""
 
 
 class PostgresPlan:
@@ -52,16 +104,15 @@ class PostgresDriver(Driver):
     def __init__(self, conf):
         self.config = conf
 
+        # Warm connections for work that runs next to the driver's own session (e.g., index builds)
+        self.pool = ConnectionPool(lambda: psycopg2.connect(**self.get_connection_params()),
+                                   size=self.config.get("pool_size", 1))
+
         c = 0
 
         while True:
             try:
-                if "password" in self.config:
-                    self.conn = psycopg2.connect(database=self.config["db"], user=self.config["user"],
-                        password=self.config["password"]
-                    )
-                else:
-                    self.conn = psycopg2.connect("dbname='%s' user='%s'" % (self.config["db"], self.config["user"]))
+                self.conn = self.pool.connect()
                 break
             except Exception as e:
                 c += 1
@@ -77,11 +128,158 @@ class PostgresDriver(Driver):
         self.cursor.connection.autocommit = True
         self.cursor.connection.autocommit = True
 
+        self.pool.warm_up()
+
+        # The ALTER SYSTEM settings in effect, and how the last configuration was applied
+        self.applied_config = self.load_applied_configuration()
+        self.last_reconfiguration = None
+
+        # Cancels the driver's running statement at a deadline (see explain). Started on first use.
+        self.watchdog = None
+
+        # Persistent cache of the EXPLAIN outputs (optional)
+        self.plan_cache = PlanCache(self.config["plan_cache"]) if self.config.get("plan_cache") else None
+
+        # The fingerprint of the current server state (see get_state_fingerprint), and the number of state changes
+        self.state_fingerprint = None
+        self.state_generation = 0
+
+    def reconnect(self):
+        """
+        Re-opens the driver's session after a restart of the server. The pool polls the server until it accepts
+        connections, instead of sleeping for a fixed amount of time.
+        """
+        self.pool.close_connection(self.conn)
+
+        self.conn = self.pool.reconnect()
+        self.cursor = self.conn.cursor()
+
+        # The new session has the global settings
+        self.invalidate_state_fingerprint()
+
+    @contextmanager
+    def connection(self):
+        """
+        Hands out a warm connection from the pool, and returns it to the pool when done
+        """
+        conn = self.pool.get_connection()
+
+        try:
+            yield conn
+        finally:
+            self.pool.release(conn)
+
+    def get_connection_metrics(self):
+        """
+        Returns the connect/reconnect metrics of the driver's connection pool
+        """
+        return self.pool.get_metrics()
+
+    def get_connection_params(self):
+        """
+        Returns the psycopg2 connection parameters of the configured instance
+        """
+        params = {"database": self.config["db"], "user": self.config["user"]}
+
+        if self.config.get("password"):
+            params["password"] = self.config["password"]
+
+        # Optional parameters, used to connect to one of several local instances
+        for key in ["host", "port"]:
+            if self.config.get(key):
+                params[key] = self.config[key]
+
+        return params
+
     def get_cursor(self):
         return self.cursor
 
+    def cancel(self):
+        """
+        Cancels the statement that is currently running on this driver's connection. It is safe to call this
+        method from another thread.
+        """
+        try:
+            self.conn.cancel()
+        except Exception as e:
+            logging.warning(f"Failed to cancel the running statement: {e}")
+
+    def cancel_backend(self):
+        """
+        Cancels the statement that is currently running on this driver's session from the server side, using
+        pg_cancel_backend on a separate pooled connection
+        """
+        pid = self.conn.get_backend_pid()
+
+        with self.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT pg_cancel_backend(%s)", (pid,))
+
+    def get_state_fingerprint(self, cursor=None):
+        """
+        Returns a fingerprint of the server state that query plans depend on: the effective planner and resource
+        settings of the session, the (valid) indexes, and the table statistics. It is computed once per state, and
+        kept until the driver changes the configuration or the indexes (see invalidate_state_fingerprint).
+        """
+        if self.state_fingerprint is not None:
+            return self.state_fingerprint
+
+        generation = self.state_generation
+        cursor = cursor or self.cursor
+
+        cursor.execute("""
+        SELECT md5(
+            (SELECT coalesce(string_agg(name || '=' || setting, ',' ORDER BY name), '')
+             FROM pg_settings
+             WHERE category LIKE 'Query Tuning%' OR category LIKE 'Resource Usage%')
+            || '|' ||
+            (SELECT coalesce(string_agg(pg_get_indexdef(i.indexrelid) || ':' || i.indisvalid, ';'
+                                        ORDER BY pg_get_indexdef(i.indexrelid)), '')
+             FROM pg_index i JOIN pg_class c ON c.oid = i.indrelid JOIN pg_namespace n ON n.oid = c.relnamespace
+             WHERE n.nspname = 'public')
+            || '|' ||
+            (SELECT coalesce(string_agg(c.relname || ':' || c.reltuples || ':' || c.relpages || ':' ||
+                                        coalesce(greatest(s.last_analyze, s.last_autoanalyze)::text, ''),
+                                        ',' ORDER BY c.relname), '')
+             FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+             LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+             WHERE n.nspname = 'public' AND c.relkind = 'r')
+        );
+        """)
+
+        fingerprint = f"{self.config['db']}:{cursor.fetchone()[0]}"
+
+        # The state may have changed meanwhile (e.g., by a background index build)
+        if generation == self.state_generation:
+            self.state_fingerprint = fingerprint
+
+        return fingerprint
+
+    def invalidate_state_fingerprint(self):
+        """
+        Discards the fingerprint of the server state, after a change of the configuration or the indexes
+        """
+        self.state_generation += 1
+        self.state_fingerprint = None
+
+    def get_plan_cache_metrics(self):
+        """
+        Returns the hit/miss/eviction counters of the plan cache, or None if it is disabled
+        """
+        return self.plan_cache.get_metrics() if self.plan_cache else None
+
+    def get_watchdog(self):
+        """
+        Returns the watchdog that cancels the driver's running statement at a deadline
+        """
+        if self.watchdog is None:
+            self.watchdog = QueryWatchdog(self.cancel_backend)
+
+        return self.watchdog
+
     def enable_index(self, index_name):
         self.cursor.execute("UPDATE pg_index SET indisvalid = TRUE WHERE indexrelid = '{}'::regclass;".format(index_name))
+        self.invalidate_state_fingerprint()
 
     def enable_indexes(self, index_set):
         for index in index_set:
@@ -97,13 +295,21 @@ class PostgresDriver(Driver):
         print("Disabling index {}".format(index_name))
         self.cursor.execute(
             "UPDATE pg_index SET indisvalid = FALSE WHERE indexrelid = '{}'::regclass;".format(index_name))
+        self.invalidate_state_fingerprint()
 
     def disable_indexes(self, index_set):
         for index_name in index_set:
             self.disable_index(index_name)
 
     def explain(self, query, execute=True, analyze=False, explain_json=False, config=None, results_path=None,
-                timeout: int=None):
+                timeout: int=None, deadline: float=None):
+        """
+        Returns the plan of a query, and optionally executes it. The execution time is "TIMEOUT" if the query was
+        cancelled (statement timeout or cancel request), and "ERROR" if it failed for any other reason.
+        @param timeout: The statement timeout of the query (ms), set on the session
+        @param deadline: The absolute time (time.time()) at which the watchdog cancels the query. Used instead of
+        the statement timeout.
+        """
 
         cursor = self.conn.cursor()
 
@@ -112,29 +318,42 @@ class PostgresDriver(Driver):
                 print(f"Setting config: {conf}")
                 cursor.execute(conf)
 
+            self.invalidate_state_fingerprint()
 
-        explain_cmd = "EXPLAIN "
+        plan = None
+        plan_key = None
 
-        if explain_json:
-            explain_cmd += "(FORMAT JSON)"
+        if self.plan_cache:
+            plan_key = PlanCache.get_key(query, "json" if explain_json else "text",
+                                         self.get_state_fingerprint(cursor))
+            plan = self.plan_cache.get(plan_key)
 
-        explain_cmd = f"{explain_cmd} {query}"
-        cursor.execute(explain_cmd)
-        plan = cursor.fetchall()
-        # pprint.pprint(plan)
-#         print(f'''plan: {len(json.dumps(plan))}
+        if plan is None:
+            explain_cmd = "EXPLAIN "
+
+            if explain_json:
+                explain_cmd += "(FORMAT JSON)"
+
+            explain_cmd = f"{explain_cmd} {query}"
+            cursor.execute(explain_cmd)
+            plan = cursor.fetchall()
+            # pprint.pprint(plan)
+#             print(f'''plan: {len(json.dumps(plan))}
 # query: {len(query)}''')
-        if not explain_json:
-            try:
-                plan = '\n'.join([d[0] for d in plan])
-            except Exception as e:
-                logging.warning(e)
-                plan = None
-        else:
-            try:
-                plan = plan[0][0][0]
-            except Exception as e:
-                logging.warning(f"Failed to parse plan with error: {e}")
+            if not explain_json:
+                try:
+                    plan = '\n'.join([d[0] for d in plan])
+                except Exception as e:
+                    logging.warning(e)
+                    plan = None
+            else:
+                try:
+                    plan = plan[0][0][0]
+                except Exception as e:
+                    logging.warning(f"Failed to parse plan with error: {e}")
+
+            if plan_key and isinstance(plan, (str, dict)):
+                self.plan_cache.put(plan_key, plan)
 
         explain_cmd = f"EXPLAIN "
 
@@ -152,11 +371,17 @@ class PostgresDriver(Driver):
             explain_cmd += " )"
 
         duration = None
+        error = None
 
         if execute:
             start = time.time()
 
-            if timeout:                
+            if deadline is not None:
+                timeout = None
+
+                if deadline < float("inf"):
+                    self.get_watchdog().arm(deadline)
+            elif timeout:
                 cursor.execute(f"SET statement_timeout={min(2147483647,timeout)}")
 
             try:
@@ -173,8 +398,15 @@ class PostgresDriver(Driver):
                     cursor.execute(query)
 
                 duration = (time.time() - start) * 1_000
-            except Exception as e:
+            except psycopg2.errors.QueryCanceled:
                 duration = "TIMEOUT"
+            except Exception as e:
+                logging.warning(f"Query failed: {e}")
+                duration = "ERROR"
+                error = str(e)
+            finally:
+                if deadline is not None and self.watchdog:
+                    self.watchdog.disarm()
 
         if timeout:
             try:
@@ -188,6 +420,9 @@ class PostgresDriver(Driver):
             "plan": plan
         }
 
+        if error:
+            out["error"] = error
+
         if results_path:
             json.dump(out, open(results_path, "w+"), indent=2)
 
@@ -195,6 +430,81 @@ class PostgresDriver(Driver):
 
         return out
 
+    def explain_many(self, queries: list, explain_json=False, config=None, batch_size: int = 100):
+        """
+        Returns the plans of several queries (without executing them), in one server round-trip per batch: the
+        EXPLAINs run in a session-local set-returning function that returns one row per query. Cached plans are not
+        requested, and the new plans are added to the plan cache. Falls back to explain if the batch fails.
+        @param queries: The queries
+        @param explain_json: Return the plans in the JSON format
+        @param config: Session-level settings applied before the EXPLAINs
+        @param batch_size: The maximum number of queries per round-trip
+        @return: The outputs of explain (with execute=False) of the queries, in order
+        """
+        outs = [{"execTime": None, "config": config, "plan": None} for _ in queries]
+
+        cursor = self.conn.cursor()
+
+        if config:
+            for conf in config:
+                print(f"Setting config: {conf}")
+                cursor.execute(conf)
+
+            self.invalidate_state_fingerprint()
+
+        explain_format = "json" if explain_json else "text"
+        plan_keys = [None] * len(queries)
+        missing = list()
+
+        if self.plan_cache:
+            fingerprint = self.get_state_fingerprint(cursor)
+
+            for idx, query in enumerate(queries):
+                plan_keys[idx] = PlanCache.get_key(query, explain_format, fingerprint)
+                outs[idx]["plan"] = self.plan_cache.get(plan_keys[idx])
+
+                if outs[idx]["plan"] is None:
+                    missing.append(idx)
+        else:
+            missing = list(range(0, len(queries)))
+
+        for start in range(0, len(missing), batch_size):
+            batch = missing[start:start + batch_size]
+
+            try:
+                cursor.execute(EXPLAIN_MANY_FUNCTION +
+                               "SELECT query_idx, query_plan, explain_error "
+                               "FROM pg_temp.lambdatune_explain_many(%s, %s);",
+                               ([queries[idx] for idx in batch], explain_json))
+            except Exception as e:
+                logging.warning(f"Batch explain failed, explaining the queries one by one: {e}")
+
+                for idx in batch:
+                    outs[idx] = self.explain(queries[idx], execute=False, explain_json=explain_json, config=config)
+
+                continue
+
+            for batch_idx, plan, error in cursor:
+                idx = batch[batch_idx - 1]
+
+                if error:
+                    logging.warning(f"Failed to explain query {idx}: {error}")
+                    outs[idx]["error"] = error
+                    continue
+
+                if explain_json:
+                    # psycopg2 parses the json column: [{"Plan": ...}]
+                    plan = plan[0]
+
+                outs[idx]["plan"] = plan
+
+                if plan_keys[idx]:
+                    self.plan_cache.put(plan_keys[idx], plan)
+
+        cursor.close()
+
+        return outs
+
     def explain_json(self, query):
         self.cursor.execute("EXPLAIN (format json) {}".format(query))
         return self.cursor.fetchall()[0][0][0]["Plan"]
@@ -262,6 +572,8 @@ class PostgresDriver(Driver):
             logging.info(f"Dropping index: {index}")
             self.cursor.execute(f"DROP INDEX {index}")
 
+        self.invalidate_state_fingerprint()
+
     def get_all_indexes(self):
         self.cursor.execute("SELECT indexname FROM pg_indexes WHERE tablename NOT LIKE 'pg%'")
 
@@ -278,11 +590,13 @@ class PostgresDriver(Driver):
     def reset_configuration(self, restart_system=True):
         self.conn.autocommit = True
         self.cursor.execute("ALTER SYSTEM RESET ALL;")
+        self.invalidate_state_fingerprint()
 
         if restart_system:
-            PostgresDriver.restart_system()
-
-        self.__init__(self.config)
+            self.apply_configuration(dict())
+        else:
+            # Clear any session-level settings
+            self.cursor.execute("RESET ALL;")
 
     def get_db_schema(self) -> dict:
         self.cursor.execute("""
@@ -388,25 +702,188 @@ class PostgresDriver(Driver):
         self.inject_num_distinct_values(table, attr, reduced_num_distinct_values)
 
     def set_configuration(self, config, restart=True, reset=False):
+        """
+        Applies the given ALTER SYSTEM commands. If restart is set, the changes are made effective using the
+        cheapest method their parameters allow (see apply_configuration), which restarts Postgres only if needed.
+        """
         self.conn.rollback()
         self.conn.autocommit = True
-        if config:
-            if reset:
-                logging.info("Resetting Postgres")
-                self.cursor.execute("ALTER SYSTEM RESET ALL;")
 
+        # A reset removes the settings of the previous configuration, even if the new one is empty
+        target = dict() if reset else dict(self.applied_config or {})
+        requires_restart = False
+
+        if reset:
+            logging.info("Resetting Postgres")
+            self.cursor.execute("ALTER SYSTEM RESET ALL;")
+
+        if config:
             for cf in config:
                 try:
                     logging.info("Setting config: " + cf)
                     self.cursor.execute(cf)
                 except Exception as e:
                     print(e)
+                    continue
+
+                parsed = PostgresDriver.parse_config_command(cf)
+
+                if parsed:
+                    target[parsed[0]] = parsed[1]
+                else:
+                    # We cannot tell which parameters an unknown command changes
+                    requires_restart = True
+
+        self.invalidate_state_fingerprint()
 
         if restart:
-            PostgresDriver.restart_system()
-            logging.info("waiting 5 secs...")
-            time.sleep(5)
-            self.__init__(self.config)
+            self.apply_configuration(target, requires_restart=requires_restart)
+
+    @staticmethod
+    def parse_config_command(command: str):
+        """
+        Parses an ALTER SYSTEM SET (or SET) command
+        @return: A (parameter, value) tuple or None if the command is not a SET command
+        """
+        match = CONFIG_COMMAND_PATTERN.match(command)
+
+        if not match:
+            return None
+
+        name = match.group(1).lower()
+        value = match.group(2).strip().strip("'\"")
+
+        return name, value
+
+    def get_parameter_contexts(self, parameters) -> dict:
+        """
+        Returns the context of the given parameters (postmaster, sighup, user, etc.) from pg_settings
+        """
+        if not parameters:
+            return dict()
+
+        self.cursor.execute("SELECT name, context FROM pg_settings WHERE name = ANY(%s)", (list(parameters),))
+
+        return dict(self.cursor.fetchall())
+
+    def load_applied_configuration(self):
+        """
+        Loads the ALTER SYSTEM settings currently in effect from pg_file_settings. Returns None if they cannot be
+        read (e.g., missing privileges), in which case the next configuration change restarts the system.
+        """
+        try:
+            self.cursor.execute("""
+            SELECT name, setting
+            FROM pg_file_settings
+            WHERE sourcefile LIKE '%postgresql.auto.conf' AND applied
+            """)
+
+            return dict([(d[0].lower(), d[1]) for d in self.cursor.fetchall()])
+        except Exception as e:
+            logging.warning(f"Could not read the applied configuration: {e}")
+            self.conn.rollback()
+
+            return None
+
+    def get_reconfiguration_action(self, target: dict, requires_restart: bool = False):
+        """
+        Compares the target ALTER SYSTEM settings with the ones in effect, and picks the cheapest way to apply them:
+        - none: Nothing changed
+        - session: Only parameters that can be SET in a session changed
+        - reload: The changed parameters are applied by pg_reload_conf()
+        - restart: At least one changed parameter requires a restart
+        @return: A tuple (action, changed parameters, parameter contexts)
+        """
+        if self.applied_config is None or requires_restart:
+            return "restart", sorted(target.keys()), dict()
+
+        def normalize(value):
+            return None if value is None else str(value).strip().strip("'\"").lower()
+
+        changed = [name for name in set(target.keys()).union(self.applied_config.keys())
+                   if normalize(target.get(name)) != normalize(self.applied_config.get(name))]
+
+        if not changed:
+            return "none", list(), dict()
+
+        contexts = self.get_parameter_contexts(changed)
+        action = "session"
+
+        for name in changed:
+            context = contexts.get(name)
+
+            if context in RESTART_CONTEXTS:
+                return "restart", sorted(changed), contexts
+            elif context in SESSION_CONTEXTS and name in target:
+                continue
+            elif context == "internal" or context is None:
+                # Read-only or unknown parameters cannot be changed; ALTER SYSTEM already rejected them.
+                continue
+            else:
+                action = "reload"
+
+        return action, sorted(changed), contexts
+
+    def reload(self, timeout: float = 5, interval: float = 0.01):
+        """
+        Reloads the configuration files and waits until the driver's session has processed the reload
+        """
+        self.cursor.execute("SELECT pg_conf_load_time()")
+        load_time = self.cursor.fetchall()[0][0]
+
+        self.cursor.execute("SELECT pg_reload_conf()")
+
+        start = time.time()
+
+        while time.time() - start < timeout:
+            self.cursor.execute("SELECT pg_conf_load_time()")
+
+            if self.cursor.fetchall()[0][0] > load_time:
+                return
+
+            time.sleep(interval)
+
+        logging.warning("Timed out while waiting for the configuration reload")
+
+    def apply_configuration(self, target: dict, requires_restart: bool = False):
+        """
+        Makes the target ALTER SYSTEM settings effective, restarting Postgres only if a changed parameter
+        requires it. The action taken is kept in last_reconfiguration.
+        """
+        action, changed, contexts = self.get_reconfiguration_action(target, requires_restart)
+
+        logging.info(f"Reconfiguration action: {action}, changed parameters: {changed}")
+
+        if action == "restart":
+            self.restart()
+            self.reconnect()
+        elif action == "reload":
+            # Drop earlier session-level settings, which would otherwise shadow the reloaded values
+            self.cursor.execute("RESET ALL;")
+            self.reload()
+
+            # Parameters with backend context are only picked up by new sessions
+            if any(contexts.get(name) in BACKEND_CONTEXTS for name in changed):
+                self.reconnect()
+        elif action == "session":
+            for name in changed:
+                # Read-only or unknown parameters, and parameters that were removed from the target, are not set
+                if target.get(name) is None or contexts.get(name) not in SESSION_CONTEXTS:
+                    continue
+
+                self.cursor.execute(f"SET {name} = %s", (target[name],))
+
+            # Other and future sessions (e.g., pooled connections) pick up the changes once the server has processed
+            # the reload
+            self.reload()
+
+        self.applied_config = dict(target)
+        self.last_reconfiguration = {"action": action, "changed_parameters": changed}
+
+        if action != "none":
+            self.invalidate_state_fingerprint()
+
+        return self.last_reconfiguration
 
     def get_current_global_config(self):
         """
@@ -420,6 +897,18 @@ class PostgresDriver(Driver):
 
         return result
 
+    def restart(self):
+        """
+        Restarts the instance this driver is connected to. Instances with their own data directory (e.g., clones
+        created by PostgresInstancePool) are restarted with pg_ctl, the rest through the system service.
+        """
+        if self.config.get("data_dir"):
+            logging.info(f"Restarting Postgres instance at {self.config['data_dir']}")
+            os.popen(f"pg_ctl -D {self.config['data_dir']} -m fast -w restart").read()
+            logging.info("Done!")
+        else:
+            PostgresDriver.restart_system()
+
     @staticmethod
     def restart_system():
         if platform.system() == "Darwin":
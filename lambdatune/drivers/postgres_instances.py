@@ -0,0 +1,125 @@
+import logging
+import os
+import shutil
+import subprocess
+
+from .postgres import PostgresDriver
+
+
+class PostgresInstancePool:
+    """
+    A pool of local Postgres instances (clusters) cloned from a running template instance. Every instance has its
+    own data directory and port, so that different configurations can be evaluated on them at the same time.
+    """
+    def __init__(self, conf: dict, num_instances: int, base_dir: str, base_port: int = 5433):
+        """
+        @param conf: The connection configuration of the template instance (user, password, db, host, port)
+        @param num_instances: The number of instances to clone
+        @param base_dir: The directory under which the data directories of the clones are created
+        @param base_port: The port of the first clone. Clone i listens on base_port + i.
+        """
+        self.conf = conf
+        self.num_instances = num_instances
+        self.base_dir = base_dir
+        self.base_port = base_port
+        self.instances = list()
+
+    def get_instance_conf(self, instance_id: int):
+        """
+        Returns the connection configuration of an instance
+        """
+        conf = dict(self.conf)
+        conf["host"] = "localhost"
+        conf["port"] = self.base_port + instance_id
+        conf["data_dir"] = os.path.join(self.base_dir, f"instance_{instance_id}")
+
+        return conf
+
+    def start(self):
+        """
+        Clones the template instance using pg_basebackup and starts the clones
+        @return: The instance configurations
+        """
+        os.makedirs(self.base_dir, exist_ok=True)
+
+        template_driver = PostgresDriver(self.conf)
+        template_files = dict()
+
+        for setting in ["config_file", "hba_file", "ident_file"]:
+            template_driver.get_cursor().execute(f"SHOW {setting}")
+            template_files[setting] = template_driver.get_cursor().fetchall()[0][0]
+
+        template_driver.conn.close()
+
+        for instance_id in range(0, self.num_instances):
+            conf = self.get_instance_conf(instance_id)
+            data_dir = conf["data_dir"]
+
+            if os.path.exists(data_dir):
+                logging.info(f"Removing stale data directory: {data_dir}")
+                shutil.rmtree(data_dir)
+
+            logging.info(f"Cloning template instance into {data_dir}")
+
+            backup_cmd = ["pg_basebackup", "-D", data_dir, "-X", "stream", "-U", self.conf["user"]]
+
+            if self.conf.get("host"):
+                backup_cmd.extend(["-h", self.conf["host"]])
+
+            if self.conf.get("port"):
+                backup_cmd.extend(["-p", str(self.conf["port"])])
+
+            env = dict(os.environ)
+
+            if self.conf.get("password"):
+                env["PGPASSWORD"] = self.conf["password"]
+
+            subprocess.run(backup_cmd, check=True, env=env)
+
+            self.copy_config_files(template_files, data_dir)
+
+            # The port is passed on the command line instead of postgresql.auto.conf, since ALTER SYSTEM RESET ALL
+            # would otherwise remove it. pg_ctl restart reuses the options of the last start.
+            log_file = os.path.join(self.base_dir, f"instance_{instance_id}.log")
+            subprocess.run(["pg_ctl", "-D", data_dir, "-l", log_file, "-o", f"-p {conf['port']}", "-w", "start"],
+                           check=True)
+
+            self.instances.append(conf)
+
+        return self.instances
+
+    @staticmethod
+    def copy_config_files(template_files: dict, data_dir: str):
+        """
+        Some distributions (e.g., Debian) keep the configuration files outside the data directory, in which case
+        pg_basebackup does not copy them. The clone gets a copy of the access files and an empty postgresql.conf,
+        since the template's postgresql.conf points to the template's data directory.
+        """
+        for setting in ["hba_file", "ident_file"]:
+            path = template_files[setting]
+            target = os.path.join(data_dir, os.path.basename(path))
+
+            if not os.path.exists(target):
+                shutil.copy(path, target)
+
+        config_file = os.path.join(data_dir, "postgresql.conf")
+
+        if not os.path.exists(config_file):
+            open(config_file, "w").close()
+
+    def get_drivers(self):
+        """
+        Returns a driver for every instance of the pool
+        """
+        return [PostgresDriver(conf) for conf in self.instances]
+
+    def stop(self):
+        """
+        Stops the instances and removes their data directories
+        """
+        for conf in self.instances:
+            logging.info(f"Stopping instance at {conf['data_dir']}")
+            subprocess.run(["pg_ctl", "-D", conf["data_dir"], "-m", "fast", "-w", "stop"])
+            shutil.rmtree(conf["data_dir"], ignore_errors=True)
+
+        self.instances = list()
@@ -0,0 +1,95 @@
+import logging
+import threading
+import time
+
+
+class QueryWatchdog:
+    """
+    A background thread that cancels the running statement of a session once a deadline passes. Unlike a
+    statement_timeout, the deadline is not set on the session with extra statements before and after every query,
+    and it can be moved while the statement runs (e.g., when the time budget of a configuration shrinks).
+    """
+    def __init__(self, cancel, name: str = "query-watchdog"):
+        """
+        @param cancel: The callback that cancels the running statement
+        @param name: The name of the watchdog thread
+        """
+        self.__cancel = cancel
+        self.__condition = threading.Condition()
+        self.__deadline = None
+        self.__fired = False
+        self.__stopped = False
+        self.__cancellations = 0
+
+        self.__thread = threading.Thread(target=self.__run, name=name, daemon=True)
+        self.__thread.start()
+
+    def __run(self):
+        with self.__condition:
+            while not self.__stopped:
+                if self.__deadline is None:
+                    self.__condition.wait()
+                    continue
+
+                remaining = self.__deadline - time.time()
+
+                if remaining > 0:
+                    self.__condition.wait(remaining)
+                    continue
+
+                # The deadline passed while the statement is still running. The cancellation runs under the lock, so
+                # that the next statement cannot be armed (and started) before it completes.
+                self.__deadline = None
+                self.__fired = True
+                self.__cancellations += 1
+
+                try:
+                    self.__cancel()
+                except Exception as e:
+                    logging.warning(f"Watchdog failed to cancel the running statement: {e}")
+
+    def arm(self, deadline: float):
+        """
+        Sets (or moves) the deadline of the running statement
+        @param deadline: The deadline, as an absolute time.time() value
+        """
+        with self.__condition:
+            self.__deadline = deadline
+            self.__fired = False
+            self.__condition.notify()
+
+    def tighten(self, deadline: float):
+        """
+        Moves the deadline of the running statement earlier, if it is armed
+        """
+        with self.__condition:
+            if self.__deadline is not None and deadline < self.__deadline:
+                self.__deadline = deadline
+                self.__condition.notify()
+
+    def disarm(self):
+        """
+        Clears the deadline once the statement finishes
+        @return: True if the watchdog cancelled the statement
+        """
+        with self.__condition:
+            self.__deadline = None
+            self.__condition.notify()
+
+            return self.__fired
+
+    def get_cancellations(self):
+        """
+        Returns the number of statements the watchdog has cancelled
+        """
+        return self.__cancellations
+
+    def shutdown(self):
+        """
+        Stops the watchdog thread
+        """
+        with self.__condition:
+            self.__stopped = True
+            self.__condition.notify()
+
+        self.__thread.join()
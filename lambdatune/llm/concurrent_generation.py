@@ -0,0 +1,136 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import time
+
+
+QUOTA_ERROR_PATTERN = re.compile(r"\b429\b|quota|rate.?limit|resource.?exhausted|resource has been exhausted",
+                                 re.IGNORECASE)
+
+
+def is_quota_error(doc):
+    """
+    Returns true if a generated document failed because of a quota/rate limit error. get_response returns the
+    errors as "Error: ..." strings.
+    """
+    response = doc.get("response") if isinstance(doc, dict) else doc
+
+    return isinstance(response, str) and response.startswith("Error:") and bool(QUOTA_ERROR_PATTERN.search(response))
+
+
+class TokenBucket:
+    """
+    An asyncio token bucket: allows bursts of up to capacity requests, refilled at rate requests per second
+    """
+    def __init__(self, rate: float, capacity: int = 1):
+        """
+        @param rate: The number of tokens added per second
+        @param capacity: The maximum number of tokens
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last_refill = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    async def acquire(self):
+        """
+        Waits until a token is available and takes it
+        """
+        async with self.lock:
+            self.refill()
+
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self.refill()
+
+            self.tokens -= 1
+
+
+def get_backoff_delay(attempt: int, base_delay: float, max_delay: float):
+    """
+    Exponential backoff with full jitter: a random delay in [0, min(max_delay, base_delay * 2^attempt)]
+    """
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+def write_config(path: str, doc: dict):
+    """
+    Writes a generated configuration atomically, so that a reader of the directory never sees a partial file
+    """
+    tmp_path = f"{path}.tmp"
+
+    with open(tmp_path, "w+") as f:
+        json.dump(doc, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(tmp_path, path)
+
+
+async def generate_configurations_async(generate, num_configs: int, get_path, concurrency: int = 5,
+                                        requests_per_minute: float = 60, max_retries: int = 5,
+                                        base_delay: float = 2, max_delay: float = 60, on_config=None):
+    """
+    Generates num_configs configurations concurrently, and writes every configuration to disk as soon as it arrives.
+    @param generate: The blocking function that generates one configuration (e.g., an LLM call), called as
+    generate(config_idx)
+    @param num_configs: The number of configurations
+    @param get_path: Returns the output path of a configuration, called as get_path(config_idx)
+    @param concurrency: The maximum number of requests in flight
+    @param requests_per_minute: The rate limit of the requests (including retries)
+    @param max_retries: The maximum number of retries of a request that fails with a quota error
+    @param base_delay: The base delay of the exponential backoff (seconds)
+    @param max_delay: The maximum delay of the exponential backoff (seconds)
+    @param on_config: Optional callback, called with (config_idx, path, doc) for every finished configuration
+    @return: The paths of the configurations, in the order they finished
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    bucket = TokenBucket(rate=requests_per_minute / 60, capacity=concurrency)
+    paths = list()
+
+    async def generate_one(config_idx: int):
+        doc = None
+
+        for attempt in range(0, max_retries + 1):
+            await bucket.acquire()
+
+            async with semaphore:
+                start = time.time()
+                doc = await asyncio.to_thread(generate, config_idx)
+                logging.info(f"Config {config_idx} generated in {time.time() - start:.2f}s (attempt {attempt + 1})")
+
+            if not is_quota_error(doc) or attempt == max_retries:
+                break
+
+            delay = get_backoff_delay(attempt, base_delay, max_delay)
+            logging.warning(f"Config {config_idx} hit a quota error, retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+        path = get_path(config_idx)
+        write_config(path, doc)
+        paths.append(path)
+
+        if on_config:
+            on_config(config_idx, path, doc)
+
+        return path
+
+    await asyncio.gather(*[generate_one(config_idx) for config_idx in range(0, num_configs)])
+
+    return paths
+
+
+def generate_configurations(generate, num_configs: int, get_path, **kwargs):
+    """
+    Blocking wrapper of generate_configurations_async
+    """
+    return asyncio.run(generate_configurations_async(generate, num_configs, get_path, **kwargs))
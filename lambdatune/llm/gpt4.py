@@ -2,34 +2,53 @@ import json
 import os
 import re  # Import the regular expression module
 
-import tiktoken
-
-
 # Assuming PostgresPlan is defined elsewhere correctly
 from lambdatune.plan_utils.postgres_plan_utils import PostgresPlan
 
+# The tokenizer is loaded once at startup (see set_token_counter)
+from lambdatune.prompt_generator.token_counter import get_token_counter
 
-# Assuming get_llm() exists and returns a valid model name for tiktoken
-try:
-    # Replace get_llm() with a specific model if it's not defined elsewhere
-    # encoding = tiktoken.encoding_for_model(get_llm())
-    encoding = tiktoken.encoding_for_model("gpt-4")  # Example: use a known model
-except Exception as e:
-    print(
-        f"Warning: Could not get encoding for LLM. Using default cl100k_base. Error: {e}"
-    )
-    encoding = tiktoken.get_encoding("cl100k_base")
+from lambdatune.llm.providers import get_provider
+from lambdatune.llm.response_cache import get_response_cache
+
+
+def get_response(text: str, temperature: float, model_name: str, sample_index: int = 0):
+    """
+    Returns the LLM response to a prompt, from the response cache if one is set (see set_response_cache), or from
+    the LLM provider (see set_provider; Gemini by default). Only successful responses are cached.
+    @param sample_index: The index of the sample, when the same prompt is sent several times
+    """
+    provider = get_provider()
+    cache = get_response_cache()
 
+    if cache is None:
+        return provider.complete(text, temperature, model_name=model_name, sample_index=sample_index)
 
-import google.generativeai as genai
+    key = cache.get_key(f"{provider.name}/{model_name}", temperature, sample_index, text)
+    response = cache.get(key)
 
+    if response is not None:
+        print(f"Using cached LLM response {key}")
+        return response
 
-# --- get_response function remains the same ---
-def get_response(text: str, temperature: float, model_name: str):
+    response = provider.complete(text, temperature, model_name=model_name, sample_index=sample_index)
+
+    if isinstance(response, dict):
+        cache.put(key, response, model_name=model_name, temperature=temperature, sample_index=sample_index)
+
+    return response
+
+
+# --- request_response function remains the same ---
+def request_response(text: str, temperature: float, model_name: str,
+                     system_instruction: str = "You are a helpful Database Administrator."):
     """
     Calls the Gemini API and returns a dictionary mimicking OpenAI's structure,
     or an error string.
     """
+    # Imported here, so that the other providers work without the Gemini SDK
+    import google.generativeai as genai
+
     try:
         # Configure API key if not already done globally
         # Make sure GOOGLE_API_KEY environment variable is set
@@ -38,8 +57,7 @@ def get_response(text: str, temperature: float, model_name: str):
             raise ValueError("GOOGLE_API_KEY environment variable not set.")
         genai.configure(api_key=api_key)
 
-        # Define system instruction and model
-        system_instruction = "You are a helpful Database Administrator."
+        # Define model
         # DO NOT CHANGE THIS LINE
         gemini_model_name = model_name  # DO NOT CHANGE THIS LINE
         # DO NOT CHANGE THIS LINE
@@ -352,6 +370,7 @@ def get_config_recommendations_with_compression(
     plans: list = list(),
     data_definition_language: str = None,
     model: str = "gemini-2.5-pro",
+    sample_index: int = 0,
 ):
     """
     Generate a prompt for recommendations, process the response to handle different
@@ -511,7 +530,7 @@ def get_config_recommendations_with_compression(
     resp = None
 
     if retrieve_response:
-        resp_raw = get_response(prompt, temperature=temperature, model_name=model)
+        resp_raw = get_response(prompt, temperature=temperature, model_name=model, sample_index=sample_index)
 
         # Handle error string from get_response
         if isinstance(resp_raw, str) and resp_raw.startswith("Error:"):
@@ -731,7 +750,7 @@ def get_config_recommendations_with_compression(
             else:
                 resp = str(resp_raw)  # Fallback to basic string
 
-    # num_tokens = len(encoding.encode(prompt)) # Optional
+    # num_tokens = get_token_counter().count(prompt) # Optional
 
     # Ensure the final return value for 'response' is either the processed dict or an error string
     if isinstance(resp, dict) and "choices" in resp:  # Looks like success
@@ -781,8 +800,8 @@ def get_config_recommendations_with_full_queries(
 
     # print(prompt)
     try:
-        num_tokens = len(encoding.encode(prompt))
-        print(f"Prompt token count: {num_tokens}")
+        num_tokens = get_token_counter().count(prompt)
+        print(f"Prompt token count: {num_tokens} ({get_token_counter().unit})")
     except Exception as enc_err:
         print(f"Could not calculate token count: {enc_err}")
 
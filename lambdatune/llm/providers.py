@@ -0,0 +1,180 @@
+import hashlib
+import json
+import random
+import re
+import time
+
+
+class LLMProvider:
+    """
+    The interface of an LLM backend. complete() returns the response in the OpenAI-like format used across the
+    project ({"choices": [{"message": {"content": ...}}]}), or an "Error: ..." string.
+    """
+    name = None
+
+    def complete(self, prompt: str, temperature: float, model_name: str = None, sample_index: int = 0,
+                 system_instruction: str = "You are a helpful Database Administrator."):
+        """
+        @param prompt: The prompt
+        @param temperature: The sampling temperature
+        @param model_name: The model of the provider
+        @param sample_index: The index of the sample, when the same prompt is sent several times
+        @param system_instruction: The system instruction
+        @return: The response, or an error string
+        """
+        raise NotImplementedError()
+
+
+def get_message_response(content: str):
+    """
+    Wraps a message in the OpenAI-like response format
+    """
+    return {"choices": [{"message": {"content": content}}]}
+
+
+def get_message_content(response):
+    """
+    Returns the message of a response, or the error string
+    """
+    if isinstance(response, dict):
+        try:
+            return response["choices"][0]["message"]["content"]
+        except (KeyError, IndexError, TypeError):
+            return str(response)
+
+    return str(response)
+
+
+class GeminiProvider(LLMProvider):
+    """
+    Google Gemini, through google.generativeai
+    """
+    name = "gemini"
+
+    def complete(self, prompt: str, temperature: float, model_name: str = None, sample_index: int = 0,
+                 system_instruction: str = "You are a helpful Database Administrator."):
+        from lambdatune.llm.gpt4 import request_response
+
+        return request_response(prompt, temperature=temperature, model_name=model_name or "gemini-2.5-pro",
+                                system_instruction=system_instruction)
+
+
+JOIN_CONDITIONS_HEADER = "Join conditions found in the workload:"
+FILTERS_HEADER = "Filters found in the workload:"
+COLUMN_PATTERN = re.compile(r"\b([A-Za-z_]\w*)\.([A-Za-z_]\w*)\b")
+MEMORY_PATTERN = re.compile(r"^memory:\s*(\d+(?:\.\d+)?)\s*GiB", re.IGNORECASE | re.MULTILINE)
+CORES_PATTERN = re.compile(r"^cores:\s*(\d+)", re.IGNORECASE | re.MULTILINE)
+
+
+class StubProvider(LLMProvider):
+    """
+    A local, deterministic provider for offline runs. It answers with a realistic configuration: memory and
+    parallelism settings derived from the system specs in the prompt, and one CREATE INDEX per column of the join
+    conditions (and filters) in the prompt. The response depends only on the prompt, the temperature and the sample
+    index. The latency of a real provider can be simulated.
+    """
+    name = "stub"
+
+    def __init__(self, latency: float = 0, latency_jitter: float = 0):
+        """
+        @param latency: The time (seconds) every response takes
+        @param latency_jitter: A random extra time in [0, latency_jitter] (seconds)
+        """
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+
+    @staticmethod
+    def get_section_columns(prompt: str, header: str):
+        """
+        Returns the table.column references in the lines that follow a section header of the prompt
+        """
+        columns = list()
+
+        if header not in prompt:
+            return columns
+
+        for line in prompt.split(header, 1)[1].lstrip("\n").splitlines():
+            if not line.strip():
+                break
+
+            for table, column in COLUMN_PATTERN.findall(line):
+                if (table, column) not in columns:
+                    columns.append((table, column))
+
+        return columns
+
+    def get_commands(self, prompt: str, rng: random.Random):
+        memory_match = MEMORY_PATTERN.search(prompt)
+        cores_match = CORES_PATTERN.search(prompt)
+
+        memory_mb = int(float(memory_match.group(1)) * 1024) if memory_match else 8192
+        cores = int(cores_match.group(1)) if cores_match else 4
+
+        columns = self.get_section_columns(prompt, JOIN_CONDITIONS_HEADER)
+
+        for column in self.get_section_columns(prompt, FILTERS_HEADER):
+            if column not in columns:
+                columns.append(column)
+
+        work_mem_mb = rng.choice([16, 32, 64, 128, 256])
+
+        if "mysql" in prompt.split("\n", 1)[0].lower():
+            commands = [
+                f"SET GLOBAL innodb_buffer_pool_size = {memory_mb // 2 * 1024 * 1024};",
+                f"SET GLOBAL sort_buffer_size = {work_mem_mb * 1024 * 1024};",
+                f"SET GLOBAL join_buffer_size = {work_mem_mb * 1024 * 1024};",
+                f"SET GLOBAL innodb_read_io_threads = {max(4, cores)};",
+            ]
+        else:
+            commands = [
+                f"ALTER SYSTEM SET shared_buffers = '{memory_mb // 4}MB';",
+                f"ALTER SYSTEM SET effective_cache_size = '{memory_mb * 3 // 4}MB';",
+                f"ALTER SYSTEM SET work_mem = '{work_mem_mb}MB';",
+                f"ALTER SYSTEM SET maintenance_work_mem = '{min(2048, memory_mb // 16)}MB';",
+                f"ALTER SYSTEM SET max_parallel_workers_per_gather = {max(1, cores // 2)};",
+                f"ALTER SYSTEM SET random_page_cost = {rng.choice([1.1, 1.5, 2.0])};",
+                "ALTER SYSTEM SET effective_io_concurrency = 200;",
+            ]
+
+        for table, column in columns:
+            commands.append(f"CREATE INDEX idx_{table}_{column} ON {table}({column});")
+
+        return commands
+
+    def complete(self, prompt: str, temperature: float, model_name: str = None, sample_index: int = 0,
+                 system_instruction: str = "You are a helpful Database Administrator."):
+        seed = hashlib.sha256(f"{temperature}:{sample_index}:{prompt}".encode()).hexdigest()
+        rng = random.Random(seed)
+
+        if self.latency or self.latency_jitter:
+            time.sleep(self.latency + rng.uniform(0, self.latency_jitter))
+
+        return get_message_response(json.dumps({"commands": self.get_commands(prompt, rng)}, indent=2))
+
+
+PROVIDERS = {
+    GeminiProvider.name: GeminiProvider,
+    StubProvider.name: StubProvider,
+}
+
+# The provider used by get_response
+provider: LLMProvider = GeminiProvider()
+
+
+def create_provider(name: str, **kwargs):
+    """
+    Creates a provider by name (gemini, stub)
+    """
+    if name not in PROVIDERS:
+        raise Exception(f"Unknown LLM provider: {name}")
+
+    return PROVIDERS[name](**kwargs)
+
+
+def set_provider(new_provider: LLMProvider):
+    global provider
+    provider = new_provider
+
+
+def get_provider():
+    return provider
@@ -0,0 +1,161 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+
+class ResponseCacheMiss(Exception):
+    """
+    Raised in replay-only mode when a response has not been recorded
+    """
+    pass
+
+
+class ResponseCache:
+    """
+    A content-addressed, on-disk cache of LLM responses. A response is keyed by the model, the temperature, the sample
+    index (so that the N samples of the same prompt are N different entries) and the hash of the prompt, and is
+    stored as one JSON file named by the key. The least recently used entries are evicted above max_entries or
+    max_bytes. In replay-only mode, a miss raises ResponseCacheMiss instead of calling the LLM, so that a run can be
+    reproduced offline from recorded responses.
+    """
+    def __init__(self, cache_dir: str, max_entries: int = None, max_bytes: int = None, replay_only: bool = False):
+        """
+        @param cache_dir: The directory of the cached responses
+        @param max_entries: The maximum number of cached responses (unbounded if None)
+        @param max_bytes: The maximum total size of the cached responses (unbounded if None)
+        @param replay_only: Never call the LLM; fail on cache misses
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.replay_only = replay_only
+        self.lock = threading.Lock()
+
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+        }
+
+    @staticmethod
+    def get_key(model_name: str, temperature: float, sample_index: int, prompt: str):
+        """
+        Returns the cache key of a request
+        """
+        prompt_hash = hashlib.sha256(prompt.encode()).hexdigest()
+        key = json.dumps([model_name, temperature, sample_index, prompt_hash])
+
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def get_path(self, key: str):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str):
+        """
+        Returns the cached response, or None. Raises ResponseCacheMiss in replay-only mode.
+        """
+        path = self.get_path(key)
+
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            with self.lock:
+                self.stats["misses"] += 1
+
+            if self.replay_only:
+                raise ResponseCacheMiss(f"No recorded response for {key} in {self.cache_dir}")
+
+            return None
+
+        # Marks the entry as recently used
+        os.utime(path)
+
+        with self.lock:
+            self.stats["hits"] += 1
+
+        return entry["response"]
+
+    def put(self, key: str, response, model_name: str = None, temperature: float = None, sample_index: int = None):
+        """
+        Stores a response, and evicts the least recently used responses if the cache is full
+        """
+        entry = {
+            "model": model_name,
+            "temperature": temperature,
+            "sample_index": sample_index,
+            "created": time.time(),
+            "response": response,
+        }
+
+        path = self.get_path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+
+        with open(tmp_path, "w") as f:
+            json.dump(entry, f)
+
+        os.replace(tmp_path, path)
+
+        with self.lock:
+            self.stats["stores"] += 1
+            self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache is within its limits
+        """
+        if self.max_entries is None and self.max_bytes is None:
+            return
+
+        entries = list()
+
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+
+            stat = os.stat(os.path.join(self.cache_dir, name))
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+        entries.sort()
+        total_bytes = sum(entry[1] for entry in entries)
+
+        while entries and ((self.max_entries is not None and len(entries) > self.max_entries) or
+                           (self.max_bytes is not None and total_bytes > self.max_bytes)):
+            _, size, name = entries.pop(0)
+            os.remove(os.path.join(self.cache_dir, name))
+            total_bytes -= size
+            self.stats["evictions"] += 1
+
+    def get_stats(self):
+        """
+        Returns the hit/miss/store/eviction counters and the hit rate
+        """
+        with self.lock:
+            stats = dict(self.stats)
+
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+
+        return stats
+
+
+# The cache used by get_response (disabled by default)
+response_cache: ResponseCache = None
+
+
+def set_response_cache(cache: ResponseCache):
+    global response_cache
+    response_cache = cache
+
+    if cache:
+        logging.info(f"LLM response cache: {cache.cache_dir} (replay only: {cache.replay_only})")
+
+
+def get_response_cache():
+    return response_cache
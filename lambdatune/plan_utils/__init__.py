@@ -1,5 +1,6 @@
 from .indices import extract_indices_from_plan, extract_scans_from_plan, extract_table_sets
 from .plan_files import load_plan_files
-from .postgres_plan_node import PostgresPlanNode
+from .postgres_plan_node import PostgresPlanNode, PostgresPlanTree
 from .postgres_plan_node_visitor import PostgresPlanNodeVisitor
-from .join_collector import JoinCollectorVisitor
\ No newline at end of file
+from .join_collector import JoinCollectorVisitor
+from .predicates import ColumnInterner, parse_predicate
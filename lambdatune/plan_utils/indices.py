@@ -1,63 +1,87 @@
-def extract_indices_from_plan(plan_json):
-    node_type = plan_json["Node Type"]
+def iterate_plan(plan_json):
+    """
+    Iterates over the nodes of an EXPLAIN JSON plan in pre-order, without recursion. Yields (node, parent position)
+    pairs, where the position of a node is its index in the iteration.
+    """
+    stack = [(plan_json, -1)]
+    idx = 0
 
-    indices = list()
+    while stack:
+        node, parent = stack.pop()
+        yield node, parent
+
+        if "Plans" in node:
+            for child in reversed(node["Plans"]):
+                stack.append((child, idx))
 
-    if "Index Scan" in node_type:
-        index_name = plan_json["Index Name"]
+        idx += 1
 
-        indices.append(index_name)
 
-    if "Plans" in plan_json:
-        children = plan_json["Plans"]
+def extract_indices_from_plan(plan_json):
+    indices = list()
 
-        for child in children:
-            for idx in extract_indices_from_plan(child):
-                indices.append(idx)
+    for node, _ in iterate_plan(plan_json):
+        if "Index Scan" in node["Node Type"]:
+            indices.append(node["Index Name"])
 
     return indices
 
 def extract_scans_from_plan(plan_json):
-    node_type = plan_json["Node Type"]
     scans = list()
 
-    if "Index Scan" == node_type or "Seq Scan" in node_type:
-        if "Relation Name" not in plan_json:
-            print()
-        table_name = plan_json["Relation Name"]
+    for node, _ in iterate_plan(plan_json):
+        node_type = node["Node Type"]
 
-        scans.append(table_name)
-    if "Plans" in plan_json:
-        children = plan_json["Plans"]
-
-        for child in children:
-            for idx in extract_scans_from_plan(child):
-                scans.append(idx)
+        if "Index Scan" == node_type or "Seq Scan" in node_type:
+            scans.append(node["Relation Name"])
 
     return scans
 
 
 def extract_table_sets(plan_json):
-    node_type = plan_json["Node Type"]
+    # The nodes in pre-order, and the position of their parents
+    nodes = list()
+    parents = list()
+
+    stack = [plan_json]
+    stack_parents = [-1]
+
+    while stack:
+        node = stack.pop()
+        parents.append(stack_parents.pop())
+        nodes.append(node)
+
+        if "Plans" in node:
+            for child in reversed(node["Plans"]):
+                stack.append(child)
+                stack_parents.append(len(nodes) - 1)
+
+    # The tables of the children of every node, merged into the parent once a node is done
+    children_tables = [None] * len(nodes)
     table_sets = set()
 
-    if "Index Scan" == node_type or "Seq Scan" in node_type:
-        table_name = plan_json["Relation Name"]
+    # The children come after their parents in pre-order
+    for idx in range(len(nodes) - 1, -1, -1):
+        node = nodes[idx]
+        node_type = node["Node Type"]
+        tables = children_tables[idx]
 
-        table_sets.add(frozenset({table_name}))
+        if "Plans" in node:
+            table_sets.add(frozenset(tables or ()))
 
-    if "Plans" in plan_json:
-        children = plan_json["Plans"]
+        if tables is None:
+            tables = set()
 
-        new_table_set = set()
+        if "Index Scan" == node_type or "Seq Scan" in node_type:
+            table_sets.add(frozenset({node["Relation Name"]}))
+            tables.add(node["Relation Name"])
 
-        for child in children:
-            for table_set in extract_table_sets(child):
-                table_sets.add(table_set)
+        parent = parents[idx]
 
-                for tbl in table_set:
-                    new_table_set.add(tbl)
-        new_table_set = frozenset(new_table_set)
-        table_sets.add(new_table_set)
+        if parent >= 0:
+            if children_tables[parent] is None:
+                children_tables[parent] = tables
+            else:
+                children_tables[parent].update(tables)
 
-    return table_sets
\ No newline at end of file
+    return table_sets
@@ -1,8 +1,35 @@
 from collections import defaultdict
+from typing import NamedTuple
+
+from lambdatune.plan_utils.predicates import ColumnInterner, parse_predicate, get_equi_joins, get_columns
+
+# The plan fields that may contain join conditions
+JOIN_CONDITION_FIELDS = ["Hash Cond", "Merge Cond", "Join Filter", "Recheck Cond", "Index Cond"]
+
+
+class PlanConditions(NamedTuple):
+    """
+    The conditions of a plan, with the columns as (table, column) tuples
+    """
+    # (left column, right column, cost estimation of the node) of the join conditions
+    conditions: list
+    filter_columns: list
+    # relation (or "relation as alias") -> number of scans
+    relations: dict
+    aliases: dict
 
 
 class JoinCollectorVisitor:
-    def __init__(self, db_schema: dict):
+    """
+    Collects the join conditions (column = column equalities) and the filtered columns of query plans. The
+    predicates are parsed into ASTs (see predicates.py), and the columns are interned as integer ids, with the aliases
+    of every plan resolved to their relations.
+    """
+    def __init__(self, db_schema: dict, interner: ColumnInterner = None):
+        """
+        @param db_schema: The tables and their columns
+        @param interner: The ids of the table.column names (a new one by default)
+        """
         self.filter_operands = set()
         self.join_conditions = defaultdict(int)
         self.join_cost_estimations = dict()
@@ -12,141 +39,144 @@ class JoinCollectorVisitor:
         self.filters=dict()
         self.query_costs=dict()
 
+        self.interner = interner or ColumnInterner()
+        # (left id, right id) -> frequency, cost estimation of the join node, and cost of the query
+        self.join_keys = defaultdict(int)
+        self.join_key_costs = dict()
+        self.join_key_query_costs = dict()
+
     def get_filter_operands(self, condition):
-        operands = set()
-
-        if " OR " in condition:
-            for condition in condition.split(" OR "):
-                for op in self.get_filter_operands(condition):
-                    operands.add(op)
-        elif " AND " in condition:
-            for condition in condition.split(" AND "):
-                for op in self.get_filter_operands(condition):
-                    operands.add(op)
-        else:
-            condition = condition.replace("(", "").replace(")", "")
-
-            if " = " in condition:
-                split = condition.split(" = ")
-            elif " > " in condition:
-                split = condition.split(" > ")
-            elif " < " in condition:
-                split = condition.split(" < ")
-            elif " >= " in condition:
-                split = condition.split(" >= ")
-            elif " <= " in condition:
-                split = condition.split(" <= ")
-            elif " <> " in condition:
-                split = condition.split(" <> ")
-            else:
-                return operands
-
-            for op in split:
-                operands.add(op)
-
-        return operands
-
-    def visit(self, node,query_cost):
-        for child in node.children:
-            child.accept(self,query_cost)
-
-        if "Alias" in node.info and "Relation Name" in node.info:
-            rel_name = node.info["Relation Name"]
-            self.aliases[node.info["Alias"]] = rel_name
-
-        if "Relation Name" in node.info:
-            rel_name = node.info["Relation Name"]
-
-            if "Alias" in node.info:
-                self.aliases[node.info["Alias"]] = rel_name
-                rel_name += " as " + node.info["Alias"]
-
-            self.relations[rel_name] += 1
-
-        if "Filter" in node.info:
-                cond = node.info["Filter"]
-                operands = self.get_filter_operands(cond)
-                for operand in operands:
-                    if "Relation Name" in node.info:
-                        name = node.info["Relation Name"]
-                        self.filter_operands.add(f"{name}.{operand}")
-                # if "Relation Name" in node.info:
-                #     self.filters[f'{node.info["Relation Name"]}.{cond}']=node.cost_estim
-
-        # Check for join keys
-        join_cond = None
-
-        if "Join Filter" in node.info:
-            join_cond = node.info["Join Filter"][1:-1]
-        elif "Hash Cond" in node.info:
-            join_cond = node.info["Hash Cond"][1:-1]
-        elif "Recheck Cond" in node.info:
-            join_cond = node.info["Recheck Cond"][1:-1]
-
-            if node.info["Node Type"] == "Bitmap Heap Scan":
-                join_cond = node.info["Relation Name"] + "." + join_cond
-        elif "Index Cond" in node.info:
-            if "Relation Name" in node.info:
-                join_cond = node.info["Relation Name"] + "." + node.info["Index Cond"][1:-1]
-        else:
-            pass
+        """
+        Returns the columns referenced by a filter, as they appear in the filter (e.g., t.a or a)
+        """
+        return set(f"{column.table}.{column.name}" if column.table else column.name
+                   for column in get_columns(parse_predicate(condition)))
+
+    def visit(self, node, query_cost=None):
+        self.add(self.collect(node), query_cost)
+
+    @staticmethod
+    def collect(node):
+        """
+        Collects the conditions of a plan (the subtree of a node), with the aliases of the plan resolved, as a
+        PlanConditions record of strings. Records do not depend on the state of a collector, so they can be collected
+        in other processes (see plan_analysis.py) and added in order.
+        """
+        tree = node.tree
+
+        # The aliases of this plan, and the conditions with the columns as they appear in the plan
+        plan_aliases = dict()
+        plan_conditions = list()
+        plan_filters = list()
+        relations = defaultdict(int)
+
+        for idx in tree.get_subtree(node.idx):
+            info = tree.infos[idx]
+            rel_name = tree.relations[idx]
+            alias = tree.aliases[idx]
+
+            if rel_name is not None:
+                if alias is not None:
+                    plan_aliases[alias] = rel_name
+                    relations[f"{rel_name} as {alias}"] += 1
+                else:
+                    relations[rel_name] += 1
+
+            if "Filter" in info:
+                plan_filters.append((info["Filter"], rel_name))
+
+            seen = set()
+
+            for field in JOIN_CONDITION_FIELDS:
+                cond = info.get(field)
+
+                # Index conditions without a relation (e.g., of bitmap index scans) are rechecked by their parents
+                if cond is None or cond in seen or (field == "Index Cond" and rel_name is None):
+                    continue
 
-        if join_cond:
-            if len(join_cond.split(" = ")) == 2:
-                if len(join_cond.split(" = ")[0].split(".")) == 2 and len(join_cond.split(" = ")[1].split(".")) == 2:
-                    # Skip complex expressions
+                seen.add(cond)
 
-                    try:
-                        left_tbl, left_col = join_cond.split(" = ")[0].split(".")
-                        right_tbl, right_col = join_cond.split(" = ")[1].split(".")
-                    except Exception:
-                        print()
+                for left, right in get_equi_joins(parse_predicate(cond)):
+                    plan_conditions.append((left, right, rel_name, tree.total_costs[idx]))
 
-                    """
-                        Process only if both tables and columns exists in the schema
-                    """
-                    left_tbl = self.aliases[left_tbl] if left_tbl in self.aliases else left_tbl
-                    right_tbl = self.aliases[right_tbl] if right_tbl in self.aliases else right_tbl
+        conditions = list()
 
-                    cond1 = left_tbl in self.db_schema
-                    cond2 = left_col in self.db_schema[left_tbl]
-                    cond3 = right_tbl in self.db_schema
-                    cond4 = right_col in self.db_schema[right_tbl]
+        for left, right, rel_name, cost_estim in plan_conditions:
+            left = JoinCollectorVisitor.resolve_column(left, rel_name, plan_aliases)
+            right = JoinCollectorVisitor.resolve_column(right, rel_name, plan_aliases)
 
-                    cost_estim = node.cost_estim
+            if left is not None and right is not None:
+                conditions.append((left, right, cost_estim))
 
-                    self.join_cost_estimations[join_cond] = cost_estim
-                    self.join_conditions[join_cond] += 1
-                    self.query_costs[join_cond]=query_cost
+        filter_columns = list()
 
-    def resolve_aliases(self):
-        for join_condition in list(self.join_conditions.keys()):
-            and_conditions = join_condition.split("AND")
+        for cond, rel_name in plan_filters:
+            for column in get_columns(parse_predicate(cond)):
+                column = JoinCollectorVisitor.resolve_column(column, rel_name, plan_aliases)
 
-            if len(and_conditions) > 1:
-                pass
+                if column is not None:
+                    filter_columns.append(column)
 
-            for i in range(0, len(and_conditions)):
-                cond = and_conditions[i].split(" = ")
+        return PlanConditions(conditions, filter_columns, dict(relations), plan_aliases)
 
-                if len(cond) == 1:
-                    continue
+    def add(self, plan_conditions, query_cost=None):
+        """
+        Adds the conditions collected from a plan
+        @param plan_conditions: The PlanConditions of the plan
+        @param query_cost: The cost of the query of the plan
+        """
+        self.aliases.update(plan_conditions.aliases)
+
+        for relation, count in plan_conditions.relations.items():
+            self.relations[relation] += count
+
+        for left, right, cost_estim in plan_conditions.conditions:
+            key = (self.interner.get_id(*left), self.interner.get_id(*right))
+            self.join_keys[key] += 1
+            self.join_key_costs[key] = cost_estim
+            self.join_key_query_costs[key] = query_cost
 
-                left = self.resolve_alias(cond[0])
-                right = self.resolve_alias(cond[1])
+            join_cond = self.get_condition_name(key)
+            self.join_cost_estimations[join_cond] = cost_estim
+            self.join_conditions[join_cond] += 1
+            self.query_costs[join_cond]=query_cost
 
-                and_conditions[i] = f"{left} = {right}"
+        for column in plan_conditions.filter_columns:
+            self.filter_operands.add(self.interner.get_name(self.interner.get_id(*column)))
 
-            new_join_condition = " AND ".join(and_conditions)
+    @staticmethod
+    def resolve_column(column, rel_name: str, plan_aliases: dict):
+        """
+        Returns the (table, column) of a column: qualified columns are resolved through the aliases of the plan, and
+        unqualified columns belong to the relation of their node. Returns None if the table is unknown.
+        """
+        table = column.table
+
+        if table is None:
+            table = rel_name
+        else:
+            table = plan_aliases.get(table, table)
 
-            if new_join_condition != join_condition:
-                self.join_conditions[new_join_condition] += 1
-                self.join_cost_estimations[new_join_condition] = self.join_cost_estimations[join_condition]
-                self.query_costs[new_join_condition]=self.query_costs[join_condition]
+        if table is None:
+            return None
 
-                # Remove the old key
-                self.join_conditions.pop(join_condition)
-                self.join_cost_estimations.pop(join_condition)
+        return table, column.name
+
+    def get_condition_name(self, key: tuple):
+        return f"{self.interner.get_name(key[0])} = {self.interner.get_name(key[1])}"
+
+    def get_join_keys(self):
+        """
+        Returns the join conditions as [(left id, right id), frequency, cost estimation, query cost] rows
+        """
+        return [[key, self.join_keys[key], self.join_key_costs[key], self.join_key_query_costs[key]]
+                for key in self.join_keys]
+
+    def resolve_aliases(self):
+        """
+        The aliases are resolved per plan while visiting it. Kept for the callers that resolve them explicitly.
+        """
+        pass
 
     def resolve_alias(self, operand):
         split = operand.split(".")
@@ -154,4 +184,4 @@ class JoinCollectorVisitor:
         if len(split) == 2 and split[0] in self.aliases:
             return f"{self.aliases[split[0]]}.{split[1]}"
         else:
-            return operand
\ No newline at end of file
+            return operand
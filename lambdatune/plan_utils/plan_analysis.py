@@ -0,0 +1,66 @@
+import logging
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+
+from lambdatune.plan_utils.postgres_plan_node import PostgresPlanNode
+from lambdatune.plan_utils.join_collector import JoinCollectorVisitor
+
+
+def collect_plan_conditions(plans: list):
+    """
+    Collects the conditions of EXPLAIN JSON plans (the "Plan" of every plan). Runs in the worker processes.
+    @return: The PlanConditions of every plan, or None if the plan could not be processed
+    """
+    results = list()
+
+    for plan in plans:
+        try:
+            results.append(JoinCollectorVisitor.collect(PostgresPlanNode(plan)))
+        except Exception as e:
+            logging.warning(f"Exception thrown while collecting the conditions of a plan: {e}")
+            results.append(None)
+
+    return results
+
+
+def collect_plan_conditions_parallel(plans: list, num_workers: int = None, chunk_size: int = 64):
+    """
+    Collects the conditions of EXPLAIN JSON plans in a process pool. The plans are sent to the workers in chunks, and
+    the results are returned in the order of the plans, whatever the number of workers, so that adding them to a
+    JoinCollectorVisitor in this order gives the same result as visiting the plans one by one.
+    @param plans: The "Plan" of every EXPLAIN JSON plan
+    @param num_workers: The number of worker processes (the number of CPUs by default). With one worker (or a single
+    chunk), the plans are processed in this process.
+    @param chunk_size: The number of plans per task
+    @return: The PlanConditions of every plan, or None if the plan could not be processed
+    """
+    num_workers = num_workers or os.cpu_count() or 1
+    chunks = [plans[i:i + chunk_size] for i in range(0, len(plans), chunk_size)]
+
+    if num_workers <= 1 or len(chunks) <= 1:
+        return collect_plan_conditions(plans)
+
+    results = list()
+
+    with ProcessPoolExecutor(max_workers=min(num_workers, len(chunks))) as executor:
+        # map returns the results in the order of the chunks
+        for chunk_results in executor.map(collect_plan_conditions, chunks):
+            results.extend(chunk_results)
+
+    return results
+
+
+def reduce_plan_conditions(collector: JoinCollectorVisitor, plan_conditions: list, query_costs: list):
+    """
+    Adds the conditions of plans to a collector, in order: the frequencies are summed, and the costs are those of
+    the last plan with the condition, exactly as when visiting the plans one by one.
+    @param collector: The collector
+    @param plan_conditions: The PlanConditions of every plan (None for the plans that are skipped)
+    @param query_costs: The cost of the query of every plan
+    """
+    for conditions, query_cost in zip(plan_conditions, query_costs):
+        if conditions is not None:
+            collector.add(conditions, query_cost)
+
+    return collector
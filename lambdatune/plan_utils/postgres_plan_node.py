@@ -1,3 +1,6 @@
+from collections import deque
+
+
 class ScanCollectorVisitor:
     def __init__(self):
         self.scans = set()
@@ -34,24 +37,199 @@ class JoinCollectorVisitor:
             self.joins.add(plan)
 
 
+class PostgresPlanTree:
+    """
+    A flattened query plan: the attributes of the plan nodes are stored in parallel lists, indexed by the position of
+    the node in depth-first pre-order (the order of the EXPLAIN output; the root is 0), so that every subtree is a
+    contiguous range. The tree is built in one iterative pass over the EXPLAIN JSON. The JSON nodes are referenced,
+    not copied.
+    """
+    __slots__ = ("node_types", "total_costs", "plan_rows", "actual_rows", "actual_times", "parents", "relations",
+                 "aliases", "index_names", "subtree_sizes", "num_children", "infos", "nodes")
+
+    def __init__(self, json_root: dict):
+        self.node_types = list()
+        self.total_costs = list()
+        self.plan_rows = list()
+        self.actual_rows = list()
+        self.actual_times = list()
+        self.parents = list()
+        self.relations = list()
+        self.aliases = list()
+        self.index_names = list()
+        self.num_children = list()
+        self.infos = list()
+        self.nodes = None
+
+        stack = [(json_root, -1)]
+
+        while stack:
+            json_node, parent = stack.pop()
+            idx = len(self.infos)
+
+            self.node_types.append(json_node["Node Type"])
+            self.total_costs.append(json_node["Total Cost"])
+            self.plan_rows.append(json_node.get("Plan Rows"))
+            self.actual_rows.append(json_node.get("Actual Rows"))
+            self.actual_times.append(json_node.get("Actual Total Time"))
+            self.parents.append(parent)
+            self.relations.append(json_node.get("Relation Name"))
+            self.aliases.append(json_node.get("Alias"))
+            self.index_names.append(json_node.get("Index Name"))
+            self.infos.append(json_node)
+
+            children = json_node.get("Plans", ())
+            self.num_children.append(len(children))
+
+            for child in reversed(children):
+                stack.append((child, idx))
+
+        # The descendants of a node come after it in pre-order
+        self.subtree_sizes = [1] * len(self.infos)
+
+        for idx in range(len(self.infos) - 1, 0, -1):
+            self.subtree_sizes[self.parents[idx]] += self.subtree_sizes[idx]
+
+    def __len__(self):
+        return len(self.infos)
+
+    def get_children(self, idx: int):
+        """
+        Returns the indexes of the children of a node
+        """
+        children = list()
+        child = idx + 1
+
+        for _ in range(0, self.num_children[idx]):
+            children.append(child)
+            child += self.subtree_sizes[child]
+
+        return children
+
+    def get_subtree(self, idx: int = 0):
+        """
+        Returns the indexes of the nodes of a subtree, in pre-order
+        """
+        return range(idx, idx + self.subtree_sizes[idx])
+
+    def get_node(self, idx: int = 0):
+        """
+        Returns the PostgresPlanNode of a node. The nodes are created once, on the first access.
+        """
+        if self.nodes is None:
+            self.nodes = [None] * len(self.infos)
+
+        node = self.nodes[idx]
+
+        if node is None:
+            node = PostgresPlanNode(tree=self, idx=idx)
+            self.nodes[idx] = node
+
+        return node
+
+    def get_indexes(self):
+        """
+        Returns the names of the indexes used by the index scans of the plan, in pre-order
+        """
+        return [self.index_names[idx] for idx, node_type in enumerate(self.node_types) if "Index Scan" in node_type]
+
+    def get_scans(self):
+        """
+        Returns the relations of the index and sequential scans of the plan, in pre-order
+        """
+        return [self.relations[idx] for idx, node_type in enumerate(self.node_types)
+                if node_type == "Index Scan" or "Seq Scan" in node_type]
+
+    def get_table_sets(self):
+        """
+        Returns the sets of tables joined by the subtrees of the plan
+        """
+        # The tables of the children of every node, merged into the parent once a node is done
+        children_tables = [None] * len(self.infos)
+        table_sets = set()
+
+        # The children come after their parents in pre-order
+        for idx in range(len(self.infos) - 1, -1, -1):
+            node_type = self.node_types[idx]
+            tables = children_tables[idx]
+
+            if self.num_children[idx]:
+                table_sets.add(frozenset(tables))
+            else:
+                tables = set()
+
+            if node_type == "Index Scan" or "Seq Scan" in node_type:
+                table_sets.add(frozenset({self.relations[idx]}))
+                tables.add(self.relations[idx])
+
+            parent = self.parents[idx]
+
+            if parent >= 0:
+                if children_tables[parent] is None:
+                    children_tables[parent] = tables
+                else:
+                    children_tables[parent].update(tables)
+
+        return table_sets
+
+
 class PostgresPlanNode:
-    def __init__(self, json_node):
-        self.node_type = json_node["Node Type"]
-        self.actual_time = json_node["Actual Total Time"] if "Actual Total Time" in json_node else None
-        self.cost_estim = json_node["Total Cost"]
-        self.actual_rows = json_node["Actual Rows"] if "Actual Rows" in json_node else None
-        self.plan_rows = json_node["Plan Rows"] if "Plan Rows" in json_node else None
-        self.is_join = "Plans" in json_node and  len(json_node["Plans"]) == 2
-        self.info = json_node
-        self.children = list()
-
-        self.parent = None
-
-        if "Plans" in json_node:
-            for plan in json_node["Plans"]:
-                child = PostgresPlanNode(plan)
-                child.parent = self
-                self.children.append(child)
+    """
+    A node of a PostgresPlanTree: a lightweight view (the tree and the index of the node), created on first access
+    """
+    __slots__ = ("tree", "idx")
+
+    def __init__(self, json_node=None, tree: PostgresPlanTree = None, idx: int = 0):
+        """
+        @param json_node: The EXPLAIN JSON of the plan, if the node is the root of a new tree
+        @param tree: The tree of the node, otherwise
+        @param idx: The index of the node in the tree
+        """
+        self.tree = tree if tree is not None else PostgresPlanTree(json_node)
+        self.idx = idx
+
+        if tree is None:
+            # The root is the node of the tree at index 0
+            self.tree.nodes = [None] * len(self.tree)
+            self.tree.nodes[0] = self
+
+    @property
+    def node_type(self):
+        return self.tree.node_types[self.idx]
+
+    @property
+    def actual_time(self):
+        return self.tree.actual_times[self.idx]
+
+    @property
+    def cost_estim(self):
+        return self.tree.total_costs[self.idx]
+
+    @property
+    def actual_rows(self):
+        return self.tree.actual_rows[self.idx]
+
+    @property
+    def plan_rows(self):
+        return self.tree.plan_rows[self.idx]
+
+    @property
+    def is_join(self):
+        return self.tree.num_children[self.idx] == 2
+
+    @property
+    def info(self):
+        return self.tree.infos[self.idx]
+
+    @property
+    def children(self):
+        return [self.tree.get_node(idx) for idx in self.tree.get_children(self.idx)]
+
+    @property
+    def parent(self):
+        parent = self.tree.parents[self.idx]
+
+        return self.tree.get_node(parent) if parent >= 0 else None
 
     def get_scans(self):
         scan_visitor = ScanCollectorVisitor()
@@ -74,16 +252,10 @@ class PostgresPlanNode:
         return set(frozenset(join.get_scans()) for join in self.get_joins())
 
     def get_nodes_as_list(self):
-        nodes = [self]
-
-        for child in self.children:
-            for node in child.get_nodes_as_list():
-                nodes.append(node)
-
-        return nodes
+        return [self.tree.get_node(idx) for idx in self.tree.get_subtree(self.idx)]
 
-    def accept(self, visitor,query_cost):
-        visitor.visit(self,query_cost)
+    def accept(self, visitor, *args):
+        visitor.visit(self, *args)
 
     def __str__(self):
-        return self.node_type
\ No newline at end of file
+        return self.node_type
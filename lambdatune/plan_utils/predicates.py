@@ -0,0 +1,499 @@
+import re
+
+from functools import lru_cache
+from typing import NamedTuple
+
+
+class Column(NamedTuple):
+    """
+    A column reference. The table is the qualifier of the reference (a table name or an alias), or None.
+    """
+    table: str
+    name: str
+
+
+class Literal(NamedTuple):
+    value: str
+
+
+class Cast(NamedTuple):
+    arg: object
+    type: str
+
+
+class Comparison(NamedTuple):
+    op: str
+    left: object
+    right: object
+
+
+class BoolOp(NamedTuple):
+    """
+    AND/OR over two or more arguments
+    """
+    op: str
+    args: tuple
+
+
+class Not(NamedTuple):
+    arg: object
+
+
+class Func(NamedTuple):
+    """
+    A function call, or a construct with arguments (e.g., ANY (...), ROW (...), unary operators)
+    """
+    name: str
+    args: tuple
+
+
+class Other(NamedTuple):
+    """
+    A part of the predicate that is not parsed (e.g., sub-plans, CASE), kept as text
+    """
+    text: str
+
+
+TOKEN_PATTERN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<string>'(?:[^']|'')*')
+  | (?P<number>\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)
+  | (?P<param>\$\d+)
+  | (?P<quoted>"(?:[^"]|"")*")
+  | (?P<ident>[A-Za-z_][A-Za-z0-9_$]*)
+  | (?P<cast>::)
+  | (?P<punct>[(),.\[\]])
+  | (?P<op>[=<>!~*+\-/%|&^#@?]+)
+""", re.VERBOSE)
+
+COMPARISON_OPS = {"=", "<>", "!=", "<", ">", "<=", ">=", "~~", "!~~", "~~*", "!~~*", "~", "!~", "~*", "!~*",
+                  "LIKE", "ILIKE", "NOT LIKE", "NOT ILIKE", "IS DISTINCT FROM", "IS NOT DISTINCT FROM", "@>", "<@",
+                  "&&"}
+
+# The words that end a type name after ::
+TYPE_STOP_WORDS = {"AND", "OR", "IS", "NOT", "LIKE", "ILIKE", "ANY", "ALL", "IN", "THEN", "ELSE", "END", "WHEN"}
+
+# Binding powers of the infix operators
+OR_PRECEDENCE = 1
+AND_PRECEDENCE = 2
+NOT_PRECEDENCE = 3
+IS_PRECEDENCE = 4
+COMPARISON_PRECEDENCE = 5
+OPERATOR_PRECEDENCE = 6
+UNARY_PRECEDENCE = 7
+
+
+class PredicateParseError(Exception):
+    pass
+
+
+def tokenize(text: str):
+    tokens = list()
+    pos = 0
+
+    while pos < len(text):
+        match = TOKEN_PATTERN.match(text, pos)
+
+        if not match:
+            raise PredicateParseError(f"Unexpected character {text[pos]!r} at {pos}")
+
+        kind = match.lastgroup
+
+        if kind != "space":
+            tokens.append((kind, match.group()))
+
+        pos = match.end()
+
+    return tokens
+
+
+class PredicateParser:
+    """
+    A recursive descent (precedence climbing) parser of the predicates that Postgres prints in EXPLAIN (Hash Cond,
+    Merge Cond, Index Cond, Recheck Cond, Join Filter, Filter). Parts it does not understand become Other nodes.
+    """
+    def __init__(self, text: str):
+        self.text = text
+        self.tokens = tokenize(text)
+        self.pos = 0
+
+    def peek(self, offset: int = 0):
+        idx = self.pos + offset
+        return self.tokens[idx] if idx < len(self.tokens) else (None, None)
+
+    def peek_word(self, offset: int = 0):
+        kind, value = self.peek(offset)
+        return value.upper() if kind == "ident" else None
+
+    def next(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def expect(self, value: str):
+        kind, token = self.next()
+
+        if token != value:
+            raise PredicateParseError(f"Expected {value!r}, found {token!r} in {self.text!r}")
+
+    def skip_balanced(self, open_token: str, close_token: str):
+        """
+        Skips the tokens up to the matching close token (the open token is already consumed), and returns them
+        """
+        depth = 1
+        start = self.pos
+
+        while depth:
+            kind, value = self.next()
+
+            if kind is None:
+                raise PredicateParseError(f"Unbalanced {open_token!r} in {self.text!r}")
+
+            if value == open_token:
+                depth += 1
+            elif value == close_token:
+                depth -= 1
+
+        return " ".join(token[1] for token in self.tokens[start:self.pos - 1])
+
+    def parse(self):
+        expr = self.parse_expression(0)
+
+        if self.pos != len(self.tokens):
+            raise PredicateParseError(f"Unexpected {self.peek()[1]!r} in {self.text!r}")
+
+        return expr
+
+    def parse_expression(self, min_precedence: int):
+        left = self.parse_prefix()
+
+        while True:
+            kind, value = self.peek()
+            word = self.peek_word()
+
+            if value == "::":
+                self.next()
+                left = Cast(left, self.parse_type())
+            elif value == "[":
+                # Array subscripts
+                self.next()
+                left = Func("[]", (left, Other(self.skip_balanced("[", "]"))))
+            elif word == "OR" and OR_PRECEDENCE > min_precedence:
+                self.next()
+                left = self.merge_bool("OR", left, self.parse_expression(OR_PRECEDENCE))
+            elif word == "AND" and AND_PRECEDENCE > min_precedence:
+                self.next()
+                left = self.merge_bool("AND", left, self.parse_expression(AND_PRECEDENCE))
+            elif word == "IS" and IS_PRECEDENCE > min_precedence:
+                self.next()
+                left = self.parse_is(left)
+            elif COMPARISON_PRECEDENCE > min_precedence and self.get_comparison_op() is not None:
+                op = self.get_comparison_op()
+                self.pos += len(op.split(" "))
+                left = Comparison(op, left, self.parse_comparison_operand())
+            elif kind == "op" and OPERATOR_PRECEDENCE > min_precedence:
+                self.next()
+                left = Func(value, (left, self.parse_expression(OPERATOR_PRECEDENCE)))
+            else:
+                return left
+
+    def get_comparison_op(self):
+        kind, value = self.peek()
+
+        if kind == "op":
+            return value if value in COMPARISON_OPS else None
+
+        word = self.peek_word()
+
+        if word in ("LIKE", "ILIKE"):
+            return word
+
+        if word == "NOT" and self.peek_word(1) in ("LIKE", "ILIKE"):
+            return f"NOT {self.peek_word(1)}"
+
+        return None
+
+    def parse_comparison_operand(self):
+        # x = ANY (...), x <> ALL (...)
+        if self.peek_word() in ("ANY", "ALL", "SOME") and self.peek(1)[1] == "(":
+            name = self.next()[1].upper()
+            self.next()
+            arg = self.parse_expression(0)
+            self.expect(")")
+
+            return Func(name, (arg,))
+
+        return self.parse_expression(COMPARISON_PRECEDENCE)
+
+    def parse_is(self, left):
+        negated = self.peek_word() == "NOT"
+
+        if negated:
+            self.next()
+
+        word = self.peek_word()
+
+        if word in ("NULL", "TRUE", "FALSE", "UNKNOWN"):
+            self.next()
+            return Comparison("IS NOT" if negated else "IS", left, Literal(word))
+
+        if word == "DISTINCT" and self.peek_word(1) == "FROM":
+            self.pos += 2
+            op = "IS NOT DISTINCT FROM" if negated else "IS DISTINCT FROM"
+            return Comparison(op, left, self.parse_expression(IS_PRECEDENCE))
+
+        raise PredicateParseError(f"Unexpected IS {word} in {self.text!r}")
+
+    def parse_type(self):
+        kind, value = self.next()
+
+        if kind not in ("ident", "quoted"):
+            raise PredicateParseError(f"Expected a type after :: in {self.text!r}")
+
+        words = [value]
+
+        # Multi-word types (e.g., character varying, timestamp without time zone)
+        while self.peek()[0] == "ident" and self.peek_word() not in TYPE_STOP_WORDS:
+            words.append(self.next()[1])
+
+        if self.peek()[1] == "(":
+            self.next()
+            words.append(f"({self.skip_balanced('(', ')')})")
+
+        while self.peek()[1] == "[" and self.peek(1)[1] == "]":
+            self.pos += 2
+            words[-1] += "[]"
+
+        return " ".join(words)
+
+    def parse_prefix(self):
+        kind, value = self.next()
+
+        if kind is None:
+            raise PredicateParseError(f"Unexpected end of {self.text!r}")
+
+        if kind == "string" or kind == "number":
+            return Literal(value)
+
+        if kind == "param":
+            return Other(value)
+
+        if value == "(":
+            return self.parse_parenthesized()
+
+        if value == "[":
+            return Other(f"[{self.skip_balanced('[', ']')}]")
+
+        if kind == "op":
+            # Unary operators (e.g., -1)
+            return Func(value, (self.parse_expression(UNARY_PRECEDENCE),))
+
+        if kind in ("ident", "quoted"):
+            return self.parse_identifier(kind, value)
+
+        raise PredicateParseError(f"Unexpected {value!r} in {self.text!r}")
+
+    def parse_parenthesized(self):
+        start = self.pos
+
+        try:
+            args = [self.parse_expression(0)]
+
+            while self.peek()[1] == ",":
+                self.next()
+                args.append(self.parse_expression(0))
+
+            self.expect(")")
+        except PredicateParseError:
+            # e.g., (SubPlan 1), (hashed SubPlan 2)
+            self.pos = start
+            return Other(f"({self.skip_balanced('(', ')')})")
+
+        if len(args) == 1:
+            return args[0]
+
+        return Func("ROW", tuple(args))
+
+    def parse_identifier(self, kind: str, value: str):
+        word = value.upper() if kind == "ident" else None
+
+        if word == "NOT":
+            return Not(self.parse_expression(NOT_PRECEDENCE))
+
+        if word in ("NULL", "TRUE", "FALSE"):
+            return Literal(word)
+
+        if word == "CASE":
+            depth = 1
+            start = self.pos
+
+            while depth:
+                token_kind, token = self.next()
+
+                if token_kind is None:
+                    raise PredicateParseError(f"Unterminated CASE in {self.text!r}")
+
+                if token_kind == "ident" and token.upper() == "CASE":
+                    depth += 1
+                elif token_kind == "ident" and token.upper() == "END":
+                    depth -= 1
+
+            return Other("CASE " + " ".join(token[1] for token in self.tokens[start:self.pos]))
+
+        if word == "ARRAY" and self.peek()[1] == "[":
+            self.next()
+            return Other(f"ARRAY[{self.skip_balanced('[', ']')}]")
+
+        name = unquote(value)
+
+        if self.peek()[1] == "(":
+            self.next()
+
+            if self.peek()[1] == ")":
+                self.next()
+                return Func(name, ())
+
+            args = [self.parse_expression(0)]
+
+            while self.peek()[1] == ",":
+                self.next()
+                args.append(self.parse_expression(0))
+
+            self.expect(")")
+
+            return Func(name, tuple(args))
+
+        if self.peek()[1] == "." and self.peek(1)[0] in ("ident", "quoted"):
+            self.next()
+            column = unquote(self.next()[1])
+
+            return Column(name, column)
+
+        return Column(None, name)
+
+    @staticmethod
+    def merge_bool(op: str, left, right):
+        args = list()
+
+        for arg in (left, right):
+            if isinstance(arg, BoolOp) and arg.op == op:
+                args.extend(arg.args)
+            else:
+                args.append(arg)
+
+        return BoolOp(op, tuple(args))
+
+
+def unquote(identifier: str):
+    if identifier.startswith('"'):
+        return identifier[1:-1].replace('""', '"')
+
+    return identifier
+
+
+@lru_cache(maxsize=65536)
+def parse_predicate(text: str):
+    """
+    Parses a predicate of an EXPLAIN plan into an AST. The parsed predicates are memoized, since the same predicates
+    appear in the plans of many queries and configurations. A predicate that cannot be parsed becomes an Other node.
+    """
+    try:
+        return PredicateParser(text).parse()
+    except PredicateParseError:
+        return Other(text)
+
+
+def get_conjuncts(expr):
+    """
+    Returns the AND-ed parts of a predicate
+    """
+    if isinstance(expr, BoolOp) and expr.op == "AND":
+        return expr.args
+
+    return (expr,)
+
+
+def get_column(expr):
+    """
+    Returns the column of an expression that is a column reference (possibly cast), or None
+    """
+    while isinstance(expr, Cast):
+        expr = expr.arg
+
+    return expr if isinstance(expr, Column) else None
+
+
+def get_equi_joins(expr):
+    """
+    Returns the column = column equalities of the AND-ed parts of a predicate, as (left, right) pairs of Columns
+    """
+    joins = list()
+
+    for conjunct in get_conjuncts(expr):
+        if isinstance(conjunct, Comparison) and conjunct.op == "=":
+            left = get_column(conjunct.left)
+            right = get_column(conjunct.right)
+
+            if left is not None and right is not None:
+                joins.append((left, right))
+
+    return joins
+
+
+def get_columns(expr):
+    """
+    Returns all the columns referenced by a predicate
+    """
+    columns = list()
+    stack = [expr]
+
+    while stack:
+        expr = stack.pop()
+
+        if isinstance(expr, Column):
+            columns.append(expr)
+        elif isinstance(expr, (Cast, Not)):
+            stack.append(expr.arg)
+        elif isinstance(expr, Comparison):
+            stack.append(expr.right)
+            stack.append(expr.left)
+        elif isinstance(expr, (BoolOp, Func)):
+            stack.extend(reversed(expr.args))
+
+    return columns
+
+
+class ColumnInterner:
+    """
+    Assigns a unique integer id to every table.column, so that conditions are handled as pairs of integers
+    """
+    def __init__(self):
+        self.ids = dict()
+        self.columns = list()
+
+    def get_id(self, table: str, column: str):
+        key = (table, column)
+        column_id = self.ids.get(key)
+
+        if column_id is None:
+            column_id = len(self.columns)
+            self.ids[key] = column_id
+            self.columns.append(key)
+
+        return column_id
+
+    def get_column(self, column_id: int):
+        """
+        Returns the (table, column) of an id
+        """
+        return self.columns[column_id]
+
+    def get_name(self, column_id: int):
+        """
+        Returns the table.column name of an id
+        """
+        table, column = self.columns[column_id]
+        return f"{table}.{column}" if table else column
+
+    def __len__(self):
+        return len(self.columns)
@@ -10,24 +10,50 @@ from lambdatune.benchmarks import *
 from lambdatune.drivers import Driver
 from lambdatune.plan_utils.postgres_plan_utils import PostgresPlan
 from lambdatune.plan_utils import JoinCollectorVisitor
+from lambdatune.plan_utils.predicates import ColumnInterner
+from lambdatune.plan_utils.plan_analysis import collect_plan_conditions_parallel, reduce_plan_conditions
 from lambdatune.utils import get_dbms_driver
 
 from lambdatune.llm import get_config_recommendations_with_compression, get_config_recommendations_with_full_queries
+from lambdatune.llm.concurrent_generation import generate_configurations
 
 from lambdatune.prompt_generator.ilp_solver import ILPSolver
+from lambdatune.prompt_generator.token_counter import PromptLengthTracker
 
 
-def group_join_conditions(join_conditions):
-    joins = defaultdict(list)
+def group_join_conditions(join_conditions, interner: ColumnInterner = None):
+    """
+    Groups the join conditions by their left key
+    @param join_conditions: [condition, frequency, cost estimation, query cost] rows. With an interner, the conditions
+    are (left id, right id) pairs of interned columns, otherwise "left = right" strings.
+    @param interner: The interner of the column ids
+    @return: left key -> [[right key, cost estimation, query cost], ...]
+    """
+    if interner is None:
+        joins = defaultdict(list)
+        for cond in join_conditions:
+            split = cond[0].split(" = ")
+
+            if len(split) < 2:
+                continue
+
+            left = split[0]
+            right = split[1]
+            joins[left].append([right, cond[2], cond[3]])
+
+        return joins
+
+    # Grouped by integer id, and named once per key
+    id_joins = defaultdict(list)
+
     for cond in join_conditions:
-        split = cond[0].split(" = ")
+        left_id, right_id = cond[0]
+        id_joins[left_id].append([right_id, cond[2], cond[3]])
 
-        if len(split) < 2:
-            continue
+    joins = defaultdict(list)
 
-        left = split[0]
-        right = split[1]
-        joins[left].append([right, cond[2], cond[3]])
+    for left_id, rights in id_joins.items():
+        joins[interner.get_name(left_id)] = [[interner.get_name(right[0]), right[1], right[2]] for right in rights]
 
     return joins
 
@@ -90,57 +116,106 @@ def get_queries(benchmark: str):
     return queries
 
 
-def extract_conditions(driver, queries):
+def build_postgres_plan(query_id, plan):
+    """
+    Builds the PostgresPlan of an EXPLAIN JSON plan
+    @return: The PostgresPlan, or None if the plan could not be parsed
+    """
+    try:
+        return PostgresPlan(plan)
+    except Exception as e:
+        logging.warning(f"Exception thrown while processing {query_id}")
+        logging.warning(f"Parsing exception: {e}")
+        logging.warning(f"Plan: {plan}")
+        return None
+
+
+def extract_conditions(driver, queries, interner: ColumnInterner = None, num_workers: int = 1,
+                       build_plans: bool = True):
+    """
+    Extracts the join conditions of the plans of the queries
+    @param interner: The interner of the column ids of the conditions (a new one by default)
+    @param num_workers: The number of processes that collect the conditions of the plans
+    @param build_plans: Whether the PostgresPlans of the queries are returned. With several workers, the plans are
+    only parsed by the workers otherwise.
+    @return: The [(left id, right id), frequency, cost estimation, query cost] rows of the join conditions, the
+    filters, the query costs, and the (query id, PostgresPlan, query cost) plans (empty if not build_plans with
+    several workers)
+    """
     schema = driver.get_db_schema()
     plans = list()
     c = 0
-    for q in queries:
+    # All the queries are explained in one batch
+    outs = driver.explain_many([q[1] for q in queries], explain_json=True)
+    for q, plan in zip(queries, outs):
         query_id = q[0]
-        plan = driver.explain(q[1], explain_json=True, execute=False)
 
         if plan:
             plans.append((query_id, plan))
             c += 1
 
     postgres_plans = list()
+    collector = JoinCollectorVisitor(db_schema = schema, interner=interner)
 
-    for plan in plans:
-        query_id = plan[0]
+    if num_workers > 1:
+        # Only the raw JSON is kept here: the workers parse the plans and collect their conditions, which are added in
+        # the order of the queries
+        raw_plans = list()
 
-        try:
-            pg_plan = PostgresPlan(plan[1])
-        except Exception as e:
-            logging.warning(f"Exception thrown while processing {query_id}")
-            logging.warning(f"Parsing exception: {e}")
-            logging.warning(f"Plan: {plan[1]}")
-            continue
+        for query_id, plan in plans:
+            try:
+                raw_plans.append((query_id, plan, plan['plan']['Plan']['Total Cost']))
+            except (KeyError, TypeError) as e:
+                logging.warning(f"Exception thrown while processing {query_id}")
+                logging.warning(f"Parsing exception: {e}")
+                logging.warning(f"Plan: {plan}")
 
-        postgres_plans.append((query_id, pg_plan,plan[1]['plan']['Plan']['Total Cost']))
+        plan_conditions = collect_plan_conditions_parallel([p[1]['plan']['Plan'] for p in raw_plans], num_workers)
 
-    collector = JoinCollectorVisitor(db_schema = schema)
+        # The plans that the workers could not process are skipped, as in the serial path
+        raw_plans = [p for p, conditions in zip(raw_plans, plan_conditions) if conditions is not None]
+        reduce_plan_conditions(collector, [c for c in plan_conditions if c is not None], [p[2] for p in raw_plans])
 
-    for p in list(postgres_plans):
-        p[1].root.accept(collector,p[2])
+        if build_plans:
+            for query_id, plan, query_cost in raw_plans:
+                pg_plan = build_postgres_plan(query_id, plan)
 
-    collector.resolve_aliases()
+                if pg_plan is not None:
+                    postgres_plans.append((query_id, pg_plan, query_cost))
+
+        query_costs = {p[0]: p[2] for p in raw_plans}
+    else:
+        for query_id, plan in plans:
+            pg_plan = build_postgres_plan(query_id, plan)
 
-    conditions = [[d, collector.join_conditions[d], collector.join_cost_estimations[d],collector.query_costs[d]] for d in collector.join_conditions]
+            if pg_plan is None:
+                continue
 
-    for idx, condition in enumerate(conditions):
-        cond = condition[0]
+            postgres_plans.append((query_id, pg_plan, plan['plan']['Plan']['Total Cost']))
 
-        left_tbl, left_col = cond.split(" = ")[0].split(".")
-        right_tbl, right_col = cond.split(" = ")[1].split(".")
+        for p in list(postgres_plans):
+            p[1].root.accept(collector,p[2])
 
-        left_cond = left_tbl in schema and left_col in schema[left_tbl]
-        right_cond = right_tbl in schema and right_col in schema[right_tbl]
+        query_costs = {p[0]: p[2] for p in postgres_plans}
 
-        left_operand = f"{left_tbl}.{left_col}" if left_cond else "--"
-        right_operand = f"{right_tbl}.{right_col}" if right_cond else "--"
+    conditions = collector.get_join_keys()
 
-        conditions[idx] = [f"{left_operand} = {right_operand}", condition[1], condition[2], condition[3]]
+    # The columns that are not in the schema are replaced by "--"
+    interner = collector.interner
+    unknown_id = interner.get_id(None, "--")
+    schema_ids = dict()
 
-    return conditions,[(x[0],x[1],'filter') for x in sorted(collector.filters.items(),key=lambda x:x[1],reverse=True)],defaultdict(lambda: float('inf'), {x[0]: x[2] for x in postgres_plans}),postgres_plans
+    def get_schema_id(column_id):
+        if column_id not in schema_ids:
+            tbl, col = interner.get_column(column_id)
+            schema_ids[column_id] = column_id if tbl in schema and col in schema[tbl] else unknown_id
+
+        return schema_ids[column_id]
+
+    for condition in conditions:
+        condition[0] = (get_schema_id(condition[0][0]), get_schema_id(condition[0][1]))
+
+    return conditions,[(x[0],x[1],'filter') for x in sorted(collector.filters.items(),key=lambda x:x[1],reverse=True)],defaultdict(lambda: float('inf'), query_costs),postgres_plans
 
 
 def hide_table_column_names(compressed_columns):
@@ -360,7 +435,9 @@ def analyze_sql_queries(queries):
 
 def get_configurations_with_compression(target_db: str, benchmark: str, memory_gb: int, num_cores: int, driver: Driver,
                                         queries: dict, output_dir_path: str,query_weight:bool,does_use_workload_statistics:bool,does_use_internal_metrics:bool,query_plan:bool,does_use_data_definition_language:bool, model: str, token_budget: int = sys.maxsize,
-                                        num_configs: int=5, temperature: float=0.2):
+                                        num_configs: int=5, temperature: float=0.2, concurrency: int=5,
+                                        requests_per_minute: float=60, knapsack_solver: str="auto",
+                                        plan_workers: int=1):
     driver.drop_all_non_pk_indexes()
     driver.reset_configuration()
     # --- Proposed methodology START ---
@@ -385,12 +462,14 @@ def get_configurations_with_compression(target_db: str, benchmark: str, memory_g
                 with open('DSGen-software-code-4.0.0_final/tools/tpcds_source.sql') as f2:
                     data_definition_language = f'''{f1.read()}
 {f2.read()}'''
-    conditions,filters,costs,plans = extract_conditions(driver, queries)
+    interner = ColumnInterner()
+    conditions,filters,costs,plans = extract_conditions(driver, queries, interner, num_workers=plan_workers,
+                                                   build_plans=query_plan)
     # --- Proposed methodology END ---
-    grouped_conditions = group_join_conditions(conditions)
+    grouped_conditions = group_join_conditions(conditions, interner)
 
     indexes = True
-    solver = ILPSolver(query_weight)
+    solver = ILPSolver(query_weight, solver=knapsack_solver)
 
     # --- Proposed methodology START ---
     sorted_conditions=sorted([(c[0],c[2],'join') for c in conditions]+filters,key=lambda x:x[1],reverse=True)
@@ -400,22 +479,20 @@ def get_configurations_with_compression(target_db: str, benchmark: str, memory_g
 #     with open('e1_ilp_time.txt','a')as f:             
 #         f.write(f'''{target_db} {benchmark}:{elapsed}
 # ''') 
-    target=''
-    for c in optimized_with_dependencies:
-        target += f"{c}: {optimized_with_dependencies[c]}\n"
+    # The prompt lengths are tracked incrementally, instead of re-rendering the conditions for every condition
+    target_length = PromptLengthTracker.from_conditions(optimized_with_dependencies, solver.token_counter).get_length()
+    prompt_length = PromptLengthTracker(solver.token_counter)
     cost=0
     join_conditions=defaultdict(list)
     filters=list()
     for cond in sorted_conditions:
-        prompt=''
-        for c in join_conditions:
-            prompt += f"{c}: {join_conditions[c]}\n"
-        if len(prompt)>len(target):
+        if prompt_length.get_length()>target_length:
             break
         cost+=cond[1]
         if cond[2]=='join':
-            s=cond[0].split(' = ')
+            s=[interner.get_name(column_id) for column_id in cond[0]]
             join_conditions[s[0]].append(s[1])
+            prompt_length.add(s[0], s[1])
         if cond[2]=='filter':
             filters.append(cond[0])
     # --- Proposed methodology END ---
@@ -424,11 +501,8 @@ def get_configurations_with_compression(target_db: str, benchmark: str, memory_g
 
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
-    for i in range(0, num_configs):
-        # --- Proposed methodology START ---
-        t=time.time()
-        # --- Proposed methodology END ---
-        doc = get_config_recommendations_with_compression(dst_system=target_db,
+    def generate(i):
+        return get_config_recommendations_with_compression(dst_system=target_db,
                                                         relations=None,
                                                         temperature=temperature,
                                                         retrieve_response=True,
@@ -442,12 +516,19 @@ def get_configurations_with_compression(target_db: str, benchmark: str, memory_g
                                                         query_plan=query_plan,
                                                         plans=plans,
                                                         data_definition_language=data_definition_language,
-                                                        model=model
+                                                        model=model,
                                                         # --- Proposed methodology END ---
+                                                        sample_index=i
                                                         )
 
-        path = os.path.join(output_dir, f"config_{benchmark}_tokens_{token_budget}_{temperature}_{int(time.time())}.json")
-        json.dump(doc, open(path, "w+"), indent=2)
+    def get_path(i):
+        # The configs are generated concurrently, so the timestamp alone is not unique
+        return os.path.join(output_dir, f"config_{benchmark}_tokens_{token_budget}_{temperature}_{int(time.time())}_{i}.json")
+
+    # The requests are sent concurrently, and every config is written to the output directory as soon as it arrives
+    generate_configurations(generate, num_configs, get_path,
+                            concurrency=concurrency,
+                            requests_per_minute=requests_per_minute,
+                            on_config=lambda i, path, doc: print("Done: " + path))
 
-        print("Done: " + output_dir)
     return costs
\ No newline at end of file
@@ -1,22 +1,29 @@
+import logging
+import time
+
 from collections import defaultdict
 
-import tiktoken
-from gurobipy import GRB, Model
-from lambdatune.utils import get_llm
+from lambdatune.prompt_generator.token_counter import TokenCounter, get_token_counter
+from lambdatune.prompt_generator.knapsack import TreeKnapsackGroup, get_fractional_upper_bound, get_total_weight, \
+    select_all, solve_exact, solve_greedy
+
+KNAPSACK_SOLVERS = ["auto", "exact", "greedy", "gurobi"]
 
-# encoding = tiktoken.encoding_for_model(get_llm())
-encoding = None
 
-def optimize(conditions: list, token_budget: int):
+def optimize(conditions: list, token_budget: int, token_counter: TokenCounter = None):
     """
     Value = frequency * estimated cost
     Weight = #tokens
     """
+    from gurobipy import GRB, Model
+
+    token_counter = token_counter or get_token_counter()
+
     values = [d[1] * d[2] for d in conditions]
     weights = list()
 
     for condition in conditions:
-        weight = len(condition)#len(encoding.encode(condition[0]))
+        weight = token_counter.count(condition[0])
         weights.append(weight)
 
     m = Model("knapsack")
@@ -45,12 +52,27 @@ def optimize(conditions: list, token_budget: int):
 
 
 class ILPSolver:
-    def __init__(self,query_weight):
+    def __init__(self,query_weight, solver: str = "auto", max_dp_cells: int = 50_000_000,
+                 token_counter: TokenCounter = None):
+        """
+        @param query_weight: Add the query costs of the conditions to the objective
+        @param solver: The knapsack solver: exact (DP), greedy, gurobi, or auto (exact if the DP table has at most
+        max_dp_cells cells, greedy otherwise)
+        @param max_dp_cells: The maximum size (#keys * token budget) of the DP table in auto mode
+        @param token_counter: The token counter of the keys (see set_token_counter by default)
+        """
+        if solver not in KNAPSACK_SOLVERS:
+            raise Exception(f"Unknown knapsack solver: {solver}")
+
         self.key_to_idx = defaultdict(list)
         self.idx_to_key = dict()
         # --- Proposed methodology START ---
         self.query_weight=query_weight
         # --- Proposed methodology END ---
+        self.solver = solver
+        self.max_dp_cells = max_dp_cells
+        self.token_counter = token_counter or get_token_counter()
+        self.metrics = dict()
 
     def extract_dependencies(self, conditions: dict):
         dependencies = defaultdict(set)
@@ -94,8 +116,7 @@ class ILPSolver:
             # --- Proposed methodology END ---
 
             # The cost of the left key is its number of tokens
-            # costs.append(len(encoding.encode(left_key)))
-            costs.append(len(left_key))
+            costs.append(self.token_counter.count(left_key))
 
             right_keys = sorted(condition_set[1], key=lambda x: x[0])
 
@@ -116,14 +137,19 @@ class ILPSolver:
                 values.append(value)
                 # --- Proposed methodology START ---
                 query_values.append(query_value)
-                # costs.append(len(encoding.encode(key)))
-                costs.append(len(key))
+                costs.append(self.token_counter.count(key))
                 # --- Proposed methodology END ---
 
         # --- Proposed methodology START ---
         return dependencies, costs, values,query_values
         # --- Proposed methodology END ---
 
+    def get_metrics(self):
+        """
+        Returns the solver, the running time, the objective value and its upper bound of the last optimization
+        """
+        return self.metrics
+
     def optimize_with_dependencies(self, conditions: dict, token_budget: int):
         # Reset key_to_idx
         self.key_to_idx = defaultdict(list)
@@ -132,6 +158,69 @@ class ILPSolver:
         dependencies, weights, values,query_values = self.extract_dependencies(conditions)
         # --- Proposed methodology END ---
 
+        start = time.time()
+
+        if self.solver == "gurobi":
+            selected, objective = self.solve_gurobi(dependencies, weights, values, query_values, token_budget)
+            solver = "gurobi"
+            upper_bound = objective
+        else:
+            beta = 1 if self.query_weight else 0
+            groups = [TreeKnapsackGroup(dep_key, weights[dep_key],
+                                        [(i, weights[i], values[i] + beta * query_values[i])
+                                         for i in sorted(dependencies[dep_key])])
+                      for dep_key in dependencies]
+
+            total_weight = get_total_weight(groups)
+            num_keys = sum(len(group.children) + 1 for group in groups)
+
+            if total_weight <= token_budget:
+                # Everything fits into the budget
+                solver = "all"
+                selected = select_all(groups)
+            elif self.solver == "exact" or (self.solver == "auto" and
+                                            num_keys * (token_budget + 1) <= self.max_dp_cells):
+                solver = "exact"
+                selected, _ = solve_exact(groups, token_budget)
+            else:
+                solver = "greedy"
+                selected, _ = solve_greedy(groups, token_budget)
+
+            objective = sum(values[i] + beta * query_values[i] for i in selected)
+            upper_bound = get_fractional_upper_bound(groups, token_budget) if solver == "greedy" else objective
+
+        self.metrics = {
+            "solver": solver,
+            "elapsed": time.time() - start,
+            "objective": objective,
+            "upper_bound": upper_bound,
+            # The greedy solution is within this ratio of the optimum
+            "quality_bound": objective / upper_bound if upper_bound else 1.0,
+        }
+
+        logging.info(f"Knapsack solver: {self.metrics}")
+
+        selected_conditions = defaultdict(list)
+
+        # --- Proposed methodology START ---
+        for dep_key in dependencies:
+            left_key=self.idx_to_key[dep_key]
+            if dep_key in selected:
+                for dep_value in dependencies[dep_key]:
+                    key=self.idx_to_key[dep_value]
+                    if dep_value in selected:
+                        selected_conditions[left_key].append(key)
+
+        return selected_conditions,sum(values[i] for i in selected)
+        # --- Proposed methodology END ---
+
+    def solve_gurobi(self, dependencies, weights, values, query_values, token_budget: int):
+        """
+        Solves the dependency knapsack as an ILP with Gurobi
+        @return: The ids of the selected keys, and the objective value
+        """
+        from gurobipy import GRB, Model
+
         m = Model("knapsack")
         m.setParam("OutputFlag", 0)
 
@@ -182,18 +271,7 @@ class ILPSolver:
 
         m.optimize()
 
-        selected_conditions = defaultdict(list)
-
-        key_counter = defaultdict(int)
-
-        # --- Proposed methodology START ---
-        for dep_key in dependencies:
-            left_key=self.idx_to_key[dep_key]
-            if x[dep_key].x == 1:
-                for dep_value in dependencies[dep_key]:
-                    key=self.idx_to_key[dep_value]
-                    if x[dep_value].x == 1:
-                        selected_conditions[left_key].append(key)
+        selected = set(i for i in range(len(weights)) if x[i].x > 0.5)
 
         # for condition_set in conditions.items():
         #     left_key = condition_set[0]
@@ -215,5 +293,4 @@ class ILPSolver:
         #             if x[right_key_idx].x == 1:
         #                 selected_conditions[left_key].append(key)
         #                 total_cost+=cost
-        return selected_conditions,sum(values[i] * x[i] for i in range(len(values))).getValue()
-        # --- Proposed methodology END ---
+        return selected, m.objVal
@@ -0,0 +1,174 @@
+import heapq
+
+import numpy as np
+
+
+class TreeKnapsackGroup:
+    """
+    A group of the dependency knapsack: a left join key and its right join keys. A right key can only be selected
+    together with its left key, and the left key only together with at least one right key.
+    """
+    __slots__ = ("left_idx", "left_weight", "children")
+
+    def __init__(self, left_idx: int, left_weight: int, children: list):
+        """
+        @param left_idx: The id of the left key
+        @param left_weight: The weight (#tokens) of the left key
+        @param children: The right keys, as (id, weight, value) tuples
+        """
+        self.left_idx = left_idx
+        self.left_weight = left_weight
+        self.children = children
+
+
+def get_total_weight(groups: list):
+    return sum(group.left_weight + sum(child[1] for child in group.children) for group in groups)
+
+
+def get_fractional_upper_bound(groups: list, budget: int):
+    """
+    An upper bound of the optimal value: the fractional knapsack of the right keys, with left keys that cost nothing
+    """
+    items = [(child[2], child[1]) for group in groups for child in group.children if child[2] > 0]
+    items.sort(key=lambda item: item[0] / item[1] if item[1] > 0 else float("inf"), reverse=True)
+
+    bound = 0.0
+    remaining = budget
+
+    for value, weight in items:
+        if weight <= remaining:
+            bound += value
+            remaining -= weight
+        else:
+            bound += value * remaining / weight
+            break
+
+    return bound
+
+
+def select_all(groups: list):
+    """
+    The solution when everything fits into the budget: all the right keys with a positive value
+    """
+    selected = set()
+
+    for group in groups:
+        children = [child[0] for child in group.children if child[2] > 0]
+
+        if children:
+            selected.add(group.left_idx)
+            selected.update(children)
+
+    return selected
+
+
+def solve_exact(groups: list, budget: int):
+    """
+    Solves the dependency knapsack exactly, with a DP over the capacities (best[c] = the best value within weight c)
+    that processes one group at a time: the left key is paid first, and then its right keys are added as 0/1 items.
+    Runs in O(#keys * budget) time and memory.
+    @param groups: The TreeKnapsackGroups
+    @param budget: The maximum total weight
+    @return: The ids of the selected keys, and their total value
+    """
+    budget = int(min(budget, get_total_weight(groups)))
+    best = np.zeros(budget + 1)
+
+    # Per group: where opening the group is better, and per right key, where the key is taken
+    group_decisions = list()
+
+    for group in groups:
+        opened = np.full(budget + 1, -np.inf)
+
+        if group.left_weight <= budget:
+            opened[group.left_weight:] = best[:budget + 1 - group.left_weight]
+
+        child_decisions = list()
+
+        for _, weight, value in group.children:
+            taken = np.zeros(budget + 1, dtype=bool)
+
+            if weight <= budget:
+                candidate = opened[:budget + 1 - weight] + value
+                taken[weight:] = candidate > opened[weight:]
+                opened[weight:] = np.where(taken[weight:], candidate, opened[weight:])
+
+            child_decisions.append(taken)
+
+        # Opening a group without any right key never beats not opening it, since best is non-decreasing
+        open_group = opened > best
+        best = np.where(open_group, opened, best)
+
+        group_decisions.append((open_group, child_decisions))
+
+    selected = set()
+    capacity = budget
+
+    for group, (open_group, child_decisions) in zip(reversed(groups), reversed(group_decisions)):
+        if not open_group[capacity]:
+            continue
+
+        for child, taken in zip(reversed(group.children), reversed(child_decisions)):
+            if taken[capacity]:
+                selected.add(child[0])
+                capacity -= child[1]
+
+        selected.add(group.left_idx)
+        capacity -= group.left_weight
+
+    return selected, float(best[budget])
+
+
+def solve_greedy(groups: list, budget: int):
+    """
+    Solves the dependency knapsack greedily by value/weight ratio. A group is opened by its best right key, paying
+    for the left key too; its other right keys then compete at their own ratio. Runs in O(#keys log #keys).
+    @param groups: The TreeKnapsackGroups
+    @param budget: The maximum total weight
+    @return: The ids of the selected keys, and their total value
+    """
+    heap = list()
+    sorted_children = list()
+
+    for group_idx, group in enumerate(groups):
+        children = sorted([child for child in group.children if child[2] > 0],
+                          key=lambda child: child[2] / child[1] if child[1] > 0 else float("inf"), reverse=True)
+        sorted_children.append(children)
+
+        # Opens the group with every right key that fits, and pushes the rest once the group is open
+        for child_idx, child in enumerate(children):
+            weight = group.left_weight + child[1]
+            heapq.heappush(heap, (-child[2] / weight if weight > 0 else -float("inf"), group_idx, child_idx, True))
+
+    opened = set()
+    selected = set()
+    remaining = budget
+    value = 0.0
+
+    while heap:
+        _, group_idx, child_idx, opens_group = heapq.heappop(heap)
+        group = groups[group_idx]
+        child = sorted_children[group_idx][child_idx]
+
+        if child[0] in selected or (opens_group and group_idx in opened):
+            continue
+
+        weight = child[1] + (group.left_weight if opens_group else 0)
+
+        if weight > remaining:
+            continue
+
+        selected.add(child[0])
+        remaining -= weight
+        value += child[2]
+
+        if opens_group:
+            opened.add(group_idx)
+            selected.add(group.left_idx)
+
+            for other_idx, other in enumerate(sorted_children[group_idx]):
+                if other_idx != child_idx:
+                    ratio = other[2] / other[1] if other[1] > 0 else float("inf")
+                    heapq.heappush(heap, (-ratio, group_idx, other_idx, False))
+
+    return selected, value
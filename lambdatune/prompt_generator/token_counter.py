@@ -0,0 +1,122 @@
+import logging
+
+
+# The encoding of the models tiktoken does not know (e.g., Gemini)
+DEFAULT_ENCODING = "cl100k_base"
+
+
+class TokenCounter:
+    """
+    Counts the tokens of prompt fragments with the tokenizer of the LLM, loaded once. The counts are memoized per
+    fragment, since the same join keys are counted many times during prompt compression. Without a tokenizer (or if
+    it cannot be loaded, e.g., offline), the number of characters is used instead.
+    """
+    def __init__(self, tokenizer: str = None):
+        """
+        @param tokenizer: A model name (e.g., gpt-4) or a tiktoken encoding name (e.g., cl100k_base). None counts
+        characters.
+        """
+        self.tokenizer = tokenizer
+        self.encoding = None
+        self.counts = dict()
+
+        if tokenizer:
+            self.encoding = load_encoding(tokenizer)
+
+        self.unit = "tokens" if self.encoding else "characters"
+
+    def count(self, text: str):
+        """
+        Returns the number of tokens of a text
+        """
+        num_tokens = self.counts.get(text)
+
+        if num_tokens is None:
+            num_tokens = len(self.encoding.encode(text)) if self.encoding else len(text)
+            self.counts[text] = num_tokens
+
+        return num_tokens
+
+
+def load_encoding(tokenizer: str):
+    """
+    Loads the tiktoken encoding of a model or an encoding name. Unknown names get the DEFAULT_ENCODING. Returns None
+    if the encoding cannot be loaded (e.g., tiktoken is not installed).
+    """
+    try:
+        import tiktoken
+    except ImportError:
+        logging.warning("tiktoken is not installed, counting characters instead of tokens")
+        return None
+
+    try:
+        try:
+            return tiktoken.encoding_for_model(tokenizer)
+        except KeyError:
+            pass
+
+        try:
+            return tiktoken.get_encoding(tokenizer)
+        except ValueError:
+            logging.warning(f"Unknown tokenizer {tokenizer}, counting the tokens with {DEFAULT_ENCODING}")
+            return tiktoken.get_encoding(DEFAULT_ENCODING)
+    except Exception as e:
+        logging.warning(f"Could not load the {tokenizer} tokenizer, counting characters instead of tokens: {e}")
+        return None
+
+
+class PromptLengthTracker:
+    """
+    Tracks the length of the join conditions of a prompt, rendered as "left_key: ['right_key', ...]" lines, while
+    conditions are added: every addition costs O(1) (memoized) token counts instead of re-rendering the prompt. The
+    length is the sum of the token counts of the fragments of the lines; with the character counter it is exactly the
+    length of the rendered string.
+    """
+    def __init__(self, counter: TokenCounter):
+        self.counter = counter
+        self.conditions = dict()
+        self.length = 0
+
+    def add(self, left_key: str, right_key: str):
+        """
+        Adds the condition left_key = right_key
+        """
+        if left_key in self.conditions:
+            self.length += self.counter.count(", ")
+        else:
+            self.conditions[left_key] = list()
+            self.length += self.counter.count(f"{left_key}: [") + self.counter.count("]\n")
+
+        self.conditions[left_key].append(right_key)
+        self.length += self.counter.count(repr(right_key))
+
+    def get_length(self):
+        return self.length
+
+    @staticmethod
+    def from_conditions(conditions: dict, counter: TokenCounter):
+        """
+        Returns the tracker of grouped conditions (left_key -> right keys)
+        """
+        tracker = PromptLengthTracker(counter)
+
+        for left_key in conditions:
+            for right_key in conditions[left_key]:
+                tracker.add(left_key, right_key)
+
+        return tracker
+
+
+# The counter used for the weights of the prompt compression (characters by default, see set_token_counter)
+token_counter: TokenCounter = TokenCounter()
+
+
+def set_token_counter(counter: TokenCounter):
+    global token_counter
+    token_counter = counter
+
+    logging.info(f"Token counter: {counter.tokenizer} ({counter.unit})")
+
+
+def get_token_counter():
+    return token_counter
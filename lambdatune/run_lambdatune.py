@@ -14,13 +14,20 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
-from lambdatune.utils import get_dbms_driver
+from lambdatune.utils import get_dbms_driver, get_llm
 from pkg_resources import resource_filename
 
-from lambdatune.benchmarks import get_job_queries, get_tpch_queries, get_tpcds_queries
+from lambdatune.benchmarks import get_job_queries, get_tpch_queries, get_tpcds_queries, capture_workload
+from lambdatune.benchmarks.workload_capture import WORKLOAD_SOURCES, WEIGHTS
 from lambdatune.config_selection.configuration_selector import ConfigurationSelector
+from lambdatune.config_selection.parallel_selector import ParallelConfigurationSelector
+from lambdatune.drivers import PostgresInstancePool, DuckDBInstancePool
 
 from lambdatune.prompt_generator.compress_query_plans import get_configurations_with_compression
+from lambdatune.prompt_generator.ilp_solver import KNAPSACK_SOLVERS
+from lambdatune.prompt_generator.token_counter import TokenCounter, set_token_counter
+from lambdatune.llm.response_cache import ResponseCache, set_response_cache
+from lambdatune.llm.providers import PROVIDERS, create_provider, set_provider
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Script to run benchmarks.')
@@ -64,6 +71,90 @@ if __name__ == "__main__":
                         choices=["gemini-2.5-flash", "gemini-2.5-pro"],
                         help="The Gemini model to use for generating configurations.")
 
+    parser.add_argument("--llm_concurrency", type=int, default=5,
+                        help="The maximum number of concurrent LLM requests when generating configurations.")
+    parser.add_argument("--llm_requests_per_minute", type=float, default=60,
+                        help="The rate limit of the LLM requests, including retries.")
+
+    parser.add_argument("--llm_cache_dir", type=str, default=None,
+                        help="The directory of the LLM response cache. Disabled if not set.")
+    parser.add_argument("--llm_cache_max_entries", type=int, default=None,
+                        help="The maximum number of cached LLM responses.")
+    parser.add_argument("--llm_replay_only", type=bool, default=False,
+                        help="Only replay the cached LLM responses; fail instead of calling the LLM.")
+
+    parser.add_argument("--knapsack_solver", type=str, default="auto", choices=KNAPSACK_SOLVERS,
+                        help="The solver of the condition selection knapsack: exact (DP), greedy, gurobi, or auto "
+                             "(exact for moderate token budgets, greedy otherwise).")
+
+    parser.add_argument("--plan_workers", type=int, default=1,
+                        help="The number of processes that collect the join conditions of the query plans.")
+
+    parser.add_argument("--tokenizer", type=str, default=None,
+                        help="The tokenizer of the token budget: a model name (e.g., gpt-4) or a tiktoken encoding "
+                             "(e.g., cl100k_base). Defaults to the llm of config.ini. Models unknown to tiktoken "
+                             "(e.g., Gemini) use cl100k_base; counts characters if tiktoken is unavailable.")
+
+    parser.add_argument("--llm_provider", type=str, default="gemini", choices=sorted(PROVIDERS.keys()),
+                        help="The LLM backend. The stub provider generates configurations locally, without a network.")
+    parser.add_argument("--llm_stub_latency", type=float, default=0,
+                        help="The simulated latency (seconds) of every stub provider response.")
+
+    parser.add_argument("--incremental_indexes", type=bool, default=False,
+                        help="Only drop/create the indexes that differ between consecutive configurations "
+                             "(Postgres only).")
+
+    parser.add_argument("--background_index_builds", type=bool, default=False,
+                        help="Build indexes on separate connections while independent queries run (Postgres "
+                             "only).")
+    parser.add_argument("--max_concurrent_index_builds", type=int, default=None,
+                        help="Upper bound on the number of concurrent background index builds.")
+    parser.add_argument("--index_build_memory_budget_mb", type=int, default=None,
+                        help="Upper bound on the total maintenance_work_mem (MB) of the concurrent background index "
+                             "builds.")
+
+    parser.add_argument("--max_query_clusters", type=int, default=13,
+                        help="The maximum number of query clusters ordered by the query scheduler. Above 16 "
+                             "clusters, the order is computed heuristically.")
+    parser.add_argument("--clustering_algorithm", type=str, default="kmeans",
+                        choices=["kmeans", "jaccard", "minhash"],
+                        help="The algorithm that clusters the queries by the indexes they use.")
+
+    parser.add_argument("--plan_cache", type=str, default=None,
+                        help="Path of a SQLite database that caches EXPLAIN outputs across rounds and runs.")
+
+    parser.add_argument("--query_watchdog", type=bool, default=False,
+                        help="Cancel running queries on the server (pg_cancel_backend, or KILL QUERY on MySQL) when "
+                             "the time budget of a configuration is exhausted, instead of setting statement_timeout "
+                             "(max_execution_time on MySQL) per query.")
+
+    parser.add_argument("--instances", type=int, default=1,
+                        help="Number of cloned Postgres (or DuckDB) instances used to evaluate configurations in "
+                             "parallel.")
+    parser.add_argument("--instances_dir", type=str, default="./instances",
+                        help="The directory where the data directories of the cloned instances are created.")
+    parser.add_argument("--instances_base_port", type=int, default=5433,
+                        help="The port of the first cloned instance.")
+    parser.add_argument("--duckdb_instance_copies", type=bool, default=False,
+                        help="Evaluate DuckDB configurations on copies of the database file in instances_dir, which "
+                             "supports indexes, instead of read-only attachments of the database file.")
+    parser.add_argument("--workload_source", type=str, default=None, choices=WORKLOAD_SOURCES,
+                        help="Tune for a captured workload instead of the queries of the benchmark (the benchmark is "
+                             "still the name of the database).")
+    parser.add_argument("--workload_path", type=str, default=None,
+                        help="The pg_stat_statements CSV snapshot (the view is read if missing), the csvlog file or "
+                             "the saved workload file.")
+    parser.add_argument("--workload_log", type=str, default=None,
+                        help="A csvlog file with the executable statements of the pg_stat_statements queries.")
+    parser.add_argument("--workload_max_queries", type=int, default=None,
+                        help="Sample at most this many of the heaviest queries of the captured workload.")
+    parser.add_argument("--workload_coverage", type=float, default=None,
+                        help="Sample the heaviest queries covering this fraction (0-1] of the workload weight.")
+    parser.add_argument("--workload_weight", type=str, default="calls", choices=WEIGHTS,
+                        help="The weight of the captured queries: their number of calls or their total time.")
+    parser.add_argument("--workload_save", type=str, default=None,
+                        help="Save the sampled workload to this file, to replay it (workload_source file).")
+
     args = parser.parse_args()
 
     llm_configs_dir = args.configs
@@ -75,11 +166,18 @@ if __name__ == "__main__":
     memory = args.memory
     cores = args.cores
 
+    # The index state and the background builds read the Postgres catalogs (pg_indexes, pg_settings)
+    if system.lower() != "postgres" and (args.incremental_indexes or args.background_index_builds):
+        raise Exception("incremental_indexes and background_index_builds are only supported for Postgres.")
+
     # --- Proposed methodology START ---
     continue_loop=args.continue_loop
 
     token_budget=args.token_budget
 
+    # Loads the tokenizer of the token budget once
+    set_token_counter(TokenCounter(args.tokenizer or get_llm()))
+
     exploit_index=args.exploit_index
 
     order_query=args.order_query
@@ -113,10 +211,24 @@ if __name__ == "__main__":
 
     logging.info(f"LLM Config Dir: {llm_configs_dir}")
 
-    driver = get_dbms_driver(system, db=benchmark)
+    driver = get_dbms_driver(system, db=benchmark, plan_cache=args.plan_cache)
     queries = None
+    query_weights = None
+
+    if args.workload_source:
+        workload = capture_workload(args.workload_source, driver=driver, path=args.workload_path,
+                                    log_path=args.workload_log, database=benchmark)
+
+        if args.workload_max_queries or args.workload_coverage:
+            workload = workload.sample(max_queries=args.workload_max_queries, coverage=args.workload_coverage,
+                                       weight=args.workload_weight)
+
+        if args.workload_save:
+            workload.save(args.workload_save)
 
-    if benchmark == "tpch": queries = get_tpch_queries()
+        queries = workload.get_queries(args.workload_weight)
+        query_weights = workload.get_weights(args.workload_weight)
+    elif benchmark == "tpch": queries = get_tpch_queries()
     elif benchmark == "tpcds": queries = get_tpcds_queries()
     elif benchmark == "job": queries = get_job_queries()
     else:
@@ -127,6 +239,21 @@ if __name__ == "__main__":
     costs=None
     # --- Proposed methodology END ---
     if config_gen:
+        response_cache = None
+
+        if args.llm_provider == "stub":
+            set_provider(create_provider("stub", latency=args.llm_stub_latency))
+        else:
+            set_provider(create_provider(args.llm_provider))
+
+        logging.info(f"LLM provider: {args.llm_provider}")
+
+        if args.llm_cache_dir:
+            response_cache = ResponseCache(args.llm_cache_dir,
+                                           max_entries=args.llm_cache_max_entries,
+                                           replay_only=args.llm_replay_only)
+            set_response_cache(response_cache)
+
         # --- Proposed methodology START ---
         costs=get_configurations_with_compression(output_dir_path=llm_configs_dir,
                                             driver=driver,
@@ -142,10 +269,17 @@ if __name__ == "__main__":
                                             does_use_internal_metrics=internal_metrics,
                                             query_plan=query_plan,
                                             does_use_data_definition_language=data_definition_language,
-                                            model=model
+                                            model=model,
+                                            concurrency=args.llm_concurrency,
+                                            requests_per_minute=args.llm_requests_per_minute,
+                                            knapsack_solver=args.knapsack_solver,
+                                            plan_workers=args.plan_workers
                                             )
         # --- Proposed methodology END ---
 
+        if response_cache:
+            logging.info(f"LLM response cache: {response_cache.get_stats()}")
+
     timeouts = [10]
 
     configurations = ConfigurationSelector.load_configs(llm_configs_dir, system=system)
@@ -153,28 +287,62 @@ if __name__ == "__main__":
 #     with open('e2_index_time.txt','a')as f:             
 #         f.write(f'''{system} {benchmark}
 # ''') 
-    for timeout in timeouts:
-        selector = ConfigurationSelector(configs=configurations,
-                                         driver=driver,
-                                         queries=queries,
-                                         enable_query_scheduler=True,
-                                         create_all_indexes_first=False,
-                                         create_indexes=True,
-                                         drop_indexes=True,
-                                         reset_command="ALTER SYSTEM RESET ALL;",
-                                         initial_time_out_seconds=timeout,
-                                         timeout_interval=10,
-                                         max_rounds=5,
-                                         benchmark_name=benchmark,
-                                         system=system,
-                                         adaptive_timeout=adaptive_timeout,
-                                         output_dir=output_dir,
-                                         # --- Proposed methodology START ---
-                                         continue_loop=continue_loop,
-                                         exploit_index=exploit_index,
-                                         order_query=order_query,
-                                         costs=costs
-                                         # --- Proposed methodology END ---
-                                         )
-
-        selector.select_configuration()
\ No newline at end of file
+    instance_pool = None
+
+    if args.instances > 1:
+        if system.lower() == "postgres":
+            instance_pool = PostgresInstancePool(driver.config, num_instances=args.instances,
+                                                 base_dir=args.instances_dir, base_port=args.instances_base_port)
+        elif system.lower() == "duckdb":
+            # The instances attach the database file, which cannot stay attached read-write by this driver
+            driver.close()
+            instance_pool = DuckDBInstancePool(driver.config, num_instances=args.instances,
+                                               base_dir=args.instances_dir if args.duckdb_instance_copies else None)
+        else:
+            raise Exception("Parallel configuration evaluation is only supported for Postgres and DuckDB.")
+
+        instance_pool.start()
+
+    try:
+        for timeout in timeouts:
+            selector_args = dict(configs=configurations,
+                                 queries=queries,
+                                 enable_query_scheduler=True,
+                                 create_all_indexes_first=False,
+                                 create_indexes=True,
+                                 drop_indexes=True,
+                                 reset_command="ALTER SYSTEM RESET ALL;",
+                                 initial_time_out_seconds=timeout,
+                                 timeout_interval=10,
+                                 max_rounds=5,
+                                 benchmark_name=benchmark,
+                                 system=system,
+                                 adaptive_timeout=adaptive_timeout,
+                                 output_dir=output_dir,
+                                 # --- Proposed methodology START ---
+                                 continue_loop=continue_loop,
+                                 exploit_index=exploit_index,
+                                 order_query=order_query,
+                                 costs=costs,
+                                 # --- Proposed methodology END ---
+                                 incremental_indexes=args.incremental_indexes,
+                                 background_index_builds=args.background_index_builds,
+                                 max_concurrent_index_builds=args.max_concurrent_index_builds,
+                                 index_build_memory_budget_kb=args.index_build_memory_budget_mb * 1024
+                                 if args.index_build_memory_budget_mb else None,
+                                 max_query_clusters=args.max_query_clusters,
+                                 clustering_algorithm=args.clustering_algorithm,
+                                 query_watchdog=args.query_watchdog,
+                                 query_weights=query_weights
+                                 )
+
+            if instance_pool:
+                selector = ParallelConfigurationSelector(drivers=instance_pool.get_drivers(), **selector_args)
+            else:
+                selector = ConfigurationSelector(driver=driver, **selector_args)
+
+            selector.select_configuration()
+    finally:
+        # A failed run must not leave the cloned instances running
+        if instance_pool:
+            instance_pool.stop()
\ No newline at end of file
@@ -12,6 +12,7 @@ from lambdatune.config_selection import Configuration
 from lambdatune.utils import get_dbms_driver
 from pkg_resources import resource_filename
 from lambdatune.config_selection.configuration_selector import ConfigurationSelector
+from lambdatune.config_selection.report_sink import read_reports, reports_exist
 
 from lambdatune.ui.common import TPCH, JOB
 
@@ -201,32 +202,31 @@ if start_button:
                         f"[{config_id}] Queries Completed: {len(completed)}/{len(queries)}")
                     config_bars[config_id].progress(len(completed) / len(queries))
 
-            if os.path.exists(reports_file_path):
-                with open(reports_file_path) as fp:
-                    data = json.load(fp)
+            if reports_exist(reports_file_path):
+                data = read_reports(reports_file_path, resolve_blobs=False)
 
-                    if len(data) > len(current_reports):
-                        current_reports = data
-                        last_report = current_reports[-1]
-                        config_id = last_report["config_id"]
-                        completed_query_time = last_report["total_completed_query_execution_time"]
-                        num_completed_queries = last_report["queries_completed_total"]
+                if len(data) > len(current_reports):
+                    current_reports = data
+                    last_report = current_reports[-1]
+                    config_id = last_report["config_id"]
+                    completed_query_time = last_report["total_completed_query_execution_time"]
+                    num_completed_queries = last_report["queries_completed_total"]
 
-                        config_texts[config_id].info(f"[{config_id}] Queries Completed: {num_completed_queries}/{len(queries)}")
-                        config_bars[config_id].progress(num_completed_queries / len(queries))
+                    config_texts[config_id].info(f"[{config_id}] Queries Completed: {num_completed_queries}/{len(queries)}")
+                    config_bars[config_id].progress(num_completed_queries / len(queries))
 
-                        if last_report["completed"]:
-                            completed_configs.add(config_id)
+                    if last_report["completed"]:
+                        completed_configs.add(config_id)
 
-                            config_texts[config_id].success(
-                                "[{}] Queries Completed: {}/{} (Time: {:.2f})".format(
-                                    config_id,
-                                    num_completed_queries,
-                                    len(queries), completed_query_time))
+                        config_texts[config_id].success(
+                            "[{}] Queries Completed: {}/{} (Time: {:.2f})".format(
+                                config_id,
+                                num_completed_queries,
+                                len(queries), completed_query_time))
 
-                            if completed_query_time < best_config_time:
-                                best_config_time = completed_query_time
-                                best_config = config_id
+                        if completed_query_time < best_config_time:
+                            best_config_time = completed_query_time
+                            best_config = config_id
             time.sleep(2)
 
     st.success("Best configuration: {} took {:.2f}".format(best_config, best_config_time))
\ No newline at end of file
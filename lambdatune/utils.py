@@ -1,17 +1,30 @@
 import configparser
 import logging
+import os
 
 from pkg_resources import resource_filename
-from lambdatune.drivers import PostgresDriver, MySQLDriver
+from lambdatune.drivers import PostgresDriver, MySQLDriver, DuckDBDriver
 
 
-def get_dbms_driver(system, db=None, user=None, password=None):
+def get_dbms_driver(system, db=None, user=None, password=None, plan_cache=None):
     """ Get the driver for the specified DBMS """
 
     config_parser = configparser.ConfigParser()
     f = resource_filename("lambdatune", "resources/config.ini")
     config_parser.read(f)
 
+    if system.lower() == "duckdb":
+        # DuckDB has no users: the database is a file, either a path or <data_dir>/<db>.duckdb
+        if not db:
+            db: str = config_parser["LAMBDA_TUNE"]["database"]
+
+        if not db.endswith((".duckdb", ".db")):
+            db = os.path.join(config_parser["DUCKDB"].get("data_dir", "."), f"{db}.duckdb")
+
+        logging.info(f"Getting DBMS driver for {system} with db {db}")
+
+        return DuckDBDriver({"db": db})
+
     if not user:
         user: str = config_parser[system]["user"]
 
@@ -31,7 +44,8 @@ def get_dbms_driver(system, db=None, user=None, password=None):
         driver = PostgresDriver({
             "user": user,
             "password": password,
-            "db": db})
+            "db": db,
+            "plan_cache": plan_cache})
     elif system.lower() == "mysql":
         driver = MySQLDriver({
             "user": user,
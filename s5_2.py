@@ -6,6 +6,8 @@ import matplotlib.pyplot as plt
 import numpy as np
 from matplotlib.patches import Patch
 
+from lambdatune.config_selection.report_sink import read_reports, reports_exist
+
 # Increase global font sizes for clarity by 1.5x (original values multiplied by 1.5)
 plt.rcParams.update(
     {
@@ -49,14 +51,13 @@ display_names = {
 data = []
 for benchmark, paths in file_paths.items():
     for fp in paths:
-        if os.path.exists(fp):
-            with open(fp, "r") as f:
-                reports = json.load(f)
-                # Tag each report with benchmark and file
-                for report in reports:
-                    report["benchmark"] = benchmark
-                    report["file"] = fp
-                data.extend(reports)
+        if reports_exist(fp):
+            reports = read_reports(fp, resolve_blobs=False)
+            # Tag each report with benchmark and file
+            for report in reports:
+                report["benchmark"] = benchmark
+                report["file"] = fp
+            data.extend(reports)
         else:
             print(f"Warning: File {fp} not found.")
 
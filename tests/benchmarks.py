@@ -0,0 +1,86 @@
+import csv
+import os
+import tempfile
+import unittest
+
+from lambdatune.benchmarks.workload_capture import (Workload, add_pg_stat_statements_csv, add_postgres_csv_log,
+                                                    get_query_fingerprint, load_workload)
+
+
+class WorkloadCaptureTests(unittest.TestCase):
+    def test_query_fingerprint(self):
+        self.assertEqual(get_query_fingerprint("SELECT * FROM t WHERE a = 1 AND b = 'x' -- comment"),
+                         get_query_fingerprint("select *\n  from T where a = 42 and b = 'y''z';"))
+        self.assertEqual(get_query_fingerprint("SELECT * FROM t WHERE a IN (1, 2, 3)"),
+                         get_query_fingerprint("SELECT * FROM t WHERE a IN ($1)"))
+        self.assertEqual(get_query_fingerprint('SELECT "Col1" FROM t1'), 'select "Col1" from t1')
+        self.assertNotEqual(get_query_fingerprint("SELECT a FROM t"), get_query_fingerprint("SELECT b FROM t"))
+
+    def test_workload_weights_and_sampling(self):
+        workload = Workload()
+
+        for value in range(0, 8):
+            workload.add(f"SELECT * FROM t WHERE a = {value}", total_time=1)
+
+        workload.add("SELECT count(*) FROM u", calls=2, total_time=100)
+        workload.add("UPDATE t SET a = 1")
+
+        self.assertEqual(len(workload), 2)
+        self.assertEqual(workload.skipped, 1)
+
+        queries = workload.get_queries("calls")
+        self.assertEqual(queries[0][1], "SELECT * FROM t WHERE a = 0")
+        self.assertEqual(sorted(workload.get_weights("calls").values()), [2, 8])
+
+        # The heaviest query by total time
+        self.assertEqual(workload.get_queries("total_time")[0][1], "SELECT count(*) FROM u")
+        self.assertEqual(len(workload.sample(coverage=0.9, weight="total_time")), 1)
+        self.assertEqual(len(workload.sample(max_queries=5)), 2)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "workload.json")
+            workload.save(path)
+
+            self.assertEqual(load_workload(path).get_queries(), queries)
+            self.assertEqual(load_workload(path).get_weights(), workload.get_weights())
+
+    def test_pg_stat_statements_and_csvlog(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            snapshot_path = os.path.join(tmp, "pg_stat_statements.csv")
+            log_path = os.path.join(tmp, "postgresql.csv")
+
+            with open(snapshot_path, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["userid", "dbid", "queryid", "query", "calls", "total_exec_time"])
+                writer.writerow([10, 5, 1, "SELECT * FROM t WHERE a = $1", 100, 500.0])
+                writer.writerow([10, 5, 2, "SELECT * FROM u WHERE b = $1", 3, 3000.0])
+                writer.writerow([10, 5, 3, "INSERT INTO t VALUES ($1)", 1000, 10.0])
+
+            with open(log_path, "w", newline="") as f:
+                writer = csv.writer(f)
+                row = [""] * 23
+                row[2], row[11] = "db", "LOG"
+
+                row[13] = "duration: 5.5 ms  execute <unnamed>: SELECT * FROM t WHERE a = $1"
+                row[14] = "parameters: $1 = '7'"
+                writer.writerow(row)
+
+                # A statement that is not in the snapshot
+                row[13], row[14] = "duration: 2.0 ms  statement: SELECT * FROM other", ""
+                writer.writerow(row)
+
+                row[2], row[13], row[14] = "other", "duration: 1.0 ms  statement: SELECT * FROM u WHERE b = 3", ""
+                writer.writerow(row)
+
+            # The snapshot provides the statistics, and the log the executable statements
+            workload = add_pg_stat_statements_csv(Workload(), snapshot_path)
+            add_postgres_csv_log(workload, log_path, database="db", statistics=False)
+
+            self.assertEqual(workload.get_queries(), [(workload.get_queries()[0][0], "SELECT * FROM t WHERE a = '7'")])
+            self.assertEqual(list(workload.get_weights().values()), [100])
+            self.assertEqual(len(workload), 2)
+
+            # The log alone
+            workload = add_postgres_csv_log(Workload(), log_path)
+            self.assertEqual(len(workload), 3)
+            self.assertEqual(sorted(query.total_time for query in workload.queries.values()), [1.0, 2.0, 5.5])
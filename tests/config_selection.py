@@ -0,0 +1,620 @@
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import unittest
+
+from contextlib import contextmanager
+from itertools import permutations
+
+from lambdatune.config_selection.configuration_selector import ConfigurationSelector
+from lambdatune.config_selection.execution_bound import ExecutionTimeBound
+from lambdatune.config_selection.index import Index
+from lambdatune.config_selection.index_builder import IndexBuilder
+from lambdatune.config_selection.index_state import IndexStateManager
+from lambdatune.config_selection.parallel_selector import ParallelConfigurationSelector
+from lambdatune.config_selection.query_cluster import QueryClusterer, generate_query_clusters
+from lambdatune.config_selection.query_order_dp import compute_optimal_order, compute_order_cost, \
+    compute_min_churn_order
+from lambdatune.config_selection.report_sink import ReportSink, read_reports, reports_exist, BLOBS_FILE
+from lambdatune.config_selection.query_to_index import queries_to_index, QueryColumnMap, QueryToIndex
+
+
+class FakeCursor:
+    """
+    A cursor of a FakeDriver: records the statements, and answers the catalog queries of the driver's state
+    """
+    def __init__(self, driver, connection=None):
+        self.driver = driver
+        self.connection = connection
+        self.rows = list()
+
+    def execute(self, sql, params=None):
+        self.driver.executed.append(sql)
+        self.rows = list()
+
+        if sql.startswith("SELECT name, setting FROM pg_settings"):
+            self.rows = [(name, str(value)) for name, value in self.driver.settings.items() if name in params[0]]
+        elif sql.startswith("SELECT indexname, indexdef FROM pg_indexes"):
+            self.rows = [(name, f"CREATE INDEX {name} ON public.{table} USING btree ({column})")
+                         for name, (table, column) in self.driver.indexes.items()]
+        elif sql.startswith("CREATE INDEX"):
+            index_name, table, column = sql.split()[2], sql.split()[4], sql.split("(")[1].split(")")[0]
+
+            if index_name in self.driver.failing_indexes:
+                raise Exception(f"Failed to create index {index_name}")
+
+            # Blocks until the statement is canceled
+            if index_name in self.driver.blocking_indexes and self.connection:
+                self.connection.cancelled.wait(10)
+                raise Exception("canceling statement due to user request")
+
+            self.driver.indexes[index_name] = (table, column)
+        elif sql.startswith("DROP INDEX"):
+            self.driver.indexes.pop(sql.split()[2].rstrip(";"))
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, driver):
+        self.driver = driver
+        self.cancelled = threading.Event()
+
+    def cursor(self):
+        return FakeCursor(self.driver, self)
+
+    def cancel(self):
+        self.cancelled.set()
+
+
+class FakeDriver:
+    """
+    A driver with the indexes (name -> (table, column)) and the settings of an in-memory database
+    """
+    def __init__(self, settings: dict = None, indexes: dict = None, failing_indexes: set = frozenset(),
+                 blocking_indexes: set = frozenset(), primary_keys: set = frozenset()):
+        self.settings = settings or dict()
+        self.primary_keys = primary_keys
+        self.indexes = dict(indexes or dict())
+        self.failing_indexes = failing_indexes
+        self.blocking_indexes = blocking_indexes
+        self.executed = list()
+        self.fingerprint_invalidations = 0
+
+    def get_cursor(self):
+        return FakeCursor(self)
+
+    def invalidate_state_fingerprint(self):
+        self.fingerprint_invalidations += 1
+
+    @contextmanager
+    def connection(self):
+        yield FakeConnection(self)
+
+    def get_all_indexes(self):
+        """
+        Returns the non primary key indexes
+        """
+        return [name for name in self.indexes if name not in self.primary_keys]
+
+
+class ConfigSelectionTests(unittest.TestCase):
+    def test_queries_to_index_resolves_aliases(self):
+        queries = [
+            ("q1", "SELECT * FROM title AS t, movie_companies AS mc WHERE t.id = mc.movie_id"),
+            ("q2", "SELECT n.name FROM name AS n WHERE n.gender = 'f'"),
+        ]
+
+        r = queries_to_index(queries, ["CREATE INDEX idx_1 ON title(id);", "CREATE INDEX idx_2 ON name(gender);"])
+
+        self.assertEqual([index.get_index_name() for index in r.get_query_indexes("q1")], ["idx_1"])
+        self.assertEqual([index.get_index_name() for index in r.get_query_indexes("q2")], ["idx_2"])
+
+    def test_queries_to_index_unqualified_columns(self):
+        queries = [
+            ("q1", "SELECT l_orderkey FROM lineitem, orders WHERE l_orderkey = o_orderkey"),
+            ("q2", "SELECT o_orderkey FROM orders"),
+        ]
+        schema = {
+            "lineitem": ["l_orderkey", "l_partkey"],
+            "orders": ["o_orderkey", "o_custkey"],
+        }
+
+        column_map = QueryColumnMap(queries, schema=schema)
+
+        self.assertEqual(column_map.get_queries("lineitem", "l_orderkey"), {"q1"})
+        self.assertEqual(column_map.get_queries("orders", "o_orderkey"), {"q1", "q2"})
+        self.assertEqual(column_map.get_queries("orders", "l_orderkey"), set())
+
+    def test_compute_optimal_order_matches_exhaustive_search(self):
+        index_dependencies = {
+            "q1": {"i1", "i2"},
+            "q2": {"i2"},
+            "q3": {"i3"},
+            "q4": {"i1", "i3", "i4"},
+            "q5": set(),
+        }
+        cost_map = {"i1": 10, "i2": 3, "i3": 7, "i4": 1}
+        frequency = {"q1": 2, "q2": 1, "q3": 5, "q4": 1, "q5": 3}
+
+        best_cost = min(compute_order_cost(order, index_dependencies, cost_map, frequency)
+                        for order in permutations(index_dependencies))
+
+        cost, order = compute_optimal_order(index_dependencies.keys(), index_dependencies, cost_map, frequency)
+
+        self.assertAlmostEqual(cost, best_cost)
+        self.assertAlmostEqual(compute_order_cost(order, index_dependencies, cost_map, frequency), cost)
+        self.assertEqual(sorted(order), sorted(index_dependencies))
+
+    def test_compute_optimal_order_heuristic_fallback(self):
+        random.seed(0)
+        queries = [f"q{i}" for i in range(40)]
+        index_dependencies = dict((query, set(random.sample(range(20), 3))) for query in queries)
+        cost_map = dict((index, random.randint(1, 100)) for index in range(20))
+
+        cost, order = compute_optimal_order(queries, index_dependencies, cost_map)
+
+        self.assertEqual(sorted(order), sorted(queries))
+        self.assertAlmostEqual(compute_order_cost(order, index_dependencies, cost_map, None), cost)
+        self.assertLessEqual(cost, compute_order_cost(queries, index_dependencies, cost_map, None))
+
+    def get_random_index_dependencies(self, num_queries: int, num_indexes: int):
+        random.seed(0)
+        index_dependencies = QueryToIndex()
+        queries = [f"q{i}" for i in range(num_queries)]
+
+        for query in queries:
+            for index in random.sample(range(num_indexes), random.randint(0, 5)):
+                index_dependencies.add_index_to_query(query, index)
+
+        return queries, index_dependencies
+
+    def test_generate_query_clusters_algorithms(self):
+        queries, index_dependencies = self.get_random_index_dependencies(100, 30)
+
+        for algorithm in ["kmeans", "jaccard", "minhash"]:
+            clusters = generate_query_clusters(queries, index_dependencies, max_clusters=10, algorithm=algorithm)
+
+            self.assertLessEqual(len(clusters), 10)
+            self.assertEqual(sorted(q for c in clusters for q in c.get_queries()), sorted(queries))
+
+            for cluster in clusters:
+                for query in cluster.get_queries():
+                    self.assertTrue(index_dependencies.get_query_indexes(query).issubset(cluster.get_indexes()))
+
+    def test_query_clusterer_memoizes_clusters(self):
+        queries, index_dependencies = self.get_random_index_dependencies(50, 20)
+        clusterer = QueryClusterer(max_clusters=5, algorithm="jaccard")
+
+        clusters, _ = clusterer.get_clusters(queries, index_dependencies)
+        cached_clusters, _ = clusterer.get_clusters(queries, index_dependencies)
+        clusterer.get_clusters(queries[1:], index_dependencies)
+
+        self.assertIs(clusters, cached_clusters)
+        self.assertEqual(clusterer.get_metrics()["cache_hits"], 1)
+        self.assertEqual(clusterer.get_metrics()["cache_misses"], 2)
+
+    def test_report_sink_round_trip(self):
+        reports = [
+            {"config_id": "config_1", "driver_config": {"work_mem": "4MB"}, "created_indexes": ["idx_1"]},
+            {"config_id": "config_2", "driver_config": {"work_mem": "4MB"}, "created_indexes": ["idx_1", "idx_2"]},
+            {"config_id": "config_1", "driver_config": {"work_mem": "4MB"}, "created_indexes": None},
+        ]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            self.assertFalse(reports_exist(os.path.join(tmp, "reports.json")))
+
+            sink = ReportSink(tmp, fsync_every=2)
+            for report in reports:
+                sink.write(report)
+            sink.close()
+
+            self.assertEqual(read_reports(os.path.join(tmp, "reports.json")), reports)
+            self.assertEqual(read_reports(tmp, resolve_blobs=False)[1]["config_id"], "config_2")
+
+            # Every distinct large value is stored once
+            with open(os.path.join(tmp, BLOBS_FILE)) as f:
+                self.assertEqual(len(f.readlines()), 3)
+
+    def test_read_legacy_reports(self):
+        reports = [{"config_id": "config_1", "completed": True}]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, "reports.json"), "w") as f:
+                json.dump(reports, f, indent=2)
+
+            self.assertTrue(reports_exist(os.path.join(tmp, "reports.json")))
+            self.assertEqual(read_reports(os.path.join(tmp, "reports.json")), reports)
+
+    def test_evaluate_keeps_reports(self):
+        class FakeConfiguration:
+            def get_configs(self):
+                return ["SET GLOBAL work_mem = 4MB"]
+
+            def get_indexes(self):
+                return {"idx_t_a": "CREATE INDEX idx_t_a ON t (a);"}
+
+        reports = [{"config_id": "config_1", "completed": True}, {"config_id": "config_2", "completed": False}]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            sink = ReportSink(tmp)
+            for report in reports:
+                sink.write(report)
+            sink.close()
+
+            driver = FakeDriver()
+            driver.set_configuration = lambda configs, restart=False, reset=True: None
+
+            selector = ConfigurationSelector.__new__(ConfigurationSelector)
+            selector.driver = driver
+            selector.configs = {"config_1": FakeConfiguration()}
+            selector.queries = {"q1": "SELECT 1"}
+            selector.create_indexes = True
+            selector.drop_indexes = False
+            selector.reset_configuration = lambda restart_system=False, drop_indexes=False: None
+
+            selector.evaluate(os.path.join(tmp, "reports.json"))
+
+            # The reports of the selection are kept, and the evaluated ones are written next to them
+            self.assertEqual(read_reports(tmp), reports)
+
+            evaluated = read_reports(os.path.join(tmp, "evaluation"))
+            self.assertEqual([report["config_id"] for report in evaluated], ["config_1"])
+            self.assertEqual(evaluated[0]["config"], ["SET GLOBAL work_mem = 4MB"])
+            self.assertIn("evaluation_time", evaluated[0])
+            self.assertIn("SELECT 1", driver.executed)
+
+    def test_selector_query_weights(self):
+        from lambdatune.drivers.duckdb_driver import DuckDBDriver
+
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "weights.duckdb")
+            driver = DuckDBDriver({"db": db_path})
+            driver.get_cursor().execute("CREATE TABLE t AS SELECT range AS a FROM range(100)")
+
+            queries = [("q1", "SELECT count(*) FROM t"), ("q2", "SELECT max(a) FROM t"), ("q3", "SELECT 1")]
+            args = dict(driver=driver, queries=queries, configs=dict(), reset_command="", adaptive_timeout=True,
+                        enable_query_scheduler=True, create_all_indexes_first=False, create_indexes=True,
+                        drop_indexes=True, initial_time_out_seconds=10, timeout_interval=10, max_rounds=1,
+                        benchmark_name="test", system="DUCKDB", continue_loop=False, exploit_index=False,
+                        order_query=False, output_dir=tmp, costs={"q1": 1, "q2": 1, "q3": 1})
+
+            try:
+                # The weights are normalized to a mean of 1, and missing weights are 1
+                selector = ConfigurationSelector(query_weights={"q1": 4, "q2": 1}, **args)
+                self.assertEqual(selector.query_weights, {"q1": 2.0, "q2": 0.5, "q3": 0.5})
+                self.assertEqual(selector.get_query_weight(["q1", "q2"]), 2.5)
+
+                # A heavy query gets a fraction of the remaining time of the configuration
+                self.assertEqual(ConfigurationSelector.get_query_timeout(10, selector.get_weight("q1")), 5)
+                self.assertEqual(ConfigurationSelector.get_query_timeout(10, 0), 10)
+
+                # Without costs, the costs of the queries are estimated from their DuckDB plans
+                selector = ConfigurationSelector(**dict(args, costs=None))
+                self.assertTrue(all(0 < selector.costs[query] < float("inf") for query in ("q1", "q2")))
+
+                # Without weights (or with zero weights), every query weighs 1
+                for weights in (None, {"q1": 0, "q2": 0, "q3": 0}):
+                    selector = ConfigurationSelector(query_weights=weights, **args)
+                    self.assertIsNone(selector.query_weights)
+                    self.assertEqual(selector.get_query_weight(["q1", "q2"]), 2)
+            finally:
+                driver.close()
+
+    def test_create_index_after_background_build(self):
+        class FakeIndexBuilder:
+            def __init__(self, results):
+                self.results = results
+
+            def wait(self, index):
+                return self.results.get(index)
+
+        built, failed, not_submitted = (Index(f"idx_{c}", "t", c) for c in ("a", "b", "c"))
+        builder = FakeIndexBuilder({built: True, failed: False})
+
+        for incremental_indexes in (False, True):
+            driver = FakeDriver()
+            selector = ConfigurationSelector.__new__(ConfigurationSelector)
+            selector.incremental_indexes = incremental_indexes
+            selector.index_states = dict()
+
+            for index in (built, failed, not_submitted):
+                selector.create_index(driver, index, builder)
+
+            # The failed build is retried on the driver's connection, the successful one is not
+            self.assertEqual(driver.executed[-2:], [failed.get_create_index_statement(),
+                                                    not_submitted.get_create_index_statement()])
+            self.assertNotIn(built.get_create_index_statement(), driver.executed)
+
+            # The indexes built on the driver's connection invalidate its state fingerprint
+            self.assertEqual(driver.fingerprint_invalidations, 2)
+
+            if incremental_indexes:
+                self.assertEqual(set(selector.get_index_state(driver).present.keys()),
+                                 {("t", "a"), ("t", "b"), ("t", "c")})
+
+    def test_index_builder_concurrency(self):
+        settings = {"max_worker_processes": 8, "max_parallel_maintenance_workers": 3, "maintenance_work_mem": 65536}
+
+        # Every build takes 1 + 3 worker processes
+        builder = IndexBuilder(FakeDriver(settings))
+        self.assertEqual(builder.concurrency, 2)
+        builder.shutdown()
+
+        cases = [
+            (dict(max_concurrent_builds=1), 1),
+            (dict(memory_budget_kb=65536), 1),
+            (dict(memory_budget_kb=1024), 1),
+            (dict(memory_budget_kb=10 * 65536), 2),
+            (dict(memory_budget_kb=10 * 65536, max_concurrent_builds=5), 2),
+        ]
+
+        for kwargs, concurrency in cases:
+            builder = IndexBuilder(FakeDriver(settings), **kwargs)
+            self.assertEqual(builder.concurrency, concurrency, kwargs)
+            builder.shutdown()
+
+        # The defaults of Postgres are used for the missing settings
+        builder = IndexBuilder(FakeDriver(), memory_budget_kb=3 * 65536)
+        self.assertEqual(builder.get_concurrency(), 2)
+        self.assertEqual(builder.concurrency, 2)
+        builder.shutdown()
+
+    def test_index_builder_wait(self):
+        driver = FakeDriver(failing_indexes={"idx_b"})
+        builder = IndexBuilder(driver, max_concurrent_builds=2)
+        indexes = [Index(f"idx_{c}", "t", c) for c in ("a", "b", "c")]
+
+        for index in indexes[:2]:
+            builder.submit(index)
+
+        self.assertTrue(builder.wait(indexes[0]))
+        self.assertFalse(builder.wait(indexes[1]))
+        self.assertIsNone(builder.wait(indexes[2]))
+
+        self.assertEqual(builder.get_built_indexes(), [indexes[0]])
+        self.assertEqual(set(driver.indexes.keys()), {"idx_a"})
+        self.assertEqual(set(builder.build_times.keys()), set(indexes[:2]))
+
+        builder.shutdown()
+
+    def test_index_builder_shutdown(self):
+        driver = FakeDriver(blocking_indexes={"idx_a"})
+        builder = IndexBuilder(driver, max_concurrent_builds=1)
+        running, pending = Index("idx_a", "t", "a"), Index("idx_b", "t", "b")
+
+        builder.submit(running)
+        builder.submit(pending)
+
+        deadline = time.time() + 5
+
+        while not builder.running and time.time() < deadline:
+            time.sleep(0.01)
+
+        self.assertIn(running, builder.running)
+        self.assertTrue(builder.is_pending(pending))
+
+        # The running build is canceled on its connection, and the pending one never starts
+        builder.shutdown()
+
+        self.assertEqual(builder.get_built_indexes(), [])
+        self.assertEqual(driver.indexes, dict())
+        self.assertNotIn(pending.get_create_index_statement(), driver.executed)
+        self.assertEqual(builder.running, dict())
+
+    def test_compute_min_churn_order_matches_exhaustive_search(self):
+        rng = random.Random(7)
+        indexes = [f"i{i}" for i in range(6)]
+
+        def get_order_cost(order, config_indexes, cost_map, initial_indexes):
+            # Only the indexes of the previous configuration are present when moving to the next one
+            cost = 0
+            present = initial_indexes
+
+            for config in order:
+                cost += sum(cost_map.get(index, 1) for index in config_indexes[config] if index not in present)
+                present = config_indexes[config]
+
+            return cost
+
+        for trial in range(0, 20):
+            configs = [f"c{i}" for i in range(rng.randint(1, 6))]
+            config_indexes = dict((config, frozenset(rng.sample(indexes, rng.randint(0, 4)))) for config in configs)
+            cost_map = dict((index, rng.randint(1, 100)) for index in indexes[:-1])
+            initial_indexes = frozenset(rng.sample(indexes, rng.randint(0, 2)))
+
+            best = min(get_order_cost(order, config_indexes, cost_map, initial_indexes)
+                       for order in permutations(configs))
+
+            cost, order = compute_min_churn_order(configs, config_indexes, cost_map, initial_indexes)
+
+            self.assertEqual(cost, best)
+            self.assertEqual(sorted(order), sorted(configs))
+            self.assertEqual(get_order_cost(order, config_indexes, cost_map, initial_indexes), cost)
+
+            # The greedy order above max_exact_size is a valid order with a consistent cost
+            cost, order = compute_min_churn_order(configs, config_indexes, cost_map, initial_indexes,
+                                                  max_exact_size=0)
+
+            self.assertEqual(sorted(order), sorted(configs))
+            self.assertEqual(get_order_cost(order, config_indexes, cost_map, initial_indexes), cost)
+            self.assertGreaterEqual(cost, best)
+
+        self.assertEqual(compute_min_churn_order([], dict(), dict()), (0, []))
+
+    def test_index_state_manager(self):
+        driver = FakeDriver(indexes={"idx_a": ("t", "a"), "t_pkey": ("t", "id")}, primary_keys={"t_pkey"})
+        state = IndexStateManager(driver)
+
+        # Primary keys are not managed
+        self.assertEqual(state.present, {("t", "a"): "idx_a"})
+
+        # An index on the same (table, column) is reused, whatever its name
+        self.assertFalse(state.ensure(Index("idx_config_a", "T", "A")))
+        self.assertTrue(state.is_present(Index("idx_other", "t", "a")))
+        self.assertEqual(driver.executed.count("CREATE INDEX idx_config_a ON T (A);"), 0)
+
+        self.assertTrue(state.ensure(Index("idx_b", "t", "b")))
+        self.assertIn("CREATE INDEX idx_b ON t (b);", driver.executed)
+
+        # Indexes built outside the manager (e.g., in the background) are recorded once
+        driver.get_cursor().execute("CREATE INDEX idx_c ON t (c);")
+        state.mark_created(Index("idx_c", "t", "c"))
+        state.mark_created(Index("idx_c2", "t", "c"))
+        self.assertEqual(state.present[("t", "c")], "idx_c")
+
+        state.retain({("t", "b")})
+
+        self.assertEqual(state.present, {("t", "b"): "idx_b"})
+        self.assertEqual(set(driver.indexes.keys()), {"idx_b", "t_pkey"})
+        self.assertEqual(state.get_metrics(), {"created": 2, "reused": 1, "dropped": 2})
+
+        # The state is loaded again from the database
+        state.load()
+        self.assertEqual(state.present, {("t", "b"): "idx_b"})
+
+    def test_execution_time_bound(self):
+        bound = ExecutionTimeBound()
+        improvements = list()
+
+        self.assertFalse(bound.is_set())
+        self.assertEqual(bound.get(), float("inf"))
+
+        bound.add_listener(improvements.append)
+
+        self.assertTrue(bound.offer(10))
+        self.assertFalse(bound.offer(12))
+        self.assertFalse(bound.offer(10))
+        self.assertTrue(bound.offer(4))
+
+        self.assertTrue(bound.is_set())
+        self.assertEqual(bound.get(), 4)
+        self.assertEqual(improvements, [10, 4])
+
+        bound.remove_listener(improvements.append)
+        bound.offer(1)
+        self.assertEqual(improvements, [10, 4])
+
+        # Concurrent offers keep the lowest time
+        bound = ExecutionTimeBound()
+        threads = [threading.Thread(target=bound.offer, args=(value,)) for value in range(100, 0, -1)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(bound.get(), 1)
+
+    def test_cut_off_slow_workers(self):
+        class FakeWatchdog:
+            def __init__(self):
+                self.deadlines = list()
+
+            def tighten(self, deadline):
+                self.deadlines.append(deadline)
+
+        class FakeWorkerDriver:
+            def __init__(self):
+                self.cancelled = 0
+                self.watchdog = FakeWatchdog()
+
+            def cancel(self):
+                self.cancelled += 1
+
+            def get_watchdog(self):
+                return self.watchdog
+
+        now = time.time()
+
+        # (spent, start of the running query, weight of the running query)
+        progress = {
+            0: (8, now - 3, 1),
+            1: (2, now - 1, 1),
+            2: (4, now - 2.5, 2),
+            3: (9.9, now - 100, 0),
+        }
+
+        for query_watchdog in (False, True):
+            selector = ParallelConfigurationSelector.__new__(ParallelConfigurationSelector)
+            selector.drivers = [FakeWorkerDriver() for _ in progress]
+            selector.worker_progress = dict(progress)
+            selector.query_watchdog = query_watchdog
+
+            selector.cut_off_slow_workers(10)
+
+            # Worker 0 already spent more than the bound. The time of the running query of worker 2 counts twice,
+            # and worker 3 runs a query without weight.
+            self.assertEqual([driver.cancelled for driver in selector.drivers], [1, 0, 0, 0])
+
+            deadlines = [driver.watchdog.deadlines for driver in selector.drivers]
+
+            if query_watchdog:
+                self.assertEqual(deadlines[0], [])
+                self.assertAlmostEqual(deadlines[1][0], now - 1 + 8)
+                self.assertAlmostEqual(deadlines[2][0], now - 2.5 + 3)
+                self.assertEqual(deadlines[3], [])
+            else:
+                self.assertEqual(deadlines, [[], [], [], []])
+
+    def test_parallel_select_configuration(self):
+        from lambdatune.config_selection.configuration import Configuration
+        from lambdatune.drivers.duckdb_driver import DuckDBDriver
+
+        with tempfile.TemporaryDirectory() as tmp:
+            drivers = list()
+            applied = list()
+
+            for worker_id in range(0, 2):
+                driver = DuckDBDriver({"db": os.path.join(tmp, f"instance_{worker_id}.duckdb")})
+                driver.get_cursor().execute("CREATE TABLE t AS SELECT range AS a FROM range(100)")
+
+                def set_configuration(config, restart=True, reset=False, driver=driver, worker_id=worker_id):
+                    # Slow enough for both workers to take configurations from the queue
+                    time.sleep(0.05)
+                    applied.append((worker_id, sorted(config)))
+                    return DuckDBDriver.set_configuration(driver, config, restart=restart, reset=reset)
+
+                driver.set_configuration = set_configuration
+                drivers.append(driver)
+
+            configs = dict((f"config_{threads}.json", Configuration([f"SET threads = {threads}"]))
+                           for threads in range(1, 5))
+            queries = [("q1", "SELECT count(*) FROM t"), ("q2", "SELECT max(a) FROM t")]
+
+            try:
+                selector = ParallelConfigurationSelector(
+                    drivers=drivers, queries=queries, configs=configs, reset_command="", adaptive_timeout=True,
+                    enable_query_scheduler=True, create_all_indexes_first=False, create_indexes=True,
+                    drop_indexes=True, initial_time_out_seconds=10, timeout_interval=10, max_rounds=5,
+                    benchmark_name="test", system="DUCKDB", continue_loop=False, exploit_index=False,
+                    order_query=False, output_dir=tmp, costs={"q1": 1, "q2": 1})
+
+                selector.select_configuration()
+
+                reports = read_reports(tmp)
+
+                # A configuration completes in the first round, which ends the run: every configuration is evaluated
+                # once
+                self.assertEqual(sorted(report["config_id"] for report in reports),
+                                 ["config_1", "config_2", "config_3", "config_4"])
+                self.assertGreaterEqual(len(selector.completed_configs), 1)
+                self.assertEqual(sorted(config[0] for config in selector.completed_configs),
+                                 sorted(report["config_id"] for report in reports if report["completed"]))
+
+                # Every report has the worker whose instance evaluated the configuration
+                self.assertEqual({report["worker_id"] for report in reports}, {0, 1})
+
+                for report in reports:
+                    self.assertIn((report["worker_id"], sorted(report["lambda_tune_config"])), applied)
+            finally:
+                for driver in drivers:
+                    driver.close()
@@ -0,0 +1,99 @@
+import unittest
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from lambdatune.dbgpt.agents.debugger import DebuggingAgent, SETTING_PATTERN
+from lambdatune.llm.providers import StubProvider
+
+
+class FakePostgresCursor:
+    """
+    A cursor with the pg_settings contexts of Postgres, which rejects the parameters that cannot be changed in a
+    session, as Postgres does
+    """
+    CONTEXTS = {"shared_buffers": "postmaster", "effective_cache_size": "user", "work_mem": "user",
+                "maintenance_work_mem": "user", "max_parallel_workers_per_gather": "user",
+                "random_page_cost": "user", "effective_io_concurrency": "user"}
+
+    def __init__(self, invalid: set = frozenset()):
+        self.invalid = invalid
+        self.settings = dict()
+        self.executed = list()
+        self.rows = list()
+
+    def execute(self, sql, params=None):
+        self.executed.append(sql)
+
+        if sql.startswith("SELECT context FROM pg_settings"):
+            context = self.CONTEXTS.get(params[0])
+            self.rows = [(context,)] if context else []
+        elif sql == "RESET ALL;":
+            self.settings = dict()
+        elif sql.startswith("EXPLAIN ANALYZE"):
+            self.rows = [("Seq Scan on t",), (f"Execution Time: {100 - len(self.settings)}.5 ms",)]
+        else:
+            name = SETTING_PATTERN.match(sql).group(1)
+
+            if self.CONTEXTS.get(name) != "user":
+                raise Exception(f'parameter "{name}" cannot be changed without restarting the server')
+
+            if name in self.invalid:
+                raise Exception(f'invalid value for parameter "{name}"')
+
+            self.settings[name] = sql
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return self.rows
+
+
+class DebuggerTests(unittest.TestCase):
+    def test_debug_with_provider(self):
+        cursor = FakePostgresCursor(invalid={"effective_io_concurrency"})
+        agent = DebuggingAgent(query="SELECT * FROM t", cursor=cursor, fast_plan="fast", slow_plan="slow",
+                               provider=StubProvider(), max_steps=3)
+
+        messages = agent.debug()
+
+        self.assertIsInstance(messages[0], HumanMessage)
+        self.assertIsInstance(messages[1], AIMessage)
+        self.assertIsInstance(messages[2], ToolMessage)
+        self.assertEqual(messages[2].tool_call_id, messages[1].tool_calls[0]["id"])
+
+        # The postmaster parameter is never set, and the failures are reported back with the plan
+        self.assertFalse(any("shared_buffers" in sql for sql in cursor.executed if sql.startswith("SET")))
+        self.assertIn('Skipped "SET shared_buffers', messages[2].content)
+        self.assertIn("cannot be changed in a session (context: postmaster)", messages[2].content)
+        self.assertIn('Failed "SET effective_io_concurrency = 200;": invalid value', messages[2].content)
+        self.assertIn("Execution Time:", messages[2].content)
+
+        self.assertIn("work_mem", cursor.settings)
+        self.assertTrue(messages[-1].content.startswith("The best settings found"))
+
+    def test_debug_resets_settings_between_steps(self):
+        class FakeProvider:
+            RESPONSES = ["SET work_mem = '64MB';\nSET random_page_cost = 1.1;", "SET effective_cache_size = '4GB';"]
+
+            def complete(self, prompt, temperature=0.2, sample_index=0, system_instruction=None):
+                return self.RESPONSES[min(sample_index, len(self.RESPONSES) - 1)]
+
+        cursor = FakePostgresCursor()
+        agent = DebuggingAgent(query="SELECT * FROM t", cursor=cursor, fast_plan="fast", slow_plan="slow",
+                               provider=FakeProvider(), max_steps=3)
+
+        messages = agent.debug()
+
+        # Every step starts from the default settings
+        statements = [sql for sql in cursor.executed if not sql.startswith("SELECT context")]
+        self.assertEqual(statements, ["RESET ALL;", "SET work_mem = '64MB';", "SET random_page_cost = 1.1;",
+                                      "EXPLAIN ANALYZE SELECT * FROM t",
+                                      "RESET ALL;", "SET effective_cache_size = '4GB';",
+                                      "EXPLAIN ANALYZE SELECT * FROM t"])
+        self.assertEqual(list(cursor.settings.keys()), ["effective_cache_size"])
+
+        # The execution times are measured with the settings of their step only
+        self.assertIn("Execution Time: 98.5 ms", messages[2].content)
+        self.assertIn("Execution Time: 99.5 ms", messages[4].content)
+        self.assertTrue(messages[-1].content.startswith("The best settings found (98.5 ms)"))
@@ -0,0 +1,613 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from lambdatune.drivers.connection_pool import ConnectionPool
+from lambdatune.drivers.duckdb_driver import DuckDBDriver
+from lambdatune.drivers.duckdb_instances import DuckDBInstancePool
+from lambdatune.drivers.mysqldriver import MySQLDriver
+from lambdatune.drivers.plan_cache import PlanCache
+from lambdatune.drivers.postgres import PostgresDriver
+from lambdatune.drivers.query_watchdog import QueryWatchdog
+
+
+class FakePoolConnection:
+    """
+    A connection of a ConnectionPool. A broken connection is still open, but fails the health check.
+    """
+    def __init__(self, connection_id: int):
+        self.connection_id = connection_id
+        self.autocommit = False
+        self.closed = False
+        self.broken = False
+
+    def cursor(self):
+        return FakePoolCursor(self)
+
+    def close(self):
+        self.closed = True
+
+
+class FakePoolCursor:
+    def __init__(self, connection: FakePoolConnection):
+        self.connection = connection
+
+    def execute(self, sql):
+        if self.connection.broken:
+            raise Exception("server closed the connection unexpectedly")
+
+    def fetchall(self):
+        return [(1,)]
+
+    def close(self):
+        pass
+
+
+class FakeServer:
+    """
+    Opens FakePoolConnections, and refuses the connections while it is down
+    """
+    def __init__(self):
+        self.connections = list()
+        self.refused = 0
+
+    def connect(self):
+        if self.refused > 0:
+            self.refused -= 1
+            raise Exception("could not connect to server: Connection refused")
+
+        self.connections.append(FakePoolConnection(len(self.connections)))
+
+        return self.connections[-1]
+
+
+class FakePostgresCursor:
+    """
+    A Postgres cursor with a stubbed pg_settings (the context of every parameter) and configuration reloads
+    """
+    CONTEXTS = {"work_mem": "user", "random_page_cost": "user", "shared_buffers": "postmaster",
+                "checkpoint_timeout": "sighup", "log_connections": "superuser-backend", "server_version": "internal"}
+
+    def __init__(self):
+        self.executed = list()
+        self.rows = list()
+        self.load_time = 0
+
+    def execute(self, sql, params=None):
+        self.executed.append(sql)
+
+        if sql.startswith("SELECT name, context FROM pg_settings"):
+            self.rows = [(name, self.CONTEXTS[name]) for name in params[0] if name in self.CONTEXTS]
+        elif sql == "SELECT pg_conf_load_time()":
+            self.rows = [(self.load_time,)]
+        elif sql == "SELECT pg_reload_conf()":
+            self.load_time += 1
+            self.rows = [(True,)]
+        else:
+            self.rows = list()
+
+    def fetchall(self):
+        return self.rows
+
+
+class FakeExplainCursor:
+    """
+    A Postgres cursor that runs the batch EXPLAIN function: it returns the rows of the queries in reverse order, fails
+    to explain the queries with "bad" in them, and fails the whole batch if a query has "FAIL" in it
+    """
+    def __init__(self, batches: list):
+        self.batches = batches
+        self.rows = list()
+
+    def execute(self, sql, params=None):
+        if "md5(" in sql:
+            self.rows = [("fingerprint",)]
+        elif "lambdatune_explain_many" in sql:
+            queries, as_json = params
+            self.batches.append(queries)
+
+            if any("FAIL" in query for query in queries):
+                raise Exception("syntax error at or near \"FAIL\"")
+
+            self.rows = [(idx + 1, None, "syntax error") if "bad" in query else
+                         (idx + 1, [{"Plan": {"Query": query}}] if as_json else f"Plan of {query}", None)
+                         for idx, query in reversed(list(enumerate(queries)))]
+
+    def fetchone(self):
+        return self.rows[0]
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def close(self):
+        pass
+
+
+class FakePostgresConnection:
+    def __init__(self):
+        self.autocommit = False
+
+    def rollback(self):
+        pass
+
+
+def get_fake_postgres_driver(applied_config: dict):
+    driver = PostgresDriver.__new__(PostgresDriver)
+    driver.conn = FakePostgresConnection()
+    driver.cursor = FakePostgresCursor()
+    driver.applied_config = applied_config
+    driver.state_fingerprint = None
+    driver.state_generation = 0
+    driver.actions = list()
+    driver.restart = lambda: driver.actions.append("restart")
+    driver.reconnect = lambda: driver.actions.append("reconnect")
+
+    return driver
+
+
+class DriverTests(unittest.TestCase):
+    def test_query_watchdog_cancels_after_deadline(self):
+        cancelled = threading.Event()
+        watchdog = QueryWatchdog(cancelled.set)
+
+        watchdog.arm(time.time() + 0.05)
+
+        self.assertTrue(cancelled.wait(1))
+        self.assertTrue(watchdog.disarm())
+        self.assertEqual(watchdog.get_cancellations(), 1)
+
+        watchdog.shutdown()
+
+    def test_query_watchdog_disarm_before_deadline(self):
+        cancelled = threading.Event()
+        watchdog = QueryWatchdog(cancelled.set)
+
+        watchdog.arm(time.time() + 0.2)
+
+        self.assertFalse(watchdog.disarm())
+        self.assertFalse(cancelled.wait(0.3))
+
+        # Tightening a disarmed watchdog has no effect
+        watchdog.tighten(time.time())
+        self.assertFalse(cancelled.wait(0.1))
+
+        watchdog.shutdown()
+
+    def test_query_watchdog_tighten(self):
+        cancelled = threading.Event()
+        watchdog = QueryWatchdog(cancelled.set)
+
+        watchdog.arm(time.time() + 60)
+        watchdog.tighten(time.time() + 0.05)
+
+        self.assertTrue(cancelled.wait(1))
+
+        watchdog.shutdown()
+
+    def test_plan_cache_keys(self):
+        key = PlanCache.get_key("SELECT *\n  FROM t WHERE a = 'X';", "json", "db:abc")
+
+        self.assertEqual(key, PlanCache.get_key("SELECT * FROM t WHERE a = 'X'", "json", "db:abc"))
+        self.assertNotEqual(key, PlanCache.get_key("SELECT * FROM t WHERE a = 'x'", "json", "db:abc"))
+        self.assertNotEqual(key, PlanCache.get_key("SELECT * FROM t WHERE a = 'X'", "text", "db:abc"))
+        self.assertNotEqual(key, PlanCache.get_key("SELECT * FROM t WHERE a = 'X'", "json", "db:abd"))
+
+    def test_plan_cache_persistence_and_eviction(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "plans.db")
+
+            cache = PlanCache(path, max_entries=2)
+            cache.put("k1", {"Plan": {"Node Type": "Seq Scan"}})
+            cache.put("k2", "Seq Scan on t")
+
+            self.assertEqual(cache.get("k1"), {"Plan": {"Node Type": "Seq Scan"}})
+
+            # k2 is the least recently used plan
+            cache.put("k3", "Index Scan on t")
+            self.assertIsNone(cache.get("k2"))
+            self.assertEqual(cache.get_metrics(), {"hits": 1, "misses": 1, "evictions": 1})
+            cache.close()
+
+            cache = PlanCache(path, max_entries=2)
+            self.assertEqual(cache.get("k3"), "Index Scan on t")
+            cache.close()
+
+    def test_duckdb_driver(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "test.duckdb")
+
+            driver = DuckDBDriver({"db": path, "settings": {"threads": 2}})
+            driver.get_cursor().execute("CREATE TABLE t AS SELECT range AS a, range % 100 AS b FROM range(1000000)")
+
+            self.assertEqual(dict(driver.get_db_schema()), {"t": ["a", "b"]})
+            self.assertEqual(driver.get_table_cardinalities(), {"t": 1000000})
+
+            # Settings are applied without a restart, and reset to the initial settings
+            reconfiguration = driver.set_configuration(["SET threads TO 1", "PRAGMA memory_limit='1GB'",
+                                                        "ALTER SYSTEM SET unknown_setting = 1"])
+            self.assertEqual(reconfiguration, {"action": "set", "changed_parameters": ["memory_limit", "threads"]})
+            self.assertEqual(driver.get_current_global_config()["threads"], "1")
+
+            driver.reset_configuration()
+            self.assertEqual(driver.get_current_global_config()["threads"], "2")
+
+            driver.get_cursor().execute("CREATE INDEX t_a ON t (a);")
+            self.assertEqual(driver.get_all_indexes(), ["t_a"])
+            driver.drop_all_non_pk_indexes()
+            self.assertEqual(driver.get_all_indexes(), [])
+
+            out = driver.explain("SELECT count(*) FROM t WHERE a < 10", explain_json=True)
+            self.assertIsInstance(out["plan"], list)
+            self.assertIsInstance(out["execTime"], float)
+
+            # The cost of a plan is the sum of the estimated cardinalities of its operators
+            cost = DuckDBDriver.get_plan_cost(out["plan"])
+            join = driver.explain("SELECT * FROM t x, t y WHERE x.b = y.b", execute=False, explain_json=True)
+            self.assertGreater(cost, 0)
+            self.assertGreater(DuckDBDriver.get_plan_cost(join["plan"]), cost)
+            self.assertEqual(DuckDBDriver.get_plan_cost([{"name": "PROJECTION", "extra_info": {}, "children": [
+                {"name": "SEQ_SCAN", "extra_info": {"Estimated Cardinality": "20"}, "children": []},
+                {"name": "SEQ_SCAN", "extra_info": {"Estimated Cardinality": "5"}, "children": []}]}]), 25)
+
+            # The query is interrupted once the timeout passes
+            out = driver.explain("SELECT count(*) FROM t x, t y WHERE x.b + y.b = 7", timeout=200)
+            self.assertEqual(out["execTime"], "TIMEOUT")
+
+            out = driver.explain("SELECT count(*) FROM t", execute=True, deadline=time.time() + 60)
+            self.assertIsInstance(out["execTime"], float)
+
+            driver.close()
+
+            # The instances attach the file read-only, each with its own settings
+            pool = DuckDBInstancePool({"db": path}, num_instances=2)
+            pool.start()
+            drivers = pool.get_drivers()
+
+            drivers[0].set_configuration(["SET threads = 1"])
+            drivers[1].set_configuration(["SET threads = 3"])
+
+            self.assertEqual([d.get_current_global_config()["threads"] for d in drivers], ["1", "3"])
+            self.assertEqual([d.explain("SELECT count(*) FROM t")["execTime"] is not None for d in drivers],
+                             [True, True])
+
+            for d in drivers:
+                d.close()
+
+            pool.stop()
+
+    def test_mysql_config_commands(self):
+        self.assertEqual(MySQLDriver.parse_config_command("SET GLOBAL innodb_buffer_pool_size = 4G;"),
+                         ("innodb_buffer_pool_size", "4G", "GLOBAL"))
+        self.assertEqual(MySQLDriver.parse_config_command("SET PERSIST_ONLY innodb_log_file_size='512M'"),
+                         ("innodb_log_file_size", "512M", "PERSIST_ONLY"))
+        self.assertEqual(MySQLDriver.parse_config_command("set @@global.max_connections := 500"),
+                         ("max_connections", "500", "GLOBAL"))
+        self.assertEqual(MySQLDriver.parse_config_command("SET @@persist.max_connections = 500"),
+                         ("max_connections", "500", "PERSIST"))
+        # The scope is only taken from the keyword, not from the name or the value of the variable
+        self.assertEqual(MySQLDriver.parse_config_command("SET persisted_globals_load = OFF"),
+                         ("persisted_globals_load", "OFF", None))
+        self.assertEqual(MySQLDriver.parse_config_command("SET GLOBAL innodb_flush_method = 'PERSIST'"),
+                         ("innodb_flush_method", "PERSIST", "GLOBAL"))
+        self.assertIsNone(MySQLDriver.parse_config_command("CREATE INDEX idx ON t (a);"))
+
+        self.assertEqual(MySQLDriver.normalize_value("4G"), str(4 * 1024 ** 3))
+        self.assertEqual(MySQLDriver.normalize_value("'512MB'"), str(512 * 1024 ** 2))
+        self.assertEqual(MySQLDriver.normalize_value("O_DIRECT"), "O_DIRECT")
+
+        # The values reported by the server are compared after normalization
+        self.assertEqual(MySQLDriver.normalize_value("ON", compare=True), MySQLDriver.normalize_value("1", compare=True))
+        self.assertEqual(MySQLDriver.normalize_value("1G", compare=True),
+                         MySQLDriver.normalize_value("1073741824", compare=True))
+        self.assertEqual(MySQLDriver.normalize_value("0.9", compare=True),
+                         MySQLDriver.normalize_value("0.900000", compare=True))
+
+    def test_mysql_error_classification(self):
+        import mysql.connector
+
+        # max_execution_time exceeded, and KILL QUERY
+        self.assertEqual(MySQLDriver.classify_error(mysql.connector.Error(errno=3024)), "TIMEOUT")
+        self.assertEqual(MySQLDriver.classify_error(mysql.connector.Error(errno=1317)), "TIMEOUT")
+
+        # Syntax errors, lost connections, etc. are failures, not timeouts
+        self.assertEqual(MySQLDriver.classify_error(mysql.connector.Error(errno=1064)), "ERROR")
+        self.assertEqual(MySQLDriver.classify_error(RuntimeError("boom")), "ERROR")
+
+    def test_mysql_explain_timeouts(self):
+        class FakeCursor:
+            def __init__(self, executed):
+                self.executed = executed
+
+            def execute(self, sql):
+                self.executed.append(sql)
+
+            def fetchall(self):
+                return [("-> Table scan on t",)]
+
+            def close(self):
+                pass
+
+        class FakeConnection:
+            def __init__(self):
+                self.executed = list()
+
+            def cursor(self, buffered=False):
+                return FakeCursor(self.executed)
+
+        driver = MySQLDriver.__new__(MySQLDriver)
+        driver.conn = FakeConnection()
+        driver.cursor = None
+        driver.watchdog = None
+
+        # The selector passes an infinite timeout when the queries must not be cut off
+        out = driver.explain("SELECT * FROM t", timeout=float("inf") * 1000)
+        self.assertIsInstance(out["execTime"], float)
+        self.assertFalse(any("max_execution_time" in sql for sql in driver.conn.executed))
+        self.assertIsNone(driver.watchdog)
+
+        driver.conn.executed.clear()
+
+        try:
+            out = driver.explain("SELECT * FROM t", timeout=5000.7)
+            self.assertIsInstance(out["execTime"], float)
+            self.assertEqual(driver.conn.executed, ["EXPLAIN SELECT * FROM t", "SET SESSION max_execution_time = 5000",
+                                                    "SELECT * FROM t", "SET SESSION max_execution_time = DEFAULT"])
+        finally:
+            if driver.watchdog:
+                driver.watchdog.shutdown()
+
+    def test_postgres_config_commands(self):
+        cases = [
+            ("ALTER SYSTEM SET work_mem = '64MB';", ("work_mem", "64MB")),
+            ("ALTER SYSTEM SET Random_Page_Cost TO 1.1", ("random_page_cost", "1.1")),
+            ("SET pg_stat_statements.track = 'all';", ("pg_stat_statements.track", "all")),
+            ("CREATE INDEX idx ON t (a);", None),
+            ("ALTER SYSTEM RESET ALL;", None),
+        ]
+
+        for command, parsed in cases:
+            self.assertEqual(PostgresDriver.parse_config_command(command), parsed, command)
+
+    def test_postgres_reconfiguration_action(self):
+        applied = {"work_mem": "64MB", "shared_buffers": "1GB"}
+
+        cases = [
+            # (target, requires_restart, action, changed parameters)
+            (dict(applied), False, "none", []),
+            ({"work_mem": "'64mb'", "shared_buffers": "1GB"}, False, "none", []),
+            ({"work_mem": "128MB", "shared_buffers": "1GB"}, False, "session", ["work_mem"]),
+            ({"work_mem": "128MB", "shared_buffers": "1GB", "random_page_cost": "1.1"}, False, "session",
+             ["random_page_cost", "work_mem"]),
+            ({**applied, "checkpoint_timeout": "15min"}, False, "reload", ["checkpoint_timeout"]),
+            ({**applied, "log_connections": "on"}, False, "reload", ["log_connections"]),
+            # A session parameter that is removed from the target goes back to its default on reload
+            ({"shared_buffers": "1GB"}, False, "reload", ["work_mem"]),
+            ({"work_mem": "128MB", "shared_buffers": "2GB"}, False, "restart", ["shared_buffers", "work_mem"]),
+            # Read-only and unknown parameters cannot be changed
+            ({**applied, "server_version": "17", "unknown.parameter": "1"}, False, "session",
+             ["server_version", "unknown.parameter"]),
+            (dict(applied), True, "restart", ["shared_buffers", "work_mem"]),
+        ]
+
+        for target, requires_restart, action, changed in cases:
+            driver = get_fake_postgres_driver(dict(applied))
+            self.assertEqual(driver.get_reconfiguration_action(target, requires_restart)[:2], (action, changed),
+                             target)
+
+        # Without the applied configuration, any change restarts the system
+        driver = get_fake_postgres_driver(None)
+        self.assertEqual(driver.get_reconfiguration_action({"work_mem": "1MB"})[:2], ("restart", ["work_mem"]))
+
+    def test_postgres_apply_configuration(self):
+        # An unknown parameter that was removed from the target is not set in the session
+        driver = get_fake_postgres_driver({"work_mem": "64MB", "unknown.parameter": "1"})
+        target = {"work_mem": "128MB"}
+
+        self.assertEqual(driver.apply_configuration(target),
+                         {"action": "session", "changed_parameters": ["unknown.parameter", "work_mem"]})
+        self.assertEqual([sql for sql in driver.cursor.executed if sql.startswith("SET")], ["SET work_mem = %s"])
+
+        # The reload is waited for, so that other sessions do not start with stale values
+        self.assertEqual(driver.cursor.executed[-3:], ["SELECT pg_conf_load_time()", "SELECT pg_reload_conf()",
+                                                       "SELECT pg_conf_load_time()"])
+        self.assertEqual(driver.applied_config, target)
+        self.assertEqual(driver.actions, [])
+
+        # Backend parameters are only picked up by new sessions
+        driver = get_fake_postgres_driver({"work_mem": "64MB"})
+        self.assertEqual(driver.apply_configuration({"work_mem": "64MB", "log_connections": "on"})["action"],
+                         "reload")
+        self.assertIn("RESET ALL;", driver.cursor.executed)
+        self.assertEqual(driver.actions, ["reconnect"])
+
+        driver = get_fake_postgres_driver({"work_mem": "64MB"})
+        self.assertEqual(driver.apply_configuration({"work_mem": "64MB", "shared_buffers": "2GB"})["action"],
+                         "restart")
+        self.assertEqual(driver.actions, ["restart", "reconnect"])
+
+        driver = get_fake_postgres_driver({"work_mem": "64MB"})
+        self.assertEqual(driver.apply_configuration({"work_mem": "64MB"})["action"], "none")
+        self.assertEqual(driver.cursor.executed, [])
+
+    def test_postgres_reset_to_empty_configuration(self):
+        # An empty configuration after a reset removes the parameters of the previous one
+        for previous, action in [({"checkpoint_timeout": "10min"}, "reload"),
+                                 ({"work_mem": "64MB", "shared_buffers": "2GB"}, "restart")]:
+            driver = get_fake_postgres_driver(dict())
+            driver.set_configuration([f"ALTER SYSTEM SET {name} = '{value}';" for name, value in previous.items()])
+            self.assertEqual(driver.applied_config, previous)
+
+            driver.set_configuration([], restart=True, reset=True)
+
+            self.assertEqual(driver.last_reconfiguration["action"], action)
+            self.assertEqual(driver.last_reconfiguration["changed_parameters"], sorted(previous))
+            self.assertEqual(driver.applied_config, dict())
+            self.assertEqual(driver.cursor.executed.count("ALTER SYSTEM RESET ALL;"), 1)
+
+    def test_postgres_state_fingerprint(self):
+        class FakeCursor:
+            def __init__(self, executed):
+                self.executed = executed
+                self.rows = list()
+
+            def execute(self, sql, params=None):
+                self.executed.append(sql)
+                self.rows = [("fingerprint",)] if "md5(" in sql else [(f"Plan of {sql}",)]
+
+            def fetchone(self):
+                return self.rows[0]
+
+            def fetchall(self):
+                return self.rows
+
+            def close(self):
+                pass
+
+        class FakeConnection:
+            def __init__(self):
+                self.executed = list()
+
+            def cursor(self):
+                return FakeCursor(self.executed)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            driver = get_fake_postgres_driver(dict())
+            driver.config = {"db": "test"}
+            driver.conn = FakeConnection()
+            driver.plan_cache = PlanCache(os.path.join(tmp, "plans.db"))
+
+            def get_catalog_queries():
+                return len([sql for sql in driver.conn.executed if "md5(" in sql])
+
+            driver.explain("SELECT 1", execute=False)
+            driver.explain("SELECT 2", execute=False)
+
+            # The fingerprint is computed once for an unchanged state
+            self.assertEqual(get_catalog_queries(), 1)
+            self.assertEqual(driver.explain("SELECT 1", execute=False)["plan"], "Plan of EXPLAIN  SELECT 1")
+            self.assertEqual(get_catalog_queries(), 1)
+
+            # A change of the indexes or the configuration invalidates it
+            driver.cursor = FakeCursor(driver.conn.executed)
+            driver.get_all_indexes = lambda: ["idx_t_a"]
+            driver.drop_all_non_pk_indexes()
+            driver.explain("SELECT 1", execute=False)
+            self.assertEqual(get_catalog_queries(), 2)
+
+            driver.explain("SELECT 1", execute=False, config=["SET work_mem = '64MB'"])
+            self.assertEqual(get_catalog_queries(), 3)
+
+            driver.invalidate_state_fingerprint()
+            driver.explain("SELECT 1", execute=False)
+            self.assertEqual(get_catalog_queries(), 4)
+
+            driver.plan_cache.close()
+
+    def test_postgres_explain_many(self):
+        class FakeConnection:
+            def __init__(self):
+                self.batches = list()
+
+            def cursor(self):
+                return FakeExplainCursor(self.batches)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            driver = PostgresDriver.__new__(PostgresDriver)
+            driver.config = {"db": "test"}
+            driver.conn = FakeConnection()
+            driver.plan_cache = PlanCache(os.path.join(tmp, "plans.db"))
+            driver.state_fingerprint = None
+            driver.state_generation = 0
+            driver.explain = lambda query, execute, explain_json, config: {"execTime": None, "config": config,
+                                                                           "plan": f"Fallback plan of {query}"}
+
+            queries = ["SELECT 0", "SELECT bad", "SELECT 2", "SELECT FAIL", "SELECT 4"]
+            cached_key = PlanCache.get_key("SELECT 2", "json", "test:fingerprint")
+            driver.plan_cache.put(cached_key, {"Plan": {"Query": "cached"}})
+
+            outs = driver.explain_many(queries, explain_json=True, batch_size=2)
+
+            # The cached plan is not requested, and the misses are explained in batches
+            self.assertEqual(driver.conn.batches, [["SELECT 0", "SELECT bad"], ["SELECT FAIL", "SELECT 4"]])
+            self.assertEqual([out["plan"] for out in outs],
+                             [{"Plan": {"Query": "SELECT 0"}}, None, {"Plan": {"Query": "cached"}},
+                              "Fallback plan of SELECT FAIL", "Fallback plan of SELECT 4"])
+
+            # A query that cannot be explained has an error, and does not fail the batch
+            self.assertEqual(outs[1]["error"], "syntax error")
+            self.assertNotIn("error", outs[0])
+
+            # The new plans are cached
+            self.assertEqual(driver.plan_cache.get(PlanCache.get_key("SELECT 0", "json", "test:fingerprint")),
+                             {"Plan": {"Query": "SELECT 0"}})
+            self.assertIsNone(driver.plan_cache.get(PlanCache.get_key("SELECT bad", "json", "test:fingerprint")))
+
+            # Without a plan cache, every query is explained, in text format
+            driver.plan_cache.close()
+            driver.plan_cache = None
+            driver.conn.batches.clear()
+
+            outs = driver.explain_many(["SELECT 0", "SELECT 1"])
+            self.assertEqual(driver.conn.batches, [["SELECT 0", "SELECT 1"]])
+            self.assertEqual([out["plan"] for out in outs], ["Plan of SELECT 0", "Plan of SELECT 1"])
+
+    def test_connection_pool(self):
+        server = FakeServer()
+        pool = ConnectionPool(server.connect, size=2)
+
+        pool.warm_up()
+        self.assertEqual(len(server.connections), 2)
+        self.assertTrue(all(conn.autocommit for conn in server.connections))
+
+        # Warm connections are handed out before new ones are opened
+        first, second = pool.get_connection(), pool.get_connection()
+        self.assertEqual({first.connection_id, second.connection_id}, {0, 1})
+
+        third = pool.get_connection()
+        self.assertEqual(third.connection_id, 2)
+
+        # Returned connections are kept up to the size of the pool
+        pool.release(first)
+        pool.release(second)
+        pool.release(third)
+        self.assertFalse(first.closed or second.closed)
+        self.assertTrue(third.closed)
+
+        # A broken connection is closed and the next idle one is handed out
+        second.broken = True
+        conn = pool.get_connection()
+        self.assertTrue(second.closed)
+        self.assertIs(conn, first)
+        self.assertEqual(pool.get_metrics()["health_check_failures"], 1)
+
+        # Closed connections are not returned to the pool
+        conn.close()
+        pool.release(conn)
+
+        conn = pool.get_connection()
+        self.assertEqual(conn.connection_id, 3)
+        pool.release(conn)
+
+        # After a restart, the pool polls the server until it accepts connections again
+        server.refused = 3
+        conn = pool.reconnect(timeout=5, interval=0.01)
+
+        self.assertTrue(server.connections[3].closed)
+        self.assertEqual(conn.connection_id, 4)
+        # The pool is warmed up again
+        self.assertEqual(len(server.connections), 7)
+
+        metrics = pool.get_metrics()
+        self.assertEqual(metrics["connects"], 7)
+        self.assertEqual(metrics["reconnects"], 1)
+
+        # The server does not come back
+        server.refused = 1000
+
+        with self.assertRaises(Exception):
+            pool.reconnect(timeout=0.05, interval=0.01)
+
+        pool.close()
+        self.assertTrue(all(conn.closed for conn in server.connections[5:]))
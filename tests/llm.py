@@ -0,0 +1,108 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from lambdatune.llm.concurrent_generation import generate_configurations, is_quota_error
+from lambdatune.llm.providers import StubProvider, get_message_content
+from lambdatune.llm.response_cache import ResponseCache, ResponseCacheMiss
+
+
+class LLMTests(unittest.TestCase):
+    def test_is_quota_error(self):
+        self.assertTrue(is_quota_error({"prompt": "p", "response": "Error: 429 Resource has been exhausted"}))
+        self.assertFalse(is_quota_error({"prompt": "p", "response": "Error: GOOGLE_API_KEY not set."}))
+        self.assertFalse(is_quota_error({"prompt": "p", "response": {"choices": []}}))
+
+    def test_generate_configurations_concurrently_with_retries(self):
+        lock = threading.Lock()
+        attempts = dict()
+        in_flight = [0, 0]
+
+        def generate(i):
+            with lock:
+                attempts[i] = attempts.get(i, 0) + 1
+                attempt = attempts[i]
+                in_flight[0] += 1
+                in_flight[1] = max(in_flight[1], in_flight[0])
+
+            time.sleep(0.05)
+
+            with lock:
+                in_flight[0] -= 1
+
+            # The first attempt of config 0 hits the quota
+            if i == 0 and attempt == 1:
+                return {"prompt": "p", "response": "Error: 429 Quota exceeded"}
+
+            return {"prompt": "p", "response": {"choices": [{"message": {"content": str(i)}}]}}
+
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = generate_configurations(generate, 4, lambda i: os.path.join(tmp, f"config_{i}.json"),
+                                            concurrency=2, requests_per_minute=6000, base_delay=0.01)
+
+            self.assertEqual(sorted(paths), sorted(os.path.join(tmp, f"config_{i}.json") for i in range(4)))
+            self.assertEqual(attempts[0], 2)
+            self.assertLessEqual(in_flight[1], 2)
+
+            with open(os.path.join(tmp, "config_0.json")) as f:
+                self.assertEqual(json.load(f)["response"]["choices"][0]["message"]["content"], "0")
+
+    def test_response_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = ResponseCache(tmp, max_entries=2)
+
+            key_0 = cache.get_key("gemini-2.5-pro", 0.2, 0, "prompt")
+            key_1 = cache.get_key("gemini-2.5-pro", 0.2, 1, "prompt")
+            key_2 = cache.get_key("gemini-2.5-flash", 0.2, 0, "prompt")
+
+            self.assertEqual(len({key_0, key_1, key_2}), 3)
+            self.assertIsNone(cache.get(key_0))
+
+            cache.put(key_0, {"choices": [0]})
+            time.sleep(0.01)
+            cache.put(key_1, {"choices": [1]})
+            time.sleep(0.01)
+            self.assertEqual(cache.get(key_0), {"choices": [0]})
+            time.sleep(0.01)
+
+            # key_1 is the least recently used entry
+            cache.put(key_2, {"choices": [2]})
+            self.assertIsNone(cache.get(key_1))
+
+            stats = cache.get_stats()
+            self.assertEqual((stats["hits"], stats["misses"], stats["evictions"]), (1, 2, 1))
+
+            replay_cache = ResponseCache(tmp, replay_only=True)
+            self.assertEqual(replay_cache.get(key_2), {"choices": [2]})
+            self.assertRaises(ResponseCacheMiss, replay_cache.get, key_1)
+
+    def test_stub_provider(self):
+        prompt = "Recommend some configuration parameters for PostgreSQL to optimize the system's performance.\n\n" \
+                 "Join conditions found in the workload:\n" \
+                 "lineitem.l_orderkey: ['orders.o_orderkey']\n" \
+                 "orders.o_custkey: ['customer.c_custkey']\n\n" \
+                 "Filters found in the workload:\n" \
+                 "lineitem.l_shipdate <= '1998-09-02'\n" \
+                 "The workload runs on a system with the following specs:\n" \
+                 "memory: 16GiB\n" \
+                 "cores: 8"
+
+        provider = StubProvider()
+        response = provider.complete(prompt, temperature=0.2, sample_index=0)
+        commands = json.loads(get_message_content(response))["commands"]
+
+        self.assertIn("ALTER SYSTEM SET shared_buffers = '4096MB';", commands)
+        self.assertIn("ALTER SYSTEM SET max_parallel_workers_per_gather = 4;", commands)
+        self.assertIn("CREATE INDEX idx_lineitem_l_orderkey ON lineitem(l_orderkey);", commands)
+        self.assertIn("CREATE INDEX idx_customer_c_custkey ON customer(c_custkey);", commands)
+        self.assertIn("CREATE INDEX idx_lineitem_l_shipdate ON lineitem(l_shipdate);", commands)
+
+        # Deterministic
+        self.assertEqual(provider.complete(prompt, temperature=0.2, sample_index=0), response)
+
+        start = time.time()
+        StubProvider(latency=0.05).complete(prompt, temperature=0.2)
+        self.assertGreaterEqual(time.time() - start, 0.05)
@@ -0,0 +1,227 @@
+import unittest
+
+from lambdatune.plan_utils import PostgresPlanNode, JoinCollectorVisitor, extract_indices_from_plan, \
+    extract_scans_from_plan, extract_table_sets
+from lambdatune.plan_utils.plan_analysis import collect_plan_conditions, collect_plan_conditions_parallel, \
+    reduce_plan_conditions
+from lambdatune.plan_utils.predicates import parse_predicate, get_equi_joins, get_columns, Column, Cast, Literal, Other
+from lambdatune.prompt_generator.compress_query_plans import group_join_conditions, extract_conditions
+
+
+def get_plan():
+    return {
+        "Node Type": "Hash Join",
+        "Total Cost": 100.0,
+        "Plan Rows": 10,
+        "Hash Cond": "(o.o_custkey = c.c_custkey)",
+        "Plans": [
+            {
+                "Node Type": "Nested Loop",
+                "Total Cost": 60.0,
+                "Plan Rows": 20,
+                "Plans": [
+                    {"Node Type": "Seq Scan", "Total Cost": 10.0, "Plan Rows": 5, "Relation Name": "orders",
+                     "Alias": "o"},
+                    {"Node Type": "Index Scan", "Total Cost": 20.0, "Plan Rows": 1, "Relation Name": "lineitem",
+                     "Alias": "l", "Index Name": "idx_lineitem_l_orderkey",
+                     "Index Cond": "(l_orderkey = o.o_orderkey)"},
+                ]
+            },
+            {
+                "Node Type": "Hash",
+                "Total Cost": 30.0,
+                "Plan Rows": 3,
+                "Plans": [
+                    {"Node Type": "Seq Scan", "Total Cost": 30.0, "Plan Rows": 3, "Relation Name": "customer",
+                     "Alias": "c"},
+                ]
+            }
+        ]
+    }
+
+
+class PlanUtilsTests(unittest.TestCase):
+    def test_plan_tree(self):
+        root = PostgresPlanNode(get_plan())
+
+        nodes = root.get_nodes_as_list()
+
+        self.assertEqual([node.node_type for node in nodes],
+                         ["Hash Join", "Nested Loop", "Seq Scan", "Index Scan", "Hash", "Seq Scan"])
+        self.assertEqual([node.cost_estim for node in nodes], [100.0, 60.0, 10.0, 20.0, 30.0, 30.0])
+        self.assertIs(nodes[0], root)
+        self.assertEqual(root.tree.subtree_sizes, [6, 3, 1, 1, 2, 1])
+
+        self.assertEqual([child.node_type for child in root.children], ["Nested Loop", "Hash"])
+        self.assertIs(root.children[1].children[0].parent, root.children[1])
+        self.assertIsNone(root.parent)
+        self.assertTrue(root.is_join)
+        self.assertEqual(root.info["Hash Cond"], "(o.o_custkey = c.c_custkey)")
+
+        index_scan = "Index Scan(idx_lineitem_l_orderkey)"
+        self.assertEqual(root.get_set_representation(),
+                         {frozenset({"o", index_scan, "c"}), frozenset({"o", index_scan})})
+
+        self.assertEqual(root.tree.get_indexes(), ["idx_lineitem_l_orderkey"])
+        self.assertEqual(root.tree.get_scans(), ["orders", "lineitem", "customer"])
+        self.assertEqual(root.tree.get_table_sets(), extract_table_sets(get_plan()))
+
+    def test_extract_from_plan(self):
+        plan = get_plan()
+
+        self.assertEqual(extract_indices_from_plan(plan), ["idx_lineitem_l_orderkey"])
+        self.assertEqual(extract_scans_from_plan(plan), ["orders", "lineitem", "customer"])
+        self.assertEqual(extract_table_sets(plan), {
+            frozenset({"orders"}), frozenset({"lineitem"}), frozenset({"customer"}),
+            frozenset({"orders", "lineitem"}), frozenset({"orders", "lineitem", "customer"})
+        })
+
+        # Deep plans do not hit the recursion limit
+        plan = {"Node Type": "Seq Scan", "Total Cost": 1.0, "Relation Name": "t"}
+
+        for i in range(0, 5000):
+            plan = {"Node Type": "Nested Loop", "Total Cost": 1.0,
+                    "Plans": [plan, {"Node Type": "Index Scan", "Total Cost": 1.0, "Relation Name": "t",
+                                     "Index Name": f"idx_{i}"}]}
+
+        self.assertEqual(len(extract_indices_from_plan(plan)), 5000)
+        self.assertEqual(len(PostgresPlanNode(plan).get_nodes_as_list()), 10001)
+
+    def test_join_collector(self):
+        schema = {
+            "orders": ["o_orderkey", "o_custkey"],
+            "customer": ["c_custkey"],
+            "lineitem": ["l_orderkey"],
+        }
+
+        collector = JoinCollectorVisitor(db_schema=schema)
+        PostgresPlanNode(get_plan()).accept(collector, 100.0)
+        collector.resolve_aliases()
+
+        self.assertEqual(dict(collector.join_conditions), {"orders.o_custkey = customer.c_custkey": 1,
+                                                           "lineitem.l_orderkey = orders.o_orderkey": 1})
+        self.assertEqual(collector.join_cost_estimations["lineitem.l_orderkey = orders.o_orderkey"], 20.0)
+        self.assertEqual(collector.query_costs["orders.o_custkey = customer.c_custkey"], 100.0)
+
+    def test_parse_predicate(self):
+        expr = parse_predicate("((ss.ss_item_sk = i.i_item_sk) AND (ss.ss_sold_date_sk = d.d_date_sk))")
+
+        self.assertEqual(get_equi_joins(expr), [(Column("ss", "ss_item_sk"), Column("i", "i_item_sk")),
+                                                (Column("ss", "ss_sold_date_sk"), Column("d", "d_date_sk"))])
+
+        # Casts, quoted identifiers, ANY, and unparsable sub-plans
+        expr = parse_predicate("((t.id = (mc.movie_id)::integer) AND (\"T\".\"Name\" ~~ '%a''b%'::text) AND "
+                               "(k.keyword = ANY ('{x,y}'::character varying[])) AND (NOT (hashed SubPlan 1)))")
+
+        self.assertEqual(get_equi_joins(expr), [(Column("t", "id"), Column("mc", "movie_id"))])
+        self.assertEqual(get_columns(expr), [Column("t", "id"), Column("mc", "movie_id"), Column("T", "Name"),
+                                             Column("k", "keyword")])
+        self.assertEqual(expr.args[1].right, Cast(Literal("'%a''b%'"), "text"))
+        self.assertEqual(expr.args[2].right.name, "ANY")
+
+        expr = parse_predicate("((d_year = 2000) OR (d_moy IS NOT NULL))")
+        self.assertEqual(expr.op, "OR")
+        self.assertEqual(get_equi_joins(expr), [])
+
+        self.assertIsInstance(parse_predicate("(a = )"), Other)
+
+    def test_join_collector_predicates(self):
+        plans = [{
+            "Node Type": "Hash Join", "Total Cost": 50.0,
+            "Hash Cond": "((ss.ss_item_sk = i.i_item_sk) AND (ss.ss_store_sk = i.i_store_sk))",
+            "Plans": [
+                {"Node Type": "Seq Scan", "Total Cost": 10.0, "Relation Name": "store_sales", "Alias": "ss",
+                 "Filter": "((ss_quantity > 10) OR (ss.ss_list_price < 5.0))"},
+                {"Node Type": "Hash", "Total Cost": 5.0, "Plans": [
+                    {"Node Type": "Seq Scan", "Total Cost": 5.0, "Relation Name": "item", "Alias": "i"}]},
+            ]
+        }, {
+            # The same alias refers to another relation in another query
+            "Node Type": "Nested Loop", "Total Cost": 40.0, "Join Filter": "(i.d_date_sk = ss.ss_sold_date_sk)",
+            "Plans": [
+                {"Node Type": "Seq Scan", "Total Cost": 10.0, "Relation Name": "store_sales", "Alias": "ss"},
+                {"Node Type": "Seq Scan", "Total Cost": 1.0, "Relation Name": "date_dim", "Alias": "i"},
+            ]
+        }]
+
+        collector = JoinCollectorVisitor(db_schema=dict())
+
+        for plan in plans:
+            PostgresPlanNode(plan).accept(collector, plan["Total Cost"])
+
+        self.assertEqual(dict(collector.join_conditions), {"store_sales.ss_item_sk = item.i_item_sk": 1,
+                                                           "store_sales.ss_store_sk = item.i_store_sk": 1,
+                                                           "date_dim.d_date_sk = store_sales.ss_sold_date_sk": 1})
+        self.assertEqual(collector.filter_operands, {"store_sales.ss_quantity", "store_sales.ss_list_price"})
+
+        interner = collector.interner
+        join_keys = collector.get_join_keys()
+
+        self.assertEqual([(interner.get_name(row[0][0]), interner.get_name(row[0][1]), row[1:]) for row in join_keys], [
+            ("store_sales.ss_item_sk", "item.i_item_sk", [1, 50.0, 50.0]),
+            ("store_sales.ss_store_sk", "item.i_store_sk", [1, 50.0, 50.0]),
+            ("date_dim.d_date_sk", "store_sales.ss_sold_date_sk", [1, 40.0, 40.0]),
+        ])
+        self.assertEqual(group_join_conditions(join_keys, interner), {
+            "store_sales.ss_item_sk": [["item.i_item_sk", 50.0, 50.0]],
+            "store_sales.ss_store_sk": [["item.i_store_sk", 50.0, 50.0]],
+            "date_dim.d_date_sk": [["store_sales.ss_sold_date_sk", 40.0, 40.0]],
+        })
+
+    def test_parallel_plan_analysis(self):
+        plans = list()
+
+        for i in range(0, 150):
+            plan = get_plan()
+            plan["Hash Cond"] = f"((o.o_custkey = c.c_custkey) AND (o.o_key_{i % 7} = c.c_key_{i % 7}))"
+            plan["Total Cost"] = float(i)
+            plans.append(plan)
+
+        plans.append({"Node Type": "Seq Scan"})
+
+        def get_collector(plan_conditions):
+            collector = JoinCollectorVisitor(db_schema=dict())
+            return reduce_plan_conditions(collector, plan_conditions, [plan.get("Total Cost") for plan in plans])
+
+        serial = get_collector(collect_plan_conditions(plans))
+        parallel = get_collector(collect_plan_conditions_parallel(plans, num_workers=2, chunk_size=16))
+
+        self.assertEqual(list(serial.join_conditions.items()), list(parallel.join_conditions.items()))
+        self.assertEqual(serial.join_cost_estimations, parallel.join_cost_estimations)
+        self.assertEqual(serial.query_costs, parallel.query_costs)
+        self.assertEqual(serial.get_join_keys(), parallel.get_join_keys())
+
+        self.assertEqual(serial.join_conditions["orders.o_custkey = customer.c_custkey"], 150)
+        self.assertEqual(serial.query_costs["orders.o_key_0 = customer.c_key_0"], 147.0)
+
+    def test_extract_conditions(self):
+        class FakeDriver:
+            def get_db_schema(self):
+                return {"orders": ["o_custkey", "o_orderkey"], "customer": ["c_custkey"]}
+
+            def explain_many(self, queries, explain_json=False):
+                return [{"plan": {"Plan": query}, "execTime": 1} if query else None for query in queries]
+
+        plans = list()
+
+        for i in range(0, 5):
+            plan = get_plan()
+            plan["Total Cost"] = float(i)
+            plans.append((f"q{i}", plan))
+
+        # Not explained, and no "Plan"
+        plans.append(("q5", None))
+        plans.append(("q6", {"Node Type": "Seq Scan"}))
+
+        conditions, filters, costs, postgres_plans = extract_conditions(FakeDriver(), plans)
+
+        self.assertEqual([p[0] for p in postgres_plans], ["q0", "q1", "q2", "q3", "q4"])
+        self.assertEqual(dict(costs), {f"q{i}": float(i) for i in range(0, 5)})
+
+        for build_plans in [True, False]:
+            parallel = extract_conditions(FakeDriver(), plans, num_workers=2, build_plans=build_plans)
+
+            self.assertEqual(parallel[0], conditions)
+            self.assertEqual(parallel[1], filters)
+            self.assertEqual(dict(parallel[2]), dict(costs))
+            self.assertEqual([p[0] for p in parallel[3]], ["q0", "q1", "q2", "q3", "q4"] if build_plans else [])
@@ -1,20 +1,28 @@
+import itertools
 import json
+import random
+import sys
+import types
 import unittest
 
 from lambdatune.prompt_generator.ilp_solver import ILPSolver
+from lambdatune.prompt_generator.knapsack import TreeKnapsackGroup, get_fractional_upper_bound, solve_exact, \
+    solve_greedy
 from lambdatune.prompt_generator.compress_query_plans import hide_table_column_names
+from lambdatune.prompt_generator.token_counter import PromptLengthTracker, TokenCounter, load_encoding, \
+    DEFAULT_ENCODING
 from lambdatune.llm_response import LLMResponse
 
 
 class PromptGeneratorTests(unittest.TestCase):
     def test_extract_dependencies(self):
         conditions = {
-            "a": [("b", 400), ("c", 600)],
-            "b": [("a", 1500), ("c", 150), ("d", 80)]
+            "a": [("b", 400, 0), ("c", 600, 0)],
+            "b": [("a", 1500, 0), ("c", 150, 0), ("d", 80, 0)]
         }
 
-        solver = ILPSolver()
-        dependencies, costs, values = solver.extract_dependencies(conditions)
+        solver = ILPSolver(False, solver="exact")
+        dependencies, costs, values, query_values = solver.extract_dependencies(conditions)
 
         key_to_id_expected = {
             "a": [0, 4],
@@ -31,60 +39,226 @@ class PromptGeneratorTests(unittest.TestCase):
         self.assertEqual(solver.key_to_idx, key_to_id_expected)
         self.assertEqual(dependencies, dependencies_expected)
         self.assertEqual(values, [0, 400, 600, 0, 1500, 150, 80])
+        self.assertEqual(query_values, [0, 0, 0, 0, 0, 0, 0])
         self.assertEqual(costs, [1, 1, 1, 1, 1, 1, 1])
 
+    def get_best_value(self, conditions: dict, token_budget: int):
+        """
+        Returns the best value of the conditions within the budget, by brute force. Every key costs one token (the
+        keys have one character), and a left key is paid once if any of its conditions is selected.
+        """
+        pairs = [(left_key, pair) for left_key in conditions for pair in conditions[left_key]]
+        best = 0
+
+        for mask in itertools.product([False, True], repeat=len(pairs)):
+            chosen = [pair for pair, m in zip(pairs, mask) if m]
+
+            if len(chosen) + len({left_key for left_key, _ in chosen}) <= token_budget:
+                best = max(best, sum(pair[1] for _, pair in chosen))
+
+        return best
+
     def test_optimize_with_dependencies_1(self):
         conditions = {
-            "a": [("b", 400), ("c", 600)],
-            "b": [("a", 1500), ("c", 150), ("d", 80)]
+            "a": [("b", 400, 0), ("c", 600, 0)],
+            "b": [("a", 1500, 0), ("c", 150, 0), ("d", 80, 0)]
         }
 
-        solver = ILPSolver()
+        solver = ILPSolver(False, solver="exact")
 
-        r = solver.optimize_with_dependencies(conditions, 300)
+        r, value = solver.optimize_with_dependencies(conditions, 5)
 
         expected_solution = {
-            "a": ["c"],
-            "b": ["a", "c", "d"]
+            "a": ["b", "c"],
+            "b": ["a"]
         }
 
         self.assertEqual(r, expected_solution)
+        self.assertEqual(value, self.get_best_value(conditions, 5))
 
     def test_optimize_with_dependencies_2(self):
         conditions = {
-            "a": [("b", 2000), ("c", 600)],
-            "b": [("a", 1500), ("c", 150), ("d", 80)]
+            "a": [("b", 2000, 0), ("c", 600, 0)],
+            "b": [("a", 1500, 0), ("c", 150, 0), ("d", 80, 0)]
         }
 
-        solver = ILPSolver()
+        solver = ILPSolver(False, solver="exact")
 
-        r = solver.optimize_with_dependencies(conditions, 300)
+        r, value = solver.optimize_with_dependencies(conditions, 4)
 
         expected_solution = {
-            "a": ["b", "c"],
-            "b": ["c", "d"]
+            "a": ["b"],
+            "b": ["a"]
         }
 
         self.assertEqual(r, expected_solution)
+        self.assertEqual(value, self.get_best_value(conditions, 4))
 
     def test_optimize_with_dependencies_3(self):
         conditions = {
-            "a": [("b", 2000), ("c", 600)],
-            "b": [("a", 1500), ("c", 1050), ("d", 80)],
-            "c": [("a", 5000), ("b", 500), ("z", 800)]
+            "a": [("b", 2000, 0), ("c", 600, 0)],
+            "b": [("a", 1500, 0), ("c", 1050, 0), ("d", 80, 0)],
+            "c": [("a", 5000, 0), ("b", 500, 0), ("z", 800, 0)]
         }
 
-        solver = ILPSolver()
+        solver = ILPSolver(False, solver="exact")
 
-        r = solver.optimize_with_dependencies(conditions, 300)
+        r, value = solver.optimize_with_dependencies(conditions, 5)
 
         expected_solution = {
             "a": ["b"],
-            "b": ["c", "d"],
             "c": ["a", "z"]
         }
 
         self.assertEqual(r, expected_solution)
+        self.assertEqual(value, self.get_best_value(conditions, 5))
+
+    def test_optimize_with_dependencies_gurobi(self):
+        try:
+            import gurobipy
+        except ImportError:
+            self.skipTest("gurobipy is not installed")
+
+        rng = random.Random(0)
+        keys = "abcdefgh"
+
+        for _ in range(0, 10):
+            conditions = dict()
+
+            for left_key in rng.sample(keys, rng.randint(1, 4)):
+                right_keys = rng.sample([key for key in keys if key != left_key], rng.randint(1, 3))
+                conditions[left_key] = [(key, rng.randint(0, 5000), rng.randint(0, 100)) for key in right_keys]
+
+            budget = rng.randint(1, 12)
+
+            for query_weight in (False, True):
+                exact = ILPSolver(query_weight, solver="exact")
+                gurobi = ILPSolver(query_weight, solver="gurobi")
+
+                exact.optimize_with_dependencies(conditions, budget)
+                gurobi.optimize_with_dependencies(conditions, budget)
+
+                self.assertAlmostEqual(exact.get_metrics()["objective"], gurobi.get_metrics()["objective"])
+
+    def test_tree_knapsack_exact(self):
+        rng = random.Random(0)
+
+        for _ in range(0, 20):
+            groups = list()
+            idx = 0
+
+            for _ in range(0, rng.randint(1, 3)):
+                left_idx = idx
+                children = [(left_idx + 1 + i, rng.randint(1, 6), rng.randint(0, 50)) for i in range(rng.randint(1, 3))]
+                groups.append(TreeKnapsackGroup(left_idx, rng.randint(1, 4), children))
+                idx += len(children) + 1
+
+            budget = rng.randint(1, 20)
+
+            # Brute force over the subsets of the right keys
+            children = [(group, child) for group in groups for child in group.children]
+            best = 0
+
+            for mask in itertools.product([False, True], repeat=len(children)):
+                chosen = [c for c, m in zip(children, mask) if m]
+                opened = {id(group) for group, _ in chosen}
+                weight = sum(child[1] for _, child in chosen) + \
+                    sum(group.left_weight for group in groups if id(group) in opened)
+
+                if weight <= budget:
+                    best = max(best, sum(child[2] for _, child in chosen))
+
+            selected, value = solve_exact(groups, budget)
+            self.assertEqual(value, best)
+
+            # The selection is feasible and has the reported value
+            weights = {group.left_idx: group.left_weight for group in groups}
+            weights.update({child[0]: child[1] for group in groups for child in group.children})
+            values = {child[0]: child[2] for group in groups for child in group.children}
+
+            self.assertLessEqual(sum(weights[i] for i in selected), budget)
+            self.assertEqual(sum(values.get(i, 0) for i in selected), best)
+
+            for group in groups:
+                has_children = any(child[0] in selected for child in group.children)
+                self.assertEqual(group.left_idx in selected, has_children)
+
+            greedy_selected, greedy_value = solve_greedy(groups, budget)
+            self.assertLessEqual(sum(weights[i] for i in greedy_selected), budget)
+            self.assertLessEqual(greedy_value, best)
+            self.assertGreaterEqual(get_fractional_upper_bound(groups, budget), best)
+
+    def test_optimize_with_dependencies_solvers(self):
+        conditions = {
+            "a": [("b", 2000, 10), ("c", 600, 0)],
+            "b": [("a", 1500, 0), ("c", 1050, 20), ("d", 80, 0)],
+            "c": [("a", 5000, 0), ("b", 500, 0), ("z", 800, 0)]
+        }
+
+        exact = ILPSolver(False, solver="exact")
+        r, value = exact.optimize_with_dependencies(conditions, 6)
+
+        self.assertEqual(r, {"a": ["b"], "b": ["a"], "c": ["a"]})
+        self.assertEqual(value, 8500)
+        self.assertEqual(exact.get_metrics()["solver"], "exact")
+
+        greedy = ILPSolver(False, solver="greedy")
+        _, greedy_value = greedy.optimize_with_dependencies(conditions, 6)
+        self.assertLessEqual(greedy_value, value)
+        self.assertLessEqual(greedy.get_metrics()["quality_bound"], 1.0)
+
+        # Everything fits
+        r, _ = ILPSolver(False).optimize_with_dependencies(conditions, 100)
+        self.assertEqual(r, {"a": ["b", "c"], "b": ["a", "c", "d"], "c": ["a", "b", "z"]})
+
+    def test_prompt_length_tracker(self):
+        counter = TokenCounter()
+        tracker = PromptLengthTracker(counter)
+
+        conditions = [("title.id", "movie_info.movie_id"), ("title.id", "cast_info.movie_id"),
+                      ("info_type.id", "movie_info.info_type_id")]
+
+        for left_key, right_key in conditions:
+            tracker.add(left_key, right_key)
+
+            # With the character counter, the tracked length is the length of the rendered conditions
+            prompt = "".join(f"{c}: {tracker.conditions[c]}\n" for c in tracker.conditions)
+            self.assertEqual(tracker.get_length(), len(prompt))
+
+        self.assertEqual(counter.count("title.id"), 8)
+        self.assertIn("title.id", counter.counts)
+
+    def test_load_encoding(self):
+        def encoding_for_model(model):
+            if model != "gpt-4":
+                raise KeyError(model)
+
+            return "encoding of gpt-4"
+
+        def get_encoding(name):
+            if name not in ("cl100k_base", "o200k_base"):
+                raise ValueError(f"Unknown encoding {name}")
+
+            return f"encoding {name}"
+
+        tiktoken = types.ModuleType("tiktoken")
+        tiktoken.encoding_for_model = encoding_for_model
+        tiktoken.get_encoding = get_encoding
+        previous = sys.modules.get("tiktoken")
+        sys.modules["tiktoken"] = tiktoken
+
+        try:
+            self.assertEqual(load_encoding("gpt-4"), "encoding of gpt-4")
+            self.assertEqual(load_encoding("o200k_base"), "encoding o200k_base")
+
+            # Models tiktoken does not know are counted with the default encoding, not in characters
+            self.assertEqual(load_encoding("gemini-2.5-pro"), f"encoding {DEFAULT_ENCODING}")
+            self.assertEqual(TokenCounter("gemini-2.5-pro").unit, "tokens")
+        finally:
+            if previous is None:
+                sys.modules.pop("tiktoken")
+            else:
+                sys.modules["tiktoken"] = previous
 
     def test_hide_table_columns(self):
         job = {